@@ -1,11 +1,106 @@
-from fastapi import APIRouter
+from typing import Any, Awaitable, Dict, Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from app.core.config import settings
+from app.services.data_store_service import ProcessingStatus
 
 router = APIRouter()
 
 @router.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+async def health_check(request: Request):
+    """Liveness, with readiness reported alongside it"""
+    lifecycle = getattr(request.app.state, "lifecycle", None)
+    if lifecycle is None:
+        return {"status": "healthy"}
+    live = lifecycle.live
+    return JSONResponse(
+        {"status": "healthy" if live else "unhealthy", **await lifecycle.readiness()},
+        status_code=200 if live else 503
+    )
+
+@router.get("/health/live")
+async def liveness(request: Request):
+    lifecycle = getattr(request.app.state, "lifecycle", None)
+    live = lifecycle is None or lifecycle.live
+    return JSONResponse({"live": live}, status_code=200 if live else 503)
+
+@router.get("/health/ready")
+async def readiness(request: Request):
+    lifecycle = getattr(request.app.state, "lifecycle", None)
+    if lifecycle is None:
+        return JSONResponse({"ready": False}, status_code=503)
+    readiness = await lifecycle.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+@router.get("/stats")
+async def stats(request: Request):
+    ai_service = getattr(request.app.state, "ai_service", None)
+    scraper = getattr(request.app.state, "scraper", None)
+    telegram_service = getattr(request.app.state, "telegram_service", None)
+    return {
+        "ai": ai_service.get_stats() if ai_service else None,
+        "scraper": scraper.get_stats() if scraper else None,
+        "admission": telegram_service.admission.get_stats() if telegram_service else None,
+    }
+
+async def _page(load: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return a page from the data store, mapping a bad cursor to a 400"""
+    try:
+        return await load
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+def _data_store(request: Request):
+    data_store = getattr(request.app.state, "data_store", None)
+    if data_store is None:
+        raise HTTPException(status_code=503, detail="Data store is not ready")
+    return data_store
+
+@router.get("/chats/{chat_id}/companies")
+async def chat_companies(
+    request: Request,
+    chat_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    return await _page(_data_store(request).list_chat_companies(chat_id, cursor, limit))
+
+@router.get("/links")
+async def links(
+    request: Request,
+    status: ProcessingStatus = ProcessingStatus.PENDING,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    return await _page(_data_store(request).list_links(status, cursor, limit))
+
+@router.get("/extractions/recent")
+async def recent_extractions(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    return await _page(_data_store(request).list_recent_extractions(cursor, limit))
+
+@router.post("/telegram/webhook")
+async def telegram_webhook(
+    request: Request,
+    secret: str = Header("", alias="X-Telegram-Bot-Api-Secret-Token")
+):
+    telegram_service = getattr(request.app.state, "telegram_service", None)
+    if telegram_service is None or not telegram_service.webhook_mode:
+        raise HTTPException(status_code=404, detail="Webhook mode is not enabled")
+    if not telegram_service.verify_webhook_secret(secret):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    # Telegram redelivers the update, to another replica if this one is shutting down
+    if not telegram_service.ready:
+        raise HTTPException(status_code=503, detail="Not accepting updates")
+    return {"queued": await telegram_service.process_webhook(await request.json())}
+
+@router.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @router.get("/")
 def read_root():
@@ -1,11 +1,13 @@
 from celery import Celery
+from kombu import Queue
 from app.core.config import settings
 
 # Initialize the Celery application
 celery_app = Celery(
     settings.PROJECT_NAME,
     broker=settings.REDIS_URL,
-    backend=settings.REDIS_URL
+    backend=settings.REDIS_URL,
+    include=["app.tasks.enrichment_tasks", "app.tasks.ai_tasks"]
 )
 
 # Load custom configurations if needed
@@ -15,7 +17,28 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     broker_connection_retry_on_startup=True,
-    enable_utc=True
+    enable_utc=True,
+
+    # Each slow stage gets its own queue so workers can be scaled per stage
+    task_default_queue="celery",
+    task_queues=(
+        Queue("celery"),
+        Queue("scrape"),
+        Queue("extract"),
+        Queue("analysis"),
+    ),
+    task_routes={
+        "app.tasks.enrichment_tasks.fetch_links": {"queue": "scrape"},
+        "app.tasks.enrichment_tasks.extract_pages": {"queue": "extract"},
+        "app.tasks.ai_tasks.analyze_company": {"queue": "analysis"},
+    },
+
+    # Ack after the task finishes so work on a lost worker is redelivered,
+    # and fetch one task at a time since tasks are long-running
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=settings.CELERY_PREFETCH_MULTIPLIER,
+    result_expires=3600,
 )
 
 # Optional: you can define periodic tasks here
@@ -26,6 +49,3 @@ celery_app.conf.update(
 #         "schedule": crontab(minute=0, hour=0),  # Runs every day at midnight
 #     },
 # }
-
-# Discover tasks from tasks.py (auto-discover if in a package)
-# celery_app.autodiscover_tasks(["app.tasks.ai_tasks"])
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Take a quota slot for a chat unless it already holds ARGV[1], refreshing the count's TTL
+HOLD_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if count > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return {0, count - 1}
+end
+return {1, count}
+"""
+
+# Free a quota slot, never taking the count below zero
+UNHOLD_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') > 0 then
+    return redis.call('DECR', KEYS[1])
+end
+return 0
+"""
+
+def chat_quota_key(chat_id: int) -> str:
+    return f"admission:chat:{chat_id}"
+
+class Decision(Enum):
+    ACCEPT = "accept"
+    DEFER = "defer"
+    REJECT = "reject"
+
+@dataclass
+class Admission:
+    decision: Decision
+    position: int = 0
+    eta: Optional[float] = None
+    reason: str = ""
+
+class AdmissionController:
+    """Admission control in front of the input queue
+
+    Messages are accepted while the queue is below `soft_limit`. Between the
+    soft limit and `max_size`, low-priority messages are deferred to a
+    bounded side buffer and released once the queue drains, and shed when
+    that buffer is full too. Each chat may have at most `chat_quota`
+    messages waiting or in progress. With a Redis client (by default the
+    Redis Streams queue's own), the per-chat counts live in Redis so every
+    process admitting to the queue shares them, and expire `stale_after`
+    seconds after the chat's last admission. The processing rate is tracked
+    as an EWMA of the interval between completions to estimate waiting times.
+    """
+
+    def __init__(
+        self,
+        queue,
+        max_size: int = settings.INPUT_QUEUE_MAXSIZE,
+        soft_limit: int = settings.INPUT_QUEUE_SOFT_LIMIT,
+        chat_quota: int = settings.CHAT_QUEUE_QUOTA,
+        defer_size: int = settings.DEFERRED_QUEUE_MAXSIZE,
+        stale_after: float = settings.ADMISSION_STALE_SECONDS,
+        alpha: float = 0.2,
+        redis=None
+    ):
+        self.queue = queue
+        self.redis = redis if redis is not None else getattr(queue, "redis", None)
+        self.max_size = int(max_size)
+        self.soft_limit = min(int(soft_limit), self.max_size)
+        self.chat_quota = int(chat_quota)
+        self.defer_size = int(defer_size)
+        self.stale_after = float(stale_after)
+        self.alpha = alpha
+        self._outstanding: Dict[int, Deque[float]] = {}
+        self._deferred: Deque[Any] = deque()
+        self._interval: Optional[float] = None
+        self._last_completion = 0.0
+        self.stats: Dict[str, int] = {"accepted": 0, "deferred": 0, "shed": 0, "over_quota": 0, "released": 0}
+        if self.redis is not None:
+            self._hold_script = self.redis.register_script(HOLD_SCRIPT)
+            self._unhold_script = self.redis.register_script(UNHOLD_SCRIPT)
+
+    @property
+    def rate(self) -> Optional[float]:
+        """Observed messages completed per second, once there is enough history"""
+        return 1 / self._interval if self._interval else None
+
+    @property
+    def outstanding(self) -> int:
+        """Messages admitted and not yet completed, across all chats"""
+        return sum(len(times) for times in self._outstanding.values())
+
+    def eta(self, position: int) -> Optional[float]:
+        """Estimated seconds until the message at `position` is answered"""
+        rate = self.rate
+        return position / rate if rate else None
+
+    async def depth(self) -> int:
+        """Entries waiting in the input queue, counted across processes for a Redis Streams queue"""
+        depth = getattr(self.queue, "depth", None)
+        return await depth() if depth is not None else self.queue.qsize()
+
+    async def admit(self, chat_id: int, low_priority: bool = False) -> Admission:
+        """Decide whether a new message from a chat enters the queue now, later or not at all"""
+        depth = await self.depth()
+        now = time.monotonic()
+        pending = self._chat_pending(chat_id, now)
+        held, waiting = await self._hold(chat_id, len(pending))
+        if not held:
+            if not pending:
+                del self._outstanding[chat_id]
+            self.stats["over_quota"] += 1
+            return Admission(Decision.REJECT, waiting, reason="chat_quota")
+
+        if depth >= self.max_size or (low_priority and depth >= self.soft_limit):
+            if low_priority and len(self._deferred) < self.defer_size:
+                pending.append(now)
+                self.stats["deferred"] += 1
+                position = depth + len(self._deferred) + 1
+                return Admission(Decision.DEFER, position, self.eta(position), reason="saturated")
+            await self._unhold(chat_id)
+            if not pending:
+                del self._outstanding[chat_id]
+            self.stats["shed"] += 1
+            return Admission(Decision.REJECT, depth, reason="saturated")
+
+        # Start measuring the rate afresh after an idle period
+        if not self.outstanding:
+            self._last_completion = now
+        pending.append(now)
+        self.stats["accepted"] += 1
+        position = self.outstanding
+        return Admission(Decision.ACCEPT, position, self.eta(position))
+
+    def defer(self, chat_id: int, item: Any):
+        """Hold a deferred item until the queue drains below the soft limit
+
+        The chat's quota slot was taken when admit() returned DEFER.
+        """
+        self._deferred.append(item)
+
+    async def release(self, chat_id: int):
+        """Free a chat's quota slot without counting a completion"""
+        pending = self._outstanding.get(chat_id)
+        if pending:
+            pending.popleft()
+            if not pending:
+                del self._outstanding[chat_id]
+        await self._unhold(chat_id)
+
+    async def completed(self, chat_id: int):
+        """Record that a message from a chat has been answered"""
+        await self.release(chat_id)
+        now = time.monotonic()
+        interval = now - self._last_completion if self._last_completion else None
+        self._last_completion = now
+        if interval is not None:
+            self._interval = interval if self._interval is None else (
+                self.alpha * interval + (1 - self.alpha) * self._interval
+            )
+
+    async def release_deferred(self, poll_interval: float = 1.0):
+        """Move deferred items into the queue whenever it is below the soft limit"""
+        while True:
+            while self._deferred and await self.depth() < self.soft_limit:
+                await self.queue.put(self._deferred.popleft())
+                self.stats["released"] += 1
+            await asyncio.sleep(poll_interval)
+
+    def take_deferred(self) -> List[Any]:
+        """Remove and return the deferred items, e.g. to save them on shutdown"""
+        items = list(self._deferred)
+        self._deferred.clear()
+        return items
+
+    @property
+    def deferred(self) -> int:
+        """Deferred items waiting to be released into the queue"""
+        return len(self._deferred)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "outstanding": self.outstanding,
+            "deferred_waiting": self.deferred,
+            "rate": round(self.rate, 3) if self.rate else None,
+        }
+
+    async def _hold(self, chat_id: int, pending: int) -> Tuple[bool, int]:
+        """Take a quota slot for a chat, returning whether it was free and the chat's count"""
+        if self.redis is None:
+            return pending < self.chat_quota, pending
+        held, count = await self._hold_script(
+            keys=[chat_quota_key(chat_id)],
+            args=[self.chat_quota, max(1, math.ceil(self.stale_after))],
+            client=self.redis
+        )
+        return bool(held), int(count)
+
+    async def _unhold(self, chat_id: int):
+        if self.redis is None:
+            return
+        try:
+            await self._unhold_script(keys=[chat_quota_key(chat_id)], client=self.redis)
+        except Exception as e:
+            # The count expires `stale_after` seconds after the chat's last admission anyway
+            logger.error(f"Failed to free a quota slot for chat {chat_id}: {str(e)}")
+
+    def _chat_pending(self, chat_id: int, now: float) -> Deque[float]:
+        """Admission times of a chat's outstanding messages, dropping ones never completed"""
+        pending = self._outstanding.setdefault(chat_id, deque())
+        while pending and now - pending[0] > self.stale_after:
+            pending.popleft()
+        return pending
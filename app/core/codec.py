@@ -0,0 +1,80 @@
+import importlib
+import json
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from app.core.config import settings
+
+# Hash field holding a packed record, by codec
+PACKED_FIELDS = {"orjson": "_oj", "msgpack": "_mp"}
+
+CODECS = ("hash", *PACKED_FIELDS)
+
+def _load_packer(name: str) -> Tuple[Callable[[Dict[str, Any]], bytes], Callable[[bytes], Dict[str, Any]]]:
+    """Pack and unpack functions of an optional serialization library"""
+    try:
+        module = importlib.import_module(name)
+    except ImportError as e:
+        raise RuntimeError(f"RECORD_CODEC={name} requires the {name} package") from e
+    if name == "msgpack":
+        return (
+            lambda record: module.packb(record, use_bin_type=True),
+            lambda value: module.unpackb(value, raw=False)
+        )
+    return module.dumps, module.loads
+
+class RecordCodec:
+    """Encode records as Redis hash mappings and decode them back
+
+    The "hash" codec stores every field as its own hash field, with nested
+    values such as funding as JSON text. The "orjson" and "msgpack" codecs
+    pack the fields given to encode() into a single hash field. Fields that
+    are updated in place (statuses, counters, timestamps) are written as
+    plain hash fields beside it either way. decode() reads both forms, so
+    the codec can be changed without migrating stored records.
+    """
+
+    def __init__(self, name: str = settings.RECORD_CODEC, json_fields: Iterable[str] = ("funding",)):
+        if name not in CODECS:
+            raise ValueError(f"Unknown record codec: {name}")
+        self.name = name
+        self.json_fields = frozenset(json_fields)
+        self._unpackers: Dict[str, Callable[[bytes], Dict[str, Any]]] = {}
+        self._pack = None
+        if name in PACKED_FIELDS:
+            self._pack, self._unpackers[PACKED_FIELDS[name]] = _load_packer(name)
+
+    def encode(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Hash mapping for the fields of a record that are written once"""
+        if self._pack is None:
+            return {
+                key: json.dumps(value, ensure_ascii=False) if key in self.json_fields else value
+                for key, value in record.items()
+            }
+        return {PACKED_FIELDS[self.name]: self._pack(record)}
+
+    def stale_fields(self, keys: Iterable[str]) -> List[str]:
+        """Fields left over from another codec when rewriting a record's `keys`"""
+        if self._pack is None:
+            return list(PACKED_FIELDS.values())
+        return [*keys, *(field for field in PACKED_FIELDS.values() if field != PACKED_FIELDS[self.name])]
+
+    def decode(self, data: Dict[bytes, bytes]) -> Dict[str, Any]:
+        """Record from an HGETALL reply, in whichever form it was stored"""
+        record: Dict[str, Any] = {}
+        packed = []
+        for key, value in data.items():
+            key = key.decode()
+            if key in PACKED_FIELDS.values():
+                packed.append((key, value))
+            elif key in self.json_fields:
+                record[key] = json.loads(value or "{}")
+            else:
+                record[key] = value.decode()
+        for key, value in packed:
+            record.update(self._unpacker(key)(value))
+        return record
+
+    def _unpacker(self, field: str) -> Callable[[bytes], Dict[str, Any]]:
+        if field not in self._unpackers:
+            name = next(name for name, packed_field in PACKED_FIELDS.items() if packed_field == field)
+            self._unpackers[field] = _load_packer(name)[1]
+        return self._unpackers[field]
@@ -13,9 +13,74 @@ class Settings(BaseSettings):
     REDIS_MAX_MEMORY: str = os.getenv("REDIS_MAX_MEMORY")
     REDIS_MAX_MEMORY_POLICY: str = os.getenv("REDIS_MAX_MEMORY_POLICY")
     REDIS_KEY_TTL: int = os.getenv("REDIS_KEY_TTL")
+    RECORD_CODEC: str = os.getenv("RECORD_CODEC", "hash")
+    RECENT_EXTRACTIONS_MAX: int = os.getenv("RECENT_EXTRACTIONS_MAX", 10000)
+    REDIS_WARM_CONNECTIONS: int = os.getenv("REDIS_WARM_CONNECTIONS", 4)
+    URL_BLOOM_ENABLED: bool = os.getenv("URL_BLOOM_ENABLED", False)
+    URL_BLOOM_BITS: int = os.getenv("URL_BLOOM_BITS", 16777216)
+    URL_BLOOM_HASHES: int = os.getenv("URL_BLOOM_HASHES", 7)
+
+    # Queues
+    QUEUE_BACKEND: str = os.getenv("QUEUE_BACKEND", "memory")
+    QUEUE_GROUP: str = os.getenv("QUEUE_GROUP", "workers")
+    QUEUE_MAXLEN: int = os.getenv("QUEUE_MAXLEN", 100000)
+    QUEUE_CLAIM_IDLE_MS: int = os.getenv("QUEUE_CLAIM_IDLE_MS", 300000)
+    INPUT_QUEUE_MAXSIZE: int = os.getenv("INPUT_QUEUE_MAXSIZE", 1000)
+    INPUT_QUEUE_SOFT_LIMIT: int = os.getenv("INPUT_QUEUE_SOFT_LIMIT", 800)
+    DEFERRED_QUEUE_MAXSIZE: int = os.getenv("DEFERRED_QUEUE_MAXSIZE", 1000)
+    CHAT_QUEUE_QUOTA: int = os.getenv("CHAT_QUEUE_QUOTA", 20)
+    ADMISSION_STALE_SECONDS: float = os.getenv("ADMISSION_STALE_SECONDS", 600)
+    SHUTDOWN_DRAIN_SECONDS: float = os.getenv("SHUTDOWN_DRAIN_SECONDS", 25)
     
+    # Scraper
+    SCRAPER_ENABLED: bool = os.getenv("SCRAPER_ENABLED", False)
+    SCRAPER_CONCURRENCY: int = os.getenv("SCRAPER_CONCURRENCY", 20)
+    SCRAPER_PER_HOST: int = os.getenv("SCRAPER_PER_HOST", 2)
+    SCRAPER_HOST_DELAY: float = os.getenv("SCRAPER_HOST_DELAY", 1.0)
+    SCRAPER_TIMEOUT: float = os.getenv("SCRAPER_TIMEOUT", 15.0)
+    SCRAPER_MAX_BYTES: int = os.getenv("SCRAPER_MAX_BYTES", 2000000)
+    SCRAPER_BATCH_SIZE: int = os.getenv("SCRAPER_BATCH_SIZE", 50)
+    SCRAPER_MAX_REDIRECTS: int = os.getenv("SCRAPER_MAX_REDIRECTS", 5)
+    SCRAPER_ALLOW_PRIVATE: bool = os.getenv("SCRAPER_ALLOW_PRIVATE", False)
+    LINK_LEASE_SECONDS: float = os.getenv("LINK_LEASE_SECONDS", 120)
+    EXTRACT_MAX_CHARS: int = os.getenv("EXTRACT_MAX_CHARS", 20000)
+
+    # Enrichment (Celery)
+    ENRICHMENT_ENABLED: bool = os.getenv("ENRICHMENT_ENABLED", False)
+    ENRICHMENT_CHUNK_SIZE: int = os.getenv("ENRICHMENT_CHUNK_SIZE", 5)
+    ANALYSIS_PAGE_CHARS: int = os.getenv("ANALYSIS_PAGE_CHARS", 4000)
+    CELERY_PREFETCH_MULTIPLIER: int = os.getenv("CELERY_PREFETCH_MULTIPLIER", 1)
+
     # Telegram
     TELEGRAM_TOKEN: str = os.getenv("TELEGRAM_TOKEN")
+    TELEGRAM_GLOBAL_RATE: float = os.getenv("TELEGRAM_GLOBAL_RATE", 30)
+    TELEGRAM_CHAT_RATE: float = os.getenv("TELEGRAM_CHAT_RATE", 1)
+    TELEGRAM_SEND_RETRIES: int = os.getenv("TELEGRAM_SEND_RETRIES", 5)
+    TELEGRAM_MODE: str = os.getenv("TELEGRAM_MODE", "polling")
+    TELEGRAM_WEBHOOK_URL: str = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+    TELEGRAM_WEBHOOK_SECRET: str = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+    TELEGRAM_WEBHOOK_MAX_CONNECTIONS: int = os.getenv("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", 40)
+    TELEGRAM_CONCURRENT_UPDATES: int = os.getenv("TELEGRAM_CONCURRENT_UPDATES", 64)
+
+    # AI
+    AI_WORKER_CONCURRENCY: int = os.getenv("AI_WORKER_CONCURRENCY", 4)
+    AI_BATCH_MAX_SIZE: int = os.getenv("AI_BATCH_MAX_SIZE", 1)
+    AI_BATCH_WINDOW_MS: float = os.getenv("AI_BATCH_WINDOW_MS", 150)
+    AI_STREAMING_ENABLED: bool = os.getenv("AI_STREAMING_ENABLED", False)
+    PROMPT_RELOAD_INTERVAL: float = os.getenv("PROMPT_RELOAD_INTERVAL", 5.0)
+    RUN_AI_WORKER: bool = os.getenv("RUN_AI_WORKER", True)
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", True)
+    LLM_CACHE_TTL: int = os.getenv("LLM_CACHE_TTL", 604800)
+    LLM_CACHE_MAX_ENTRIES: int = os.getenv("LLM_CACHE_MAX_ENTRIES", 512)
+    OPENAI_TOKEN: str = os.getenv("OPENAI_TOKEN", "")
+    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    OPENAI_FALLBACK_MODEL: str = os.getenv("OPENAI_FALLBACK_MODEL", "")
+    OPENAI_TPM_LIMIT: int = os.getenv("OPENAI_TPM_LIMIT", 30000)
+    OPENAI_RPM_LIMIT: int = os.getenv("OPENAI_RPM_LIMIT", 500)
+    OPENAI_COMPLETION_TOKENS: int = os.getenv("OPENAI_COMPLETION_TOKENS", 800)
+    OPENAI_MAX_RETRIES: int = os.getenv("OPENAI_MAX_RETRIES", 4)
+    OPENAI_RETRY_MAX_DELAY: float = os.getenv("OPENAI_RETRY_MAX_DELAY", 30.0)
+    OPENAI_FALLBACK_AFTER: float = os.getenv("OPENAI_FALLBACK_AFTER", 5.0)
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,72 @@
+import json
+from typing import Any, List, Optional
+
+class JsonArrayStream:
+    """Incremental parser yielding the items of one top-level array as they complete
+
+    Feed it the chunks of a JSON object as they arrive, e.g. streamed
+    function call arguments. Each object in the array under `key` is
+    returned by feed() as soon as its closing brace has been seen, so it
+    can be used before the rest of the document has arrived.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._in_array = False
+        self._item_start: Optional[int] = None
+        self.count = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume a chunk and return the array items it completed"""
+        self._text += chunk
+        items = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:i]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif char == "," and self._depth == 1:
+                self._current_key = None
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._depth == 2 and self._current_key == self.key:
+                    self._in_array = True
+                elif char == "{" and self._in_array and self._depth == 3:
+                    self._item_start = i
+            elif char in "}]":
+                if char == "}" and self._in_array and self._depth == 3 and self._item_start is not None:
+                    items.append(json.loads(text[self._item_start:i + 1]))
+                    self._item_start = None
+                    self.count += 1
+                elif char == "]" and self._in_array and self._depth == 2:
+                    self._in_array = False
+                self._depth -= 1
+        self._pos = len(text)
+        return items
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        return self._text
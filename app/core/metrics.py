@@ -0,0 +1,65 @@
+import contextvars
+import logging
+import uuid
+from prometheus_client import Counter, Gauge, Histogram
+
+# Latency buckets spanning fast Redis writes to slow OpenAI calls
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+MESSAGES_RECEIVED = Counter(
+    "pipeline_messages_received_total",
+    "Telegram messages accepted into the input queue"
+)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Time spent in each stage of the message pipeline",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+
+STAGE_ERRORS = Counter(
+    "pipeline_errors_total",
+    "Errors raised in each stage of the message pipeline",
+    ["stage"]
+)
+
+ADMISSIONS = Counter(
+    "pipeline_admissions_total",
+    "Admission decisions for incoming messages",
+    ["decision"]
+)
+
+QUEUE_DEPTH = Gauge(
+    "pipeline_queue_depth",
+    "Items waiting in each pipeline queue",
+    ["queue"]
+)
+
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total",
+    "OpenAI tokens used, by model, prompt and token kind",
+    ["model", "prompt", "kind"]
+)
+
+# Trace ID of the message being handled in the current task
+trace_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+class TraceIdFilter(logging.Filter):
+    """Add the current trace ID to log records as `trace_id`"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
+def configure_logging(level: int = logging.INFO):
+    """Log to stderr with the trace ID of the current message on every line"""
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
+    )
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
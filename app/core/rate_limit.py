@@ -0,0 +1,74 @@
+import asyncio
+import time
+from typing import Optional
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float = 1) -> float:
+        """Seconds until `amount` tokens are available, without consuming them"""
+        now = time.monotonic()
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.rate)
+        return wait
+
+    def backlog_delay(self, amount: float) -> float:
+        """Seconds until `amount` tokens have accrued, which may exceed the capacity for queued requests"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.rate)
+        return wait
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Consume `amount` tokens if they are available right now"""
+        if self.delay(amount) > 0:
+            return False
+        self.tokens -= min(amount, self.capacity)
+        return True
+
+    async def acquire(self, amount: float = 1):
+        """Wait until `amount` tokens are available and consume them"""
+        async with self._lock:
+            while (wait := self.delay(amount)) > 0:
+                await asyncio.sleep(wait)
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Consume `amount` more tokens, or return them if negative, once the real cost is known"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def sync(self, remaining: float, limit: Optional[float] = None, period: float = 60.0):
+        """Align the bucket with limits reported by the server for a rolling `period`"""
+        if limit:
+            self.capacity = float(limit)
+            self.rate = self.capacity / period
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, float(remaining))
+
+    def pause(self, seconds: float):
+        """Block acquisition for `seconds`, e.g. after the server asked us to back off"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+    @property
+    def idle(self) -> bool:
+        """Whether the bucket is full and not paused, so it can be discarded"""
+        return self.delay(self.capacity) == 0
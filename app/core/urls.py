@@ -0,0 +1,115 @@
+import re
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Query parameters that only track the click and never change the page
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid",
+    "mc_cid", "mc_eid", "igshid", "_hsenc", "_hsmi", "mkt_tok",
+    "ref_src", "ref_url",
+}
+
+# Alternative hostnames of the same social sites
+HOST_ALIASES = {
+    "twitter.com": "x.com",
+    "mobile.twitter.com": "x.com",
+    "mobile.x.com": "x.com",
+    "telegram.me": "t.me",
+    "telegram.dog": "t.me",
+    "m.youtube.com": "youtube.com",
+    "music.youtube.com": "youtube.com",
+    "discordapp.com": "discord.com",
+    "m.facebook.com": "facebook.com",
+}
+
+# Sites whose paths are case-insensitive handles or repository names
+CASE_INSENSITIVE_HOSTS = {"x.com", "t.me", "github.com", "linkedin.com", "medium.com"}
+
+# Query parameters that are share tracking on specific sites. `ref` and `si`
+# select content elsewhere, e.g. a branch or tag on GitHub
+HOST_TRACKING_PARAMS = {
+    "x.com": {"s", "t"},
+    "linkedin.com": {"trk", "originalsubdomain"},
+    "youtube.com": {"si"},
+    "youtu.be": {"si"},
+    "open.spotify.com": {"si"},
+    "producthunt.com": {"ref"},
+}
+
+# Bare `@handle` forms by link type
+HANDLE_URLS = {
+    "x": "https://x.com/{handle}",
+    "telegram": "https://t.me/{handle}",
+    "github": "https://github.com/{handle}",
+    "youtube": "https://youtube.com/@{handle}",
+}
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str, link_type: Optional[str] = None) -> str:
+    """Canonical form of a URL, used to recognize the same link written differently
+
+    Schemes are folded to https, hosts are lowercased without `www.`, social
+    site aliases and handle forms are unified, tracking parameters and
+    fragments are dropped, remaining parameters are sorted and trailing
+    slashes are removed. URLs that cannot be parsed, such as ones with a
+    non-numeric port, are returned stripped but otherwise unchanged.
+    """
+    url = raw = url.strip()
+    handle_url = HANDLE_URLS.get(link_type or "")
+    if handle_url and re.fullmatch(r"@[\w.]+", url):
+        url = handle_url.format(handle=url[1:])
+    if url.startswith("//"):
+        url = f"https:{url}"
+    elif "://" not in url:
+        url = f"https://{url}"
+
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return raw
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    host = HOST_ALIASES.get(host, host)
+    if host.endswith(".linkedin.com"):
+        host = "linkedin.com"
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+
+    path = re.sub(r"/{2,}", "/", parts.path).rstrip("/")
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS
+        and not key.lower().startswith("utm_")
+        and key.lower() not in HOST_TRACKING_PARAMS.get(host, ())
+    ]
+
+    # Short links and invite forms of the same resource
+    if host == "youtu.be" and path:
+        query.append(("v", path[1:]))
+        host, path = "youtube.com", "/watch"
+    elif host == "discord.com" and path.startswith("/invite/"):
+        host, path = "discord.gg", path[len("/invite"):]
+    elif host == "t.me" and path.startswith("/s/"):
+        path = path[len("/s"):]
+
+    if host in CASE_INSENSITIVE_HOSTS:
+        path = path.lower()
+
+    normalized = f"https://{host}{path}"
+    if query:
+        normalized += f"?{urlencode(sorted(query))}"
+    return normalized
+
+def url_domain(url: str) -> str:
+    """Host of a URL without `www.`, or an empty string if it has none"""
+    if "://" not in url:
+        url = f"https://{url.strip()}"
+    try:
+        host = (urlsplit(url).hostname or "").rstrip(".")
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
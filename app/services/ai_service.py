@@ -1,163 +1,512 @@
 import json
-import os
 import logging
 import asyncio
-from typing import Dict, Tuple, Any, List
-from openai import AsyncOpenAI
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 from app.core.config import settings
+from app.core.json_stream import JsonArrayStream
+from app.core.metrics import OPENAI_TOKENS, STAGE_ERRORS, STAGE_SECONDS, trace_id_var
+from app.services.llm_cache_service import LLMCacheService, Uncached
+from app.services.openai_client_service import OpenAIClientService
+from app.services.prompt_registry_service import CompiledPrompt, PromptRegistryService, PromptValidationError
 
 logger = logging.getLogger(__name__)
 
+# Parsed function call arguments, or the text of a reply without one
+Response = Union[Dict[str, Any], str]
+
+# Sent instead of a response when a message could not be processed
+ERROR_REPLY = "Sorry, I couldn't process your message right now. Please try sending it again in a few minutes."
+
+# Appended to the system prompt when several messages share one request
+BATCH_INSTRUCTIONS = (
+    "You will receive several independent messages, each enclosed in <message index=\"N\"> tags. "
+    "Process each message on its own, exactly as you would if it were sent alone, and call the "
+    "function once with one entry in `extractions` per message, in the same order, each with "
+    "the `index` of its message."
+)
+
 class AIService:
-    def __init__(self, input_queue: asyncio.Queue, response_queue: asyncio.Queue):
+    def __init__(
+        self,
+        input_queue: Optional[asyncio.Queue],
+        response_queue: Optional[asyncio.Queue],
+        concurrency: int = settings.AI_WORKER_CONCURRENCY,
+        batch_size: int = settings.AI_BATCH_MAX_SIZE,
+        batch_window_ms: float = settings.AI_BATCH_WINDOW_MS,
+        streaming: bool = settings.AI_STREAMING_ENABLED
+    ):
         self.input_queue = input_queue
         self.response_queue = response_queue
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_TOKEN)
-        self.model = settings.OPENAI_MODEL
-        self.prompts_dir = os.path.join(os.path.dirname(__file__), '..', 'prompts')
-        self.prompts: Dict[str, Dict[str, Any]] = {}
-        self.functions: Dict[str, Dict[str, Any]] = {}
-        self._load_all_prompts()
-        logger.info(f"AIService initialized with model: {self.model}")
-
-
-    def _load_all_prompts(self):
-        """Load all prompts and their functions from the prompts directory"""
-
-        # Iterate over all prompt directories
-        for prompt_dir in os.listdir(self.prompts_dir):
-            prompt_path = os.path.join(self.prompts_dir, prompt_dir)
-            if os.path.isdir(prompt_path):
-                try:
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_window = float(batch_window_ms) / 1000
+        self.streaming = streaming
+
+        # Each request slot carries up to `batch_size` messages
+        self._semaphore = asyncio.Semaphore(self.concurrency * self.batch_size)
+        self._request_slots = asyncio.Semaphore(self.concurrency)
+        self._batches: Dict[Tuple[str, str], List[Tuple[str, asyncio.Future]]] = {}
+        self._batch_timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self.batch_stats: Dict[str, int] = {"batches": 0, "batched_messages": 0, "fallbacks": 0}
+        self._in_flight = 0
+        self._chat_tails: Dict[int, asyncio.Event] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._active: Dict[asyncio.Task, Tuple[int, str, str]] = {}
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._intake_open = True
+        self.openai = OpenAIClientService()
+        self.model = self.openai.model
+        self.prompts = PromptRegistryService()
+        self.cache = LLMCacheService(settings.REDIS_URL) if settings.LLM_CACHE_ENABLED else None
+        logger.info(
+            f"AIService initialized with model: {self.model} "
+            f"({self.concurrency} workers, batches of up to {self.batch_size})"
+        )
+
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get the worker pool size, in-flight and queued message counts"""
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self._in_flight,
+            "queued": self.input_queue.qsize() if self.input_queue else 0,
+            "active_chats": len(self._chat_tails),
+            "batch_size": self.batch_size,
+            **self.batch_stats,
+            "prompts": self.prompts.versions,
+            "openai": self.openai.get_stats(),
+            "cache": dict(self.cache.stats) if self.cache else None,
+        }
+
+
+    @property
+    def idle(self) -> bool:
+        """Whether no message or batch is being processed"""
+        return not self._tasks
+
+    def unfinished(self) -> List[Tuple[int, str, str]]:
+        """Queue items of the messages still being processed"""
+        return list(self._active.values())
+
+    def stop_intake(self):
+        """Stop taking messages from the input queue, letting the ones in progress finish"""
+        self._intake_open = False
+        if self._dispatcher is not None and not self._dispatcher.done():
+            self._dispatcher.cancel()
+
+    async def cancel_in_flight(self):
+        """Cancel the messages and batches still being processed"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _stopped_by_intake(self) -> bool:
+        """Whether a cancellation of the dispatcher came from stop_intake()"""
+        if self._intake_open:
+            return False
+        asyncio.current_task().uncancel()
+        return True
 
-                    # Load prompt configuration
-                    with open(os.path.join(prompt_path, 'prompt.json'), 'r') as f:
-                        self.prompts[prompt_dir] = json.load(f)
+    async def process_messages(self, prompt_name: str):
+        """Dispatch queued messages to a pool of concurrent workers
 
-                    # Load function
-                    with open(os.path.join(prompt_path, 'function.json'), 'r') as f:
-                        function_data = json.load(f)
+        Cancelling the dispatcher cancels the messages in progress too.
+        After stop_intake() it returns and leaves them running instead.
+        """
+        self._dispatcher = asyncio.current_task()
+        reloader = asyncio.create_task(self.prompts.watch())
+        try:
+            while self._intake_open:
+                # Wait for a free worker slot before taking the next message
+                try:
+                    await self._semaphore.acquire()
+                except asyncio.CancelledError:
+                    if self._stopped_by_intake():
+                        break
+                    raise
+                try:
+                    # Check if the input queue is too large
+                    input_size = self.input_queue.qsize()
+                    if input_size > settings.INPUT_QUEUE_SOFT_LIMIT:
+                        logger.warning("Input queue size is high: %s (%s in flight)", input_size, self._in_flight)
 
-                        # Use first function function if it's an array
-                        self.functions[prompt_dir] = (
-                            function_data[0] if isinstance(function_data, list)
-                            else function_data
-                        )
+                    # Wait for a message in the input queue
+                    logger.debug("AIService: Waiting for message in input queue...")
+                    async with asyncio.timeout(30):  # 30-second timeout
+                        chat_id, message, trace_id = await self.input_queue.get()
 
-                    # Log the loaded prompt and function
-                    logger.info(f"Loaded prompt and function for: {prompt_dir}")
+                except asyncio.TimeoutError:
+                    self._semaphore.release()
+                    logger.debug("No messages received in the last 30 seconds")
+                    continue
 
                 except Exception as e:
-                    logger.error(f"Error loading prompt {prompt_dir}: {str(e)}")
-
+                    self._semaphore.release()
+                    logger.error("AIService: Error reading input queue: %s", e, exc_info=True)
+                    continue
+
+                except BaseException as e:
+                    self._semaphore.release()
+                    if isinstance(e, asyncio.CancelledError) and self._stopped_by_intake():
+                        break
+                    raise
+
+                # Chain the message behind the previous one from the same chat
+                previous = self._chat_tails.get(chat_id)
+                done = asyncio.Event()
+                self._chat_tails[chat_id] = done
+
+                task = asyncio.create_task(
+                    self._process_message(prompt_name, chat_id, message, trace_id, previous, done)
+                )
+                self._tasks.add(task)
+                self._active[task] = (chat_id, message, trace_id)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(self._active.pop)
+
+        finally:
+            reloader.cancel()
+            # Cancel in-flight workers unless the dispatcher is only stopping intake
+            if self._intake_open:
+                await self.cancel_in_flight()
+
+
+    async def _process_message(
+        self,
+        prompt_name: str,
+        chat_id: int,
+        message: str,
+        trace_id: str,
+        previous: Optional[asyncio.Event],
+        done: asyncio.Event
+    ):
+        """Process a single message and queue its response in chat order"""
+        trace_id_var.set(trace_id)
+
+        # Companies streamed ahead of the full response, held back while earlier messages are pending
+        partials: List[Response] = []
+        streamed = 0
+
+        async def emit_company(company: Dict[str, Any]):
+            nonlocal streamed
+            streamed += 1
+            partials.append({"companies": [company], "partial": True})
+            if previous is None or previous.is_set():
+                await self._put_responses(chat_id, partials, trace_id)
 
-    def _get_prompt(self, prompt_name: str, message: str) -> Tuple[str, str]:
-        """Get the system and user prompts for a given prompt name"""
-
-        # Check if the prompt exists
-        if prompt_name not in self.prompts:
-            raise ValueError(f"Prompt not found: {prompt_name}")
-        
-        # Get the prompt configuration
-        prompt_config = self.prompts[prompt_name]
-        system_prompt = prompt_config['system']
-        user_prompt = prompt_config['user'].format(message=message)
-        
-        # Return the system and user prompts
-        return system_prompt, user_prompt
+        try:
+            # Process the message, holding a worker slot only for the API call
+            self._in_flight += 1
+            try:
+                logger.info("AIService: Processing message for chat %s", chat_id)
+                if self.streaming:
+                    response = await self.process_gpt_streaming(prompt_name, message, emit_company)
+                else:
+                    response = await self.process_gpt(prompt_name, message)
+                logger.info("AIService: Generated response for chat %s", chat_id)
+            finally:
+                self._in_flight -= 1
+                self._semaphore.release()
+
+            if streamed:
+                response = self._without_streamed(response, streamed)
+
+            # Wait for earlier messages from the same chat to be answered first
+            if previous is not None:
+                await previous.wait()
+
+            # Add the response to the response queue
+            await self._put_responses(chat_id, partials, trace_id)
+            await self.response_queue.put((chat_id, response, trace_id))
+            logger.info("AIService: Response added to response queue for chat %s", chat_id)
 
+        except Exception as e:
+            logger.error("AIService: Error processing message: %s", e, exc_info=True)
+            if previous is not None:
+                await previous.wait()
+            # Tell the user rather than leaving the message unanswered
+            partials.append(ERROR_REPLY)
+            await self._put_responses(chat_id, partials, trace_id)
+
+        finally:
+            done.set()
+            if self._chat_tails.get(chat_id) is done:
+                del self._chat_tails[chat_id]
+
+            # Mark the message as processed
+            self.input_queue.task_done()
+
+
+    async def _put_responses(self, chat_id: int, responses: List[Response], trace_id: str):
+        """Queue held responses in order, emptying the list"""
+        while responses:
+            await self.response_queue.put((chat_id, responses.pop(0), trace_id))
+
+
+    @staticmethod
+    def _without_streamed(response: Response, streamed: int) -> Response:
+        """Drop the companies already sent as partial responses, leaving the response itself intact
+
+        The remainder records how many companies were streamed, so an empty
+        one is not sent as a reply of its own.
+        """
+        if isinstance(response, dict) and isinstance(response.get("companies"), list):
+            return {**response, "companies": response["companies"][streamed:], "streamed": streamed}
+        return response
+
+
+    async def process_gpt(self, prompt_name: str, message: str) -> Response:
+        """Process a message, reusing a cached result for identical requests
+
+        Cached results are shared between callers and must not be mutated.
+        The cache is keyed on the primary model, so results served by the
+        fallback model are not cached.
+        """
+        prompt = self.prompts.get(prompt_name)
+        if self.cache is None:
+            return Uncached.unwrap(await self._request(prompt, message))
+
+        key = self.cache.make_key(prompt.name, prompt.version, self.model, message)
+        return await self.cache.get_or_compute(key, lambda: self._request(prompt, message))
+
+
+    async def process_gpt_streaming(
+        self,
+        prompt_name: str,
+        message: str,
+        on_company: Callable[[Dict[str, Any]], Awaitable[None]]
+    ) -> Response:
+        """Process a message, passing each extracted company to `on_company` as it streams in
+
+        Cached results are returned whole, without calling `on_company`.
+        """
+        prompt = self.prompts.get(prompt_name)
+        if self.cache is None:
+            return Uncached.unwrap(await self._stream_gpt(prompt, message, on_company))
+
+        key = self.cache.make_key(prompt.name, prompt.version, self.model, message)
+        return await self.cache.get_or_compute(key, lambda: self._stream_gpt(prompt, message, on_company))
+
+
+    async def _request(self, prompt: CompiledPrompt, message: str) -> Response:
+        """Send a message on its own, or in the next batch when batching is enabled"""
+        if self.batch_size == 1:
+            return await self._request_single(prompt, message)
+
+        # Batch per prompt version, so a reload never mixes versions in one request
+        batch_key = (prompt.name, prompt.version)
+        future = asyncio.get_running_loop().create_future()
+        batch = self._batches.setdefault(batch_key, [])
+        batch.append((message, future))
+        if len(batch) >= self.batch_size:
+            self._flush_batch(batch_key, prompt)
+        elif len(batch) == 1:
+            self._batch_timers[batch_key] = asyncio.get_running_loop().call_later(
+                self.batch_window, self._flush_batch, batch_key, prompt
+            )
+        return await future
+
+
+    def _flush_batch(self, batch_key: Tuple[str, str], prompt: CompiledPrompt):
+        """Send the messages gathered for a prompt as one request"""
+        timer = self._batch_timers.pop(batch_key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(batch_key, [])
+        if batch:
+            task = asyncio.create_task(self._run_batch(prompt, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+    async def _run_batch(self, prompt: CompiledPrompt, batch: List[Tuple[str, asyncio.Future]]):
+        """Answer a batch with one request, falling back to single requests for what it misses"""
+        messages = [message for message, _ in batch]
+        results: List[Any] = [None] * len(batch)
+        if len(batch) > 1:
+            async with self._request_slots:
+                try:
+                    results = await self._request_gpt_batch(prompt, messages)
+                    self.batch_stats["batches"] += 1
+                    self.batch_stats["batched_messages"] += len(batch)
+                except Exception as e:
+                    logger.warning("AIService: Batch of %s failed, sending singly: %s", len(batch), e)
+
+        # Send the messages the batch did not answer on their own, each in its own request slot
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing and len(batch) > 1:
+            self.batch_stats["fallbacks"] += len(missing)
+        singles = await asyncio.gather(
+            *(self._request_single(prompt, messages[i]) for i in missing),
+            return_exceptions=True
+        )
+        for i, result in zip(missing, singles):
+            results[i] = result
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
 
-    def _get_function(self, prompt_name: str) -> List[Dict[str, Any]]:
-        """Get the function for a given prompt name"""
 
-        # Get the function
-        if prompt_name not in self.functions:
-            raise ValueError(f"function not found: {prompt_name}")
+    async def _request_single(self, prompt: CompiledPrompt, message: str) -> Response:
+        """Send one message in a request of its own, once a request slot is free"""
+        async with self._request_slots:
+            return await self._request_gpt(prompt, message)
 
-        # Get the function
-        function = self.functions[prompt_name]
 
-        # Return as a list with proper function structure
-        return [{
-            "name": function["name"],
-            "description": function["description"],
-            "parameters": function["parameters"]
-        }]
+    async def _request_gpt_batch(self, prompt: CompiledPrompt, messages: List[str]) -> List[Optional[Response]]:
+        """Extract several messages in one function call, returning None for any left out or invalid"""
+        system_prompt = f"{prompt.system}\n\n{BATCH_INSTRUCTIONS}"
+        user_prompt = prompt.render_user("\n\n".join(
+            f'<message index="{i}">\n{message}\n</message>' for i, message in enumerate(messages)
+        ))
 
+        response, model = await self._complete(prompt.name, system_prompt, user_prompt, prompt.batch_functions)
+        if not response.function_call:
+            raise ValueError("Batch response did not call the function")
 
-    async def process_messages(self, prompt_name: str):
-        while True:
+        results: List[Optional[Response]] = [None] * len(messages)
+        for extraction in json.loads(response.function_call.arguments).get("extractions", []):
             try:
-                # Check if the input queue is too large
-                input_size = self.input_queue.qsize()
-                if input_size > 10:  # arbitrary threshold
-                    logger.warning(f"Input queue size is high: {input_size}")
-
-                # Wait for a message in the input queue
-                logger.debug("AIService: Waiting for message in input queue...")
-                async with asyncio.timeout(30):  # 30-second timeout
-                    chat_id, message = await self.input_queue.get()
-
-                # Process the message
-                logger.info(f"AIService: Processing message for chat {chat_id}")
-                response = await self.process_gpt(prompt_name, message)
-                logger.info(f"AIService: Generated response for chat {chat_id}")
-
-                # Convert response to JSON if it's a dictionary
-                if isinstance(response, dict):
-                    response = json.dumps(response, ensure_ascii=False)
-
-                # Add the response to the response queue
-                await self.response_queue.put((chat_id, response))
-                logger.info(f"AIService: Response added to response queue for chat {chat_id}")
+                prompt.validate_item(extraction)
+            except PromptValidationError as e:
+                STAGE_ERRORS.labels("validation").inc()
+                logger.warning("AIService: Dropping batch extraction: %s", e)
+                continue
+            index = extraction.pop("index")
+            if 0 <= index < len(messages) and results[index] is None:
+                results[index] = self._from_model(model, extraction)
+        return results
+
+
+    async def _request_gpt(self, prompt: CompiledPrompt, message: str) -> Response:
+        response, model = await self._complete(prompt.name, prompt.system, prompt.render_user(message), prompt.functions)
+
+        # Process the response
+        if response.function_call:
+            logger.debug("Processing function call response")
+            return self._from_model(model, self._validated(prompt, response.function_call.arguments))
+        else:
+            logger.debug("Processing text response")
+            return self._from_model(model, response.content.strip())
+
+
+    def _from_model(self, model: str, response: Response) -> Response:
+        """Mark a response served by the fallback model, so it is not cached under the primary"""
+        return response if model == self.model else Uncached(response)
+
+
+    @staticmethod
+    def _validated(prompt: CompiledPrompt, arguments: str) -> Dict[str, Any]:
+        """Parse function call arguments and check them against the function's schema"""
+        data = json.loads(arguments)
+        try:
+            prompt.validate(data)
+        except PromptValidationError:
+            STAGE_ERRORS.labels("validation").inc()
+            raise
+        return data
+
+
+    async def _stream_gpt(
+        self,
+        prompt: CompiledPrompt,
+        message: str,
+        on_company: Callable[[Dict[str, Any]], Awaitable[None]]
+    ) -> Response:
+        """Stream a completion, parsing companies out of the function arguments as they arrive"""
+        parser = JsonArrayStream("companies")
+        content: List[str] = []
+        started = time.perf_counter()
+        try:
+            async with self._request_slots:
+                logger.debug("Streaming request to OpenAI API for prompt: %s", prompt.name)
+                stream, model = await self.openai.create(
+                    messages=[
+                        {"role": "system", "content": prompt.system},
+                        {"role": "user", "content": prompt.render_user(message)}
+                    ],
+                    temperature=0.7,
+                    functions=prompt.functions,
+                    function_call="auto",
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        self._record_usage(model, prompt.name, chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.function_call and delta.function_call.arguments:
+                        for company in parser.feed(delta.function_call.arguments):
+                            if parser.count == 1:
+                                STAGE_SECONDS.labels("openai_first_company").observe(time.perf_counter() - started)
+                            await on_company(company)
+                    elif delta.content:
+                        content.append(delta.content)
 
-                # Mark the message as processed
-                self.input_queue.task_done()
+        except Exception as e:
+            STAGE_ERRORS.labels("openai").inc()
+            logger.error("Error streaming message with OpenAI: %s", e)
+            raise
 
-            except asyncio.TimeoutError:
-                logger.debug("No messages received in the last 30 seconds")
+        finally:
+            STAGE_SECONDS.labels("openai").observe(time.perf_counter() - started)
 
-            except Exception as e:
-                logger.error(f"AIService: Error processing message: {str(e)}", exc_info=True)
+        if parser.text:
+            return self._from_model(model, self._validated(prompt, parser.text))
+        return self._from_model(model, "".join(content).strip())
 
 
-    async def process_gpt(self, prompt_name: str, message: str) -> str:
+    async def _complete(
+        self,
+        prompt_name: str,
+        system_prompt: str,
+        user_prompt: str,
+        functions: List[Dict[str, Any]]
+    ) -> Tuple[Any, str]:
+        """Send a chat completion request and return the response message and the model that served it"""
+        started = time.perf_counter()
         try:
 
-            # Get the system and user prompts
-            system_prompt, user_prompt = self._get_prompt(prompt_name, message)
-            
             # Create the messages
             messages = [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ]
 
-            # Get the function function
-            function = self._get_function(prompt_name)
-
             # Send the request to OpenAI API
-            logger.debug(f"Sending request to OpenAI API for prompt: {prompt_name}")
-            chat_completion = await self.client.chat.completions.create(
+            logger.debug("Sending request to OpenAI API for prompt: %s", prompt_name)
+            chat_completion, model = await self.openai.create(
                 messages=messages,
-                model=self.model,
                 temperature=0.7,
-                functions=function,
+                functions=functions,
                 function_call="auto"
             )
 
             # Get the response
-            logger.debug(f"Received response from OpenAI API for prompt: {prompt_name}")
-            response = chat_completion.choices[0].message
-
-            # Process the response
-            if response.function_call:
-                logger.debug("Processing function call response")
-                return json.dumps(json.loads(response.function_call.arguments))
-            else:
-                logger.debug("Processing text response")
-                return response.content.strip()
+            logger.debug("Received response from OpenAI API for prompt: %s", prompt_name)
+            self._record_usage(model, prompt_name, getattr(chat_completion, "usage", None))
+            return chat_completion.choices[0].message, model
 
         except Exception as e:
-            logger.error(f"Error processing message with OpenAI: {str(e)}")
+            STAGE_ERRORS.labels("openai").inc()
+            logger.error("Error processing message with OpenAI: %s", e)
             raise
+
+        finally:
+            STAGE_SECONDS.labels("openai").observe(time.perf_counter() - started)
+
+
+    def _record_usage(self, model: str, prompt_name: str, usage: Any):
+        """Count the prompt and completion tokens reported for a request"""
+        if usage is None:
+            return
+        OPENAI_TOKENS.labels(model, prompt_name, "prompt").inc(usage.prompt_tokens or 0)
+        OPENAI_TOKENS.labels(model, prompt_name, "completion").inc(usage.completion_tokens or 0)
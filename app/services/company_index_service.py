@@ -0,0 +1,119 @@
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, Optional, Tuple
+from app.core.urls import url_domain
+
+logger = logging.getLogger(__name__)
+
+# Legal suffixes that do not distinguish one company from another
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "llc", "ltd", "limited", "corp", "corporation",
+    "co", "company", "gmbh", "ag", "sa", "sas", "bv", "plc", "pte", "foundation",
+}
+
+# Hosts shared by many companies, whose domain does not identify one
+SHARED_DOMAINS = {
+    "linktr.ee", "medium.com", "mirror.xyz", "docsend.com", "notion.so",
+    "x.com", "t.me", "github.com", "linkedin.com", "youtube.com",
+    "google.com", "docs.google.com", "drive.google.com", "sites.google.com",
+}
+
+def normalize_company_name(name: str) -> str:
+    """Lowercased company name without accents, punctuation or legal suffixes"""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char)).lower()
+    words = re.sub(r"[^\w\s]", " ", name).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+def company_domain(company: Dict[str, Any]) -> str:
+    """Domain of a company's website, or an empty string if it has none of its own"""
+    website = (company.get("links") or {}).get("website") or {}
+    link = website.get("link") if isinstance(website, dict) else None
+    if not link:
+        return ""
+    domain = url_domain(link)
+    return "" if domain in SHARED_DOMAINS else domain
+
+def merge_funding(existing: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill gaps in existing funding details and combine the investor lists"""
+    merged = dict(existing or {})
+    for key, value in (new or {}).items():
+        if not value:
+            continue
+        if key == "investors" and merged.get(key):
+            investors: Dict[str, str] = {}
+            for investor in f"{merged[key]},{value}".split(","):
+                if investor.strip():
+                    investors.setdefault(investor.strip().lower(), investor.strip())
+            merged[key] = ", ".join(investors.values())
+        elif not merged.get(key):
+            merged[key] = value
+    return merged
+
+class CompanyIndexService:
+    """Redis index resolving extracted companies to existing company records
+
+    Companies are indexed by website domain under `company_index:domain:*`
+    and by normalized name under `company_index:name:*`. A domain match wins.
+    Otherwise a name match is accepted when at most one side knows its domain,
+    or both know the same one.
+    """
+
+    def __init__(self, redis, key_ttl: int):
+        self.redis = redis
+        self.key_ttl = key_ttl
+
+    @staticmethod
+    def company_keys(company: Dict[str, Any]) -> Tuple[str, str]:
+        """Normalized name and domain identifying a company"""
+        return normalize_company_name(company.get("name") or ""), company_domain(company)
+
+    async def lookup(
+        self,
+        keys: Iterable[Tuple[str, str]]
+    ) -> Tuple[Dict[str, str], Dict[str, Tuple[str, str]]]:
+        """Fetch the index entries for (name, domain) keys in one round-trip"""
+        names = sorted({name for name, _ in keys if name})
+        domains = sorted({domain for _, domain in keys if domain})
+        if not names and not domains:
+            return {}, {}
+
+        values = await self.redis.mget(
+            [f"company_index:domain:{domain}" for domain in domains]
+            + [f"company_index:name:{name}" for name in names]
+        )
+        by_domain = {
+            domain: value.decode()
+            for domain, value in zip(domains, values[:len(domains)]) if value is not None
+        }
+        by_name = {
+            name: tuple(value.decode().split("|", 1))
+            for name, value in zip(names, values[len(domains):]) if value is not None
+        }
+        return by_domain, by_name
+
+    @staticmethod
+    def resolve(
+        by_domain: Dict[str, str],
+        by_name: Dict[str, Tuple[str, str]],
+        name: str,
+        domain: str
+    ) -> Optional[str]:
+        """Pick the existing company ID matching a name and domain, if any"""
+        if domain and domain in by_domain:
+            return by_domain[domain]
+        if name and name in by_name:
+            company_id, known_domain = by_name[name]
+            if not domain or not known_domain or domain == known_domain:
+                return company_id
+        return None
+
+    def queue_add(self, pipe, name: str, domain: str, company_id: str):
+        """Queue indexing a company under its name and domain"""
+        if domain:
+            pipe.set(f"company_index:domain:{domain}", company_id, ex=self.key_ttl)
+        if name:
+            pipe.set(f"company_index:name:{name}", f"{company_id}|{domain}", ex=self.key_ttl)
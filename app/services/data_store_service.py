@@ -1,102 +1,497 @@
-import json
+import asyncio
 import logging
+import time
 import uuid
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Dict, Any, List
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
 from redis import asyncio as aioredis
+from app.core.codec import RecordCodec
 from app.core.config import settings
+from app.core.metrics import STAGE_ERRORS
+from app.core.urls import normalize_url
+from app.services.company_index_service import CompanyIndexService, merge_funding
+from app.services.url_index_service import UrlIndexService
 
 logger = logging.getLogger(__name__)
 
+# Company fields written once, and packed together by compact record codecs
+COMPANY_FIELDS = ("name", "summary", "funding", "chat_id", "domain", "created_at")
+
+# Sorted-set secondary indexes, scored by the time of the last write
+RECENT_EXTRACTIONS_KEY = "index:extractions"
+
+def chat_companies_key(chat_id: str) -> str:
+    return f"index:chat:{chat_id}:companies"
+
+def link_status_key(status: "ProcessingStatus") -> str:
+    return f"index:links:{status.value}"
+
 class ProcessingStatus(Enum):
     PENDING = "pending"
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
     FAILED = "failed"
 
+@dataclass
+class StoreContext:
+    """Existing links and companies that extractions are resolved against"""
+    links: Dict[str, str] = field(default_factory=dict)
+    companies_by_domain: Dict[str, str] = field(default_factory=dict)
+    companies_by_name: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    company_records: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
 class DataStoreService:
     def __init__(self, redis_url: str):
         self.redis = aioredis.from_url(redis_url)
         self.key_ttl = settings.REDIS_KEY_TTL
+        self.codec = RecordCodec()
+        self.url_index = UrlIndexService(self.redis, self.key_ttl)
+        self.company_index = CompanyIndexService(self.redis, self.key_ttl)
+
+    async def warm(self, connections: int = settings.REDIS_WARM_CONNECTIONS):
+        """Open pooled Redis connections ahead of the first writes"""
+        await asyncio.gather(*(self.redis.ping() for _ in range(int(connections))))
 
     async def store_company_data(self, chat_id: str, company_data: Dict[str, Any]) -> List[str]:
         """Store company data in Redis with processing status"""
         try:
-            company_ids = []
-            if "companies" in company_data:
-                for company in company_data["companies"]:
-                    company_id = self._generate_id()
-                    company_ids.append(company_id)
-                    
-                    logger.debug(f"Processing company: {company['name']}")
+            return (await self._store([(chat_id, company_data)]))[0]
+        except Exception as e:
+            STAGE_ERRORS.labels("redis_store").inc()
+            logger.error(f"Error storing company data: {str(e)}", exc_info=True)
+            return []
+
+    async def store_many(self, extractions: List[Tuple[str, Dict[str, Any]]]) -> List[List[str]]:
+        """Store several (chat_id, company_data) extractions in one write transaction"""
+        try:
+            return await self._store(extractions)
+        except Exception as e:
+            STAGE_ERRORS.labels("redis_store").inc()
+            logger.error(f"Error storing company data batch: {str(e)}", exc_info=True)
+            return [[] for _ in extractions]
+
+    async def get_seen_url(self, url: str, link_type: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Get the link already stored for a URL and when it was last fetched"""
+        normalized_url = normalize_url(url, link_type)
+        link_id = (await self.url_index.lookup([normalized_url])).get(normalized_url)
+        link = await self.get_link(link_id) if link_id else None
+        if link is None:
+            return None
+        return {
+            "link_id": link_id,
+            "processing_status": link.get("processing_status", ""),
+            "last_fetched": link.get("last_fetched", ""),
+        }
+
+    async def _store(self, extractions: List[Tuple[str, Dict[str, Any]]]) -> List[List[str]]:
+        """Resolve extractions against existing records, then write them in one transaction"""
+        context = await self._resolve([company_data for _, company_data in extractions])
+
+        # Send every write for the extractions as a single transaction
+        pipe = self.redis.pipeline(transaction=True)
+        results = [
+            self._queue_company_data(pipe, chat_id, company_data, context)
+            for chat_id, company_data in extractions
+        ]
+        self._queue_index_trim(pipe)
+        await pipe.execute()
+        return results
+
+    def _queue_index_trim(self, pipe):
+        """Drop index entries older than the records they point to"""
+        expired = time.time() - self.key_ttl
+        for status in ProcessingStatus:
+            pipe.zremrangebyscore(link_status_key(status), "-inf", expired)
+        pipe.zremrangebyscore(RECENT_EXTRACTIONS_KEY, "-inf", expired)
+        pipe.zremrangebyrank(RECENT_EXTRACTIONS_KEY, 0, -int(settings.RECENT_EXTRACTIONS_MAX) - 1)
+
+    async def _resolve(self, extractions: List[Dict[str, Any]]) -> StoreContext:
+        """Look up the links and companies in extractions that are already stored"""
+        companies = [company for company_data in extractions for company in company_data.get("companies", [])]
+        company_keys = [self.company_index.company_keys(company) for company in companies]
 
-                    # Store company data
+        known_links, (by_domain, by_name) = await asyncio.gather(
+            self.url_index.lookup(url for company_data in extractions for url in self._normalized_urls(company_data)),
+            self.company_index.lookup(company_keys)
+        )
+        context = StoreContext(links=known_links, companies_by_domain=by_domain, companies_by_name=by_name)
+
+        # Load the companies that will be merged into
+        company_ids = {
+            company_id for name, domain in company_keys
+            if (company_id := self.company_index.resolve(by_domain, by_name, name, domain))
+        }
+        if company_ids:
+            pipe = self.redis.pipeline(transaction=False)
+            for company_id in company_ids:
+                pipe.hgetall(f"company:{company_id}")
+            for company_id, data in zip(company_ids, await pipe.execute()):
+                if data:
+                    context.company_records[company_id] = self.codec.decode(data)
+
+        return context
+
+    def _queue_company_data(
+        self,
+        pipe,
+        chat_id: str,
+        company_data: Dict[str, Any],
+        context: Optional[StoreContext] = None
+    ) -> List[str]:
+        """Queue the writes for one extraction on a pipeline and return the company IDs
+
+        Companies and links found in `context` are merged into or reused
+        instead of being stored and fetched again. Records created here are
+        added to it, so later extractions in the same batch resolve to them.
+        """
+        if context is None:
+            context = StoreContext()
+        company_ids = []
+        pending_link_ids = []
+        if "companies" in company_data:
+            for company in company_data["companies"]:
+                logger.debug(f"Processing company: {company['name']}")
+
+                # Merge into an existing company, or store a new one
+                name_key, domain = self.company_index.company_keys(company)
+                company_id = self.company_index.resolve(
+                    context.companies_by_domain, context.companies_by_name, name_key, domain
+                )
+                record = context.company_records.get(company_id) if company_id else None
+                now = str(datetime.utcnow())
+                score = time.time()
+
+                if record is not None:
+                    company_key = f"company:{company_id}"
+                    record["funding"] = merge_funding(record.get("funding"), company.get("funding", {}))
+                    if not record.get("summary") and company.get("summary"):
+                        record["summary"] = company["summary"]
+                    if domain and not record.get("domain"):
+                        record["domain"] = domain
+                    logger.info(f"Merging {company['name']} into company {company_id}")
+                    fields = {key: record[key] for key in COMPANY_FIELDS if key in record}
+                    pipe.hdel(company_key, *self.codec.stale_fields(fields))
+                    pipe.hset(company_key, mapping={**self.codec.encode(fields), "updated_at": now})
+                    pipe.hincrby(company_key, "mentions", 1)
+                else:
+                    company_id = self._generate_id()
                     company_key = f"company:{company_id}"
-                    await self.redis.hset(company_key, mapping={
+                    record = {
                         "name": company["name"],
                         "summary": company["summary"],
-                        "funding": json.dumps(company.get("funding", {})),
+                        "funding": company.get("funding", {}),
                         "chat_id": chat_id,
-                        "created_at": str(datetime.utcnow()),
+                        "domain": domain,
+                        "created_at": now,
+                    }
+                    context.company_records[company_id] = record
+                    pipe.hset(company_key, mapping={
+                        **self.codec.encode(record),
+                        "mentions": 1,
+                        "updated_at": now,
                         "processing_status": ProcessingStatus.PENDING.value
                     })
-                    await self.redis.expire(company_key, self.key_ttl)
-
-                    # Debug log the incoming data structure
-                    logger.debug(f"Links data: {company.get('links', {})}")
-                    logger.debug(f"Socials data: {company.get('socials', {})}")
-
-                    # Combine links and socials into a single dictionary
-                    all_links = {}
-                    if "links" in company:
-                        for link_type, link_data in company["links"].items():
-                            if isinstance(link_data, dict) and link_data.get("link"):
-                                all_links[link_type] = {
-                                    "link": link_data["link"],
-                                    "password": link_data.get("password", "")
-                                }
-                                logger.debug(f"Added link: {link_type} -> {link_data['link']}")
-
-                    if "socials" in company:
-                        for social_type, url in company["socials"].items():
-                            if url:
-                                all_links[social_type] = {
-                                    "link": url,
-                                    "password": ""
-                                }
-                                logger.debug(f"Added social: {social_type} -> {url}")
-
-                    logger.debug(f"Combined links: {all_links}")
-
-                    # Store all links
-                    for link_type, link_data in all_links.items():
-                        link_id = self._generate_id()
-                        link_key = f"link:{link_id}"
-
-                        link_mapping = {
-                            "id": str(link_id),
-                            "type": link_type,
-                            "url": link_data["link"],
-                            "password": link_data.get("password", ""),
-                            "company_id": company_id,
-                            "processing_status": ProcessingStatus.PENDING.value,
-                            "last_updated": str(datetime.utcnow())
-                        }
-
-                        logger.debug(f"Storing link {link_id}: {link_mapping}")
-
-                        await self.redis.hset(link_key, mapping=link_mapping)
-                        await self.redis.expire(link_key, self.key_ttl)
-                        await self.redis.sadd(f"{company_key}:link_ids", link_id)
-                        await self.redis.sadd("links:pending", link_id)
-
-                    logger.info(f"Stored {len(all_links)} links for company {company_id}")
-
-            return company_ids
-        except Exception as e:
-            logger.error(f"Error storing company data: {str(e)}", exc_info=True)
+
+                company_ids.append(company_id)
+                pipe.expire(company_key, self.key_ttl)
+                pipe.sadd(f"{company_key}:chat_ids", chat_id)
+                pipe.expire(f"{company_key}:chat_ids", self.key_ttl)
+                pipe.zadd(chat_companies_key(chat_id), {company_id: score})
+                pipe.expire(chat_companies_key(chat_id), self.key_ttl)
+
+                # Index the company, refreshing the entries of a merged one
+                self.company_index.queue_add(pipe, name_key, record["domain"], company_id)
+                if record["domain"]:
+                    context.companies_by_domain[record["domain"]] = company_id
+                if name_key:
+                    context.companies_by_name[name_key] = (company_id, record["domain"])
+
+                # Combine links and socials into a single dictionary
+                all_links = self._combine_links(company)
+
+                # Store new links and reuse the ones already seen
+                link_ids = []
+                reused = 0
+                for link_type, link_data in all_links.items():
+                    normalized_url = normalize_url(link_data["link"], link_type)
+                    link_id = context.links.get(normalized_url)
+                    if link_id is not None:
+                        logger.debug(f"Reusing link {link_id} for {normalized_url}")
+                        pipe.expire(f"link:{link_id}", self.key_ttl)
+                        self.url_index.queue_touch(pipe, normalized_url)
+                        link_ids.append(link_id)
+                        reused += 1
+                        continue
+
+                    link_id = self._generate_id()
+                    link_key = f"link:{link_id}"
+
+                    link = {
+                        "id": str(link_id),
+                        "type": link_type,
+                        "url": link_data["link"],
+                        "normalized_url": normalized_url,
+                        "password": link_data.get("password", ""),
+                        "company_id": company_id,
+                    }
+
+                    logger.debug(f"Storing link {link_id}: {link}")
+
+                    # Links keep the hash layout whatever the codec: their few short
+                    # fields fit Redis' compact listpack encoding and grow when packed
+                    pipe.hset(link_key, mapping={
+                        **link,
+                        "processing_status": ProcessingStatus.PENDING.value,
+                        "last_updated": now
+                    })
+                    pipe.expire(link_key, self.key_ttl)
+                    pipe.zadd(link_status_key(ProcessingStatus.PENDING), {link_id: score})
+                    self.url_index.queue_add(pipe, normalized_url, link_id)
+                    context.links[normalized_url] = link_id
+                    link_ids.append(link_id)
+                    pending_link_ids.append(link_id)
+
+                if link_ids:
+                    pipe.sadd(f"{company_key}:link_ids", *link_ids)
+                    pipe.expire(f"{company_key}:link_ids", self.key_ttl)
+
+                logger.info(f"Queued {len(all_links)} links for company {company_id} ({reused} reused)")
+
+        if pending_link_ids:
+            pipe.sadd("links:pending", *pending_link_ids)
+
+        # Record the extraction itself for the recent extractions index
+        if company_ids:
+            extraction_id = self._generate_id()
+            extraction_key = f"extraction:{extraction_id}"
+            pipe.hset(extraction_key, mapping={
+                "id": extraction_id,
+                "chat_id": chat_id,
+                "company_ids": ",".join(company_ids),
+                "created_at": str(datetime.utcnow())
+            })
+            pipe.expire(extraction_key, self.key_ttl)
+            pipe.zadd(RECENT_EXTRACTIONS_KEY, {extraction_id: time.time()})
+
+        return company_ids
+
+    def _normalized_urls(self, company_data: Dict[str, Any]) -> List[str]:
+        """Normalized URLs of every link in an extraction"""
+        return [
+            normalize_url(link_data["link"], link_type)
+            for company in company_data.get("companies", [])
+            for link_type, link_data in self._combine_links(company).items()
+        ]
+
+    @staticmethod
+    def _combine_links(company: Dict[str, Any]) -> Dict[str, Dict[str, str]]:
+        """Combine a company's links and socials into a single dictionary"""
+        # Debug log the incoming data structure
+        logger.debug(f"Links data: {company.get('links', {})}")
+        logger.debug(f"Socials data: {company.get('socials', {})}")
+
+        all_links = {}
+        if "links" in company:
+            for link_type, link_data in company["links"].items():
+                if isinstance(link_data, dict) and link_data.get("link"):
+                    all_links[link_type] = {
+                        "link": link_data["link"],
+                        "password": link_data.get("password", "")
+                    }
+                    logger.debug(f"Added link: {link_type} -> {link_data['link']}")
+
+        if "socials" in company:
+            for social_type, url in company["socials"].items():
+                if url:
+                    all_links[social_type] = {
+                        "link": url,
+                        "password": ""
+                    }
+                    logger.debug(f"Added social: {social_type} -> {url}")
+
+        logger.debug(f"Combined links: {all_links}")
+        return all_links
+
+    async def get_company(self, company_id: str) -> Optional[Dict[str, Any]]:
+        """Get a company record with its link IDs, or None if it has expired"""
+        return (await self.get_companies([company_id]))[0]
+
+    async def get_companies(self, company_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Get several company records with their link IDs in one round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        for company_id in company_ids:
+            pipe.hgetall(f"company:{company_id}")
+            pipe.smembers(f"company:{company_id}:link_ids")
+        replies = await pipe.execute()
+
+        companies = []
+        for company_id, data, link_ids in zip(company_ids, replies[::2], replies[1::2]):
+            if not data:
+                companies.append(None)
+                continue
+            company = self.codec.decode(data)
+            company["id"] = company_id
+            company["link_ids"] = sorted(link_id.decode() for link_id in link_ids)
+            companies.append(company)
+        return companies
+
+    async def get_pending_link_ids(self, link_ids: List[str]) -> List[str]:
+        """Filter link IDs down to the ones still waiting to be fetched"""
+        if not link_ids:
             return []
+        pending = await self.redis.smismember("links:pending", link_ids)
+        return [link_id for link_id, is_pending in zip(link_ids, pending) if is_pending]
+
+    async def set_company_status(self, company_id: str, status: ProcessingStatus, **fields: Any):
+        """Update the processing status of a company along with any extra fields"""
+        await self.redis.hset(f"company:{company_id}", mapping={
+            "processing_status": status.value,
+            **{key: str(value) for key, value in fields.items()}
+        })
+
+    async def get_link(self, link_id: str) -> Optional[Dict[str, str]]:
+        """Get a link record, or None if it has expired"""
+        data = await self.redis.hgetall(f"link:{link_id}")
+        return self.codec.decode(data) if data else None
+
+    async def get_links(self, link_ids: List[str]) -> List[Optional[Dict[str, str]]]:
+        """Get several link records in one round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        for link_id in link_ids:
+            pipe.hgetall(f"link:{link_id}")
+        return [self.codec.decode(data) if data else None for data in await pipe.execute()]
+
+    async def set_link_status(self, link_id: str, status: ProcessingStatus, **fields: Any):
+        """Update the processing status of a link along with any extra fields"""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(f"link:{link_id}", mapping={
+            "processing_status": status.value,
+            "last_updated": str(datetime.utcnow()),
+            **{key: str(value) for key, value in fields.items()}
+        })
+        self._queue_link_status(pipe, link_id, status)
+        await pipe.execute()
+
+    @staticmethod
+    def _queue_link_status(pipe, link_id: str, status: ProcessingStatus):
+        """Move a link to the status index of its new status"""
+        for other in ProcessingStatus:
+            if other is not status:
+                pipe.zrem(link_status_key(other), link_id)
+        pipe.zadd(link_status_key(status), {link_id: time.time()})
+
+    async def store_page(self, link_id: str, page: Dict[str, Any]):
+        """Store a fetched page and mark its link as completed"""
+        page_key = f"page:{link_id}"
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(page_key, mapping={key: str(value) for key, value in page.items()})
+        pipe.expire(page_key, self.key_ttl)
+        pipe.hset(f"link:{link_id}", mapping={
+            "processing_status": ProcessingStatus.COMPLETED.value,
+            "last_updated": str(datetime.utcnow()),
+            "last_fetched": str(datetime.utcnow()),
+            "http_status": str(page.get("status_code", "")),
+        })
+        self._queue_link_status(pipe, link_id, ProcessingStatus.COMPLETED)
+        await pipe.execute()
+
+    async def get_page(self, link_id: str) -> Optional[Dict[str, str]]:
+        """Get the stored page for a link, or None if it was not fetched"""
+        data = await self.redis.hgetall(f"page:{link_id}")
+        return self._decode_hash(data) if data else None
+
+    async def update_page(self, link_id: str, fields: Dict[str, Any]):
+        """Add fields, such as extracted content, to a stored page"""
+        await self.redis.hset(f"page:{link_id}", mapping={key: str(value) for key, value in fields.items()})
+
+    async def get_extractions(self, extraction_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Get several extraction records in one round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        for extraction_id in extraction_ids:
+            pipe.hgetall(f"extraction:{extraction_id}")
+        extractions = []
+        for data in await pipe.execute():
+            extraction = self._decode_hash(data) if data else None
+            if extraction is not None:
+                extraction["company_ids"] = [c for c in extraction.get("company_ids", "").split(",") if c]
+            extractions.append(extraction)
+        return extractions
+
+    async def list_chat_companies(self, chat_id: str, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """A page of the companies mentioned in a chat, most recently mentioned first"""
+        return await self._list_index(chat_companies_key(chat_id), self.get_companies, cursor, limit)
+
+    async def list_links(self, status: ProcessingStatus, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """A page of the links with a processing status, most recently updated first"""
+        return await self._list_index(link_status_key(status), self.get_links, cursor, limit)
+
+    async def list_recent_extractions(self, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """A page of the stored extractions, newest first"""
+        return await self._list_index(RECENT_EXTRACTIONS_KEY, self.get_extractions, cursor, limit)
+
+    async def _list_index(
+        self,
+        key: str,
+        load: Callable[[List[str]], Awaitable[List[Optional[Dict[str, Any]]]]],
+        cursor: Optional[str],
+        limit: int
+    ) -> Dict[str, Any]:
+        """Load one page of the records in a sorted-set index
+
+        Entries whose record has expired are removed from the index, so a
+        page can hold fewer than `limit` items while `next_cursor` is set.
+        """
+        members, next_cursor = await self.page_index(key, cursor, limit)
+        records = await load(members) if members else []
+        expired = [member for member, record in zip(members, records) if record is None]
+        if expired:
+            await self.redis.zrem(key, *expired)
+        return {"items": [record for record in records if record is not None], "next_cursor": next_cursor}
+
+    async def page_index(self, key: str, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[str], Optional[str]]:
+        """Members of a sorted-set index in descending score order, one page at a time
+
+        The cursor is the score and member of the last item returned, so
+        pages stay stable while new entries are added at the top.
+        """
+        max_score, after = self._parse_cursor(cursor)
+        members: List[Tuple[str, float]] = []
+        offset = 0
+        while len(members) <= limit:
+            batch = await self.redis.zrevrangebyscore(key, max_score, "-inf", start=offset, num=limit + 1, withscores=True)
+            for member, score in batch:
+                member = member.decode()
+                # Skip the previous page's items that share the cursor's score
+                if after is not None and score == max_score and member >= after:
+                    continue
+                members.append((member, score))
+            if len(batch) <= limit:
+                break
+            offset += len(batch)
+
+        next_cursor = None
+        if len(members) > limit:
+            member, score = members[limit - 1]
+            next_cursor = f"{score!r}:{member}"
+        return [member for member, _ in members[:limit]], next_cursor
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Tuple[Any, Optional[str]]:
+        if not cursor:
+            return "+inf", None
+        score, sep, member = cursor.partition(":")
+        try:
+            if not sep or not member:
+                raise ValueError
+            return float(score), member
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}") from None
+
+    @staticmethod
+    def _decode_hash(data: Dict[bytes, bytes]) -> Dict[str, str]:
+        return {key.decode(): value.decode() for key, value in data.items()}
 
     def _generate_id(self) -> str:
         return str(uuid.uuid4())[:8]
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from redis import asyncio as aioredis
+from app.core.config import settings
+from app.core.metrics import QUEUE_DEPTH
+from app.services.ai_service import AIService
+from app.services.data_store_service import DataStoreService
+from app.services.link_queue_service import LinkQueueService
+from app.services.queue_service import create_queue
+from app.services.response_handler_service import ResponseHandlerService
+from app.services.scraper_service import ScraperService
+from app.services.telegram_service import TelegramService
+
+logger = logging.getLogger(__name__)
+
+# Redis lists holding work saved at shutdown, restored by the next start
+SPILL_KEYS = {
+    "input": "spill:input",
+    "response": "spill:response",
+    "telegram_send": "spill:telegram_send",
+}
+
+class LifecycleService:
+    """Starts the bot's services quickly and drains them on shutdown
+
+    start() builds the queues and services, launches the workers and
+    returns, so the process is live at once. The slow steps, namely the
+    Telegram handshake, warming the Redis and OpenAI connection pools and
+    restoring saved work, then run concurrently in the background. The
+    service reports ready once the bot is connected.
+
+    stop() runs when uvicorn receives SIGTERM. It stops taking Telegram
+    updates, then lets the AI workers and the response handler work
+    through both queues until they are empty or `drain_timeout` has
+    passed. Anything left is saved: messages go back on the Redis Streams
+    input queue, or into Redis lists with in-memory queues, and the next
+    start() restores them.
+    """
+
+    def __init__(self, drain_timeout: float = settings.SHUTDOWN_DRAIN_SECONDS):
+        self.drain_timeout = float(drain_timeout)
+        self.state = "stopped"
+        self.redis = aioredis.from_url(settings.REDIS_URL)
+        self.input_queue = None
+        self.response_queue = None
+        self.telegram_service: Optional[TelegramService] = None
+        self.ai_service: Optional[AIService] = None
+        self.response_handler: Optional[ResponseHandlerService] = None
+        self.scraper: Optional[ScraperService] = None
+        self.checks: Dict[str, str] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._warm_up: Optional[asyncio.Task] = None
+
+    @property
+    def in_memory(self) -> bool:
+        return isinstance(self.input_queue, asyncio.Queue)
+
+    async def start(self):
+        """Create the services and start their workers, connecting to Telegram in the background"""
+        self.state = "starting"
+        self.input_queue = create_queue("input", maxsize=settings.INPUT_QUEUE_MAXSIZE)
+        self.response_queue = create_queue("response")
+        QUEUE_DEPTH.labels("input").set_function(self.input_queue.qsize)
+        QUEUE_DEPTH.labels("response").set_function(self.response_queue.qsize)
+
+        self.telegram_service = TelegramService(settings.TELEGRAM_TOKEN, self.input_queue, self.response_queue)
+        QUEUE_DEPTH.labels("telegram_send").set_function(lambda: self.telegram_service.sender.pending)
+        QUEUE_DEPTH.labels("deferred").set_function(lambda: self.telegram_service.admission.deferred)
+        self.ai_service = AIService(self.input_queue, self.response_queue)
+        self.response_handler = ResponseHandlerService(self.response_queue, self.telegram_service)
+
+        # The workers only wait on the queues, so they can start before the bot is connected
+        if settings.RUN_AI_WORKER:
+            self._tasks["ai"] = asyncio.create_task(self.ai_service.process_messages("company_data"))
+        self._tasks["response"] = await self.response_handler.start()
+        self._tasks["admission"] = asyncio.create_task(self.telegram_service.admission.release_deferred())
+        if settings.SCRAPER_ENABLED:
+            self.scraper = ScraperService(DataStoreService(settings.REDIS_URL), LinkQueueService(settings.REDIS_URL))
+            self._tasks["scraper"] = asyncio.create_task(self.scraper.run())
+
+        self._warm_up = asyncio.create_task(self._start_background())
+        logger.info("Services started, connecting in the background")
+
+    async def _start_background(self):
+        """Connect to Telegram and warm the connection pools concurrently, then restore saved work"""
+        await asyncio.gather(
+            self._connect_telegram(),
+            self._check("redis", self._warm_redis()),
+            self._check("openai", self.ai_service.openai.warm())
+        )
+        await self._check("restore", self._restore())
+        self.state = "ready"
+        logger.info("Startup completed, ready for messages")
+
+    async def _check(self, name: str, step):
+        """Run a startup step, recording its outcome instead of failing startup"""
+        try:
+            await step
+            self.checks[name] = "ok"
+        except Exception as e:
+            self.checks[name] = f"error: {str(e)}"
+            logger.error(f"Startup step {name} failed: {str(e)}", exc_info=True)
+
+    async def _connect_telegram(self, max_delay: float = 60.0):
+        """Set up the bot, retrying with backoff until Telegram answers"""
+        delay = 1.0
+        while True:
+            try:
+                await self.telegram_service.setup_bot()
+                self.checks["telegram"] = "ok"
+                return
+            except Exception as e:
+                self.checks["telegram"] = f"error: {str(e)}"
+                logger.warning(f"Telegram setup failed, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+    async def _warm_redis(self):
+        """Open pooled connections for every Redis client before the first message"""
+        clients = [self.redis]
+        if self.ai_service.cache is not None:
+            clients.append(self.ai_service.cache.redis)
+        await asyncio.gather(
+            self.response_handler.data_store.warm(),
+            *(client.ping() for client in clients)
+        )
+
+    @property
+    def live(self) -> bool:
+        """Whether the process is running and none of its workers has died"""
+        if self.state == "stopped":
+            return False
+        if self.state == "draining":
+            return True
+        return not any(task.done() and not task.cancelled() for task in self._tasks.values())
+
+    async def readiness(self) -> Dict[str, Any]:
+        """Whether to route traffic here: connected to Telegram and Redis, and not draining"""
+        checks = dict(self.checks)
+        try:
+            async with asyncio.timeout(1):
+                await self.redis.ping()
+            checks["redis"] = "ok"
+        except Exception as e:
+            checks["redis"] = f"error: {str(e) or type(e).__name__}"
+        ready = (
+            self.state == "ready"
+            and self.telegram_service is not None and self.telegram_service.ready
+            and checks["redis"] == "ok"
+        )
+        return {"ready": ready, "state": self.state, "checks": checks}
+
+    async def stop(self):
+        """Stop intake, drain both queues within the deadline and save what is left"""
+        if self.state == "stopped":
+            return
+        self.state = "draining"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        logger.info(f"Draining for up to {self.drain_timeout:.0f}s")
+
+        if self._warm_up is not None:
+            self._warm_up.cancel()
+            await asyncio.gather(self._warm_up, return_exceptions=True)
+        await self.telegram_service.stop_intake()
+        await self._cancel("admission")
+        leftovers = await self._requeue(self.telegram_service.admission.take_deferred())
+
+        # Answer what is queued, then what is in progress
+        ai_task = self._tasks.get("ai")
+        if ai_task is not None:
+            if self.in_memory:
+                await self._wait(lambda: self.input_queue.qsize() == 0, deadline)
+            self.ai_service.stop_intake()
+            await asyncio.gather(ai_task, return_exceptions=True)
+            await self._wait(lambda: self.ai_service.idle, deadline)
+        await self._wait(lambda: self.response_queue.qsize() == 0 and not self.response_handler.busy, deadline)
+        await self.response_handler.stop()
+        try:
+            async with asyncio.timeout(max(0.0, deadline - loop.time())):
+                await self.telegram_service.sender.flush()
+        except TimeoutError:
+            pass
+
+        # Save the rest for the next start
+        leftovers += await self._requeue(self.ai_service.unfinished())
+        await self.ai_service.cancel_in_flight()
+        await self.telegram_service.sender.stop()
+        await self._spill(leftovers)
+        await self._cancel("scraper")
+        await self.telegram_service.shutdown()
+        self.state = "stopped"
+        logger.info("Drain completed")
+
+    async def _wait(self, predicate: Callable[[], bool], deadline: float, interval: float = 0.1) -> bool:
+        """Poll until `predicate` holds or the deadline passes"""
+        loop = asyncio.get_running_loop()
+        while not predicate():
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(interval)
+        return True
+
+    async def _cancel(self, name: str):
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _requeue(self, items: List[Any]) -> List[Any]:
+        """Put input items back on a Redis Streams queue, returning those that need saving instead"""
+        if self.in_memory:
+            return list(items)
+        for item in items:
+            await self.input_queue.put(item)
+        return []
+
+    async def _spill(self, inputs: List[Any]):
+        """Save unprocessed messages, undelivered responses and unsent replies to Redis"""
+        spilled = {"input": list(inputs), "response": [], "telegram_send": self.telegram_service.sender.take_pending()}
+        if self.in_memory:
+            for name, queue in (("input", self.input_queue), ("response", self.response_queue)):
+                while not queue.empty():
+                    spilled[name].append(queue.get_nowait())
+                    queue.task_done()
+
+        pipe = self.redis.pipeline(transaction=True)
+        for name, items in spilled.items():
+            if items:
+                pipe.rpush(SPILL_KEYS[name], *(json.dumps(item, ensure_ascii=False) for item in items))
+        await pipe.execute()
+        counts = {name: len(items) for name, items in spilled.items() if items}
+        if counts:
+            logger.warning(f"Saved unfinished work for the next start: {counts}")
+
+    async def _restore(self):
+        """Put work saved by a previous shutdown back on the queues"""
+        pipe = self.redis.pipeline(transaction=True)
+        for key in SPILL_KEYS.values():
+            pipe.lrange(key, 0, -1)
+        pipe.delete(*SPILL_KEYS.values())
+        saved = dict(zip(SPILL_KEYS, await pipe.execute()))
+
+        for raw in saved["input"]:
+            await self.input_queue.put(tuple(json.loads(raw)))
+        for raw in saved["response"]:
+            await self.response_queue.put(tuple(json.loads(raw)))
+        for raw in saved["telegram_send"]:
+            self.telegram_service.sender.enqueue(*json.loads(raw))
+        counts = {name: len(items) for name, items in saved.items() if items}
+        if counts:
+            logger.info(f"Restored work saved at the last shutdown: {counts}")
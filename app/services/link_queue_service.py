@@ -0,0 +1,149 @@
+import logging
+import os
+import socket
+import uuid
+from typing import List, Optional
+from redis import asyncio as aioredis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "links:pending"
+LEASED_KEY = "links:leased"
+OWNERS_KEY = "links:lease_owners"
+
+# Server time in milliseconds, so leases do not depend on worker clocks
+NOW_MS = "local t = redis.call('TIME') local now = t[1] * 1000 + math.floor(t[2] / 1000)"
+
+CLAIM_SCRIPT = NOW_MS + """
+local ids = redis.call('SPOP', KEYS[1], ARGV[1])
+for _, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[2], now + ARGV[2], id)
+    redis.call('HSET', KEYS[3], id, ARGV[3])
+end
+return ids
+"""
+
+CLAIM_IDS_SCRIPT = NOW_MS + """
+local claimed = {}
+for i = 3, #ARGV do
+    if redis.call('SREM', KEYS[1], ARGV[i]) == 1 then
+        redis.call('ZADD', KEYS[2], now + ARGV[1], ARGV[i])
+        redis.call('HSET', KEYS[3], ARGV[i], ARGV[2])
+        table.insert(claimed, ARGV[i])
+    end
+end
+return claimed
+"""
+
+RENEW_SCRIPT = NOW_MS + """
+local renewed = {}
+for i = 3, #ARGV do
+    if redis.call('HGET', KEYS[2], ARGV[i]) == ARGV[2] then
+        redis.call('ZADD', KEYS[1], 'XX', now + ARGV[1], ARGV[i])
+        table.insert(renewed, ARGV[i])
+    end
+end
+return renewed
+"""
+
+RELEASE_SCRIPT = """
+local released = 0
+for i = 3, #ARGV do
+    if redis.call('HGET', KEYS[3], ARGV[i]) == ARGV[1] then
+        redis.call('ZREM', KEYS[2], ARGV[i])
+        redis.call('HDEL', KEYS[3], ARGV[i])
+        if ARGV[2] == '1' then
+            redis.call('SADD', KEYS[1], ARGV[i])
+        end
+        released = released + 1
+    end
+end
+return released
+"""
+
+REAP_SCRIPT = NOW_MS + """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, ARGV[1])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('HDEL', KEYS[3], id)
+    redis.call('SADD', KEYS[1], id)
+end
+return ids
+"""
+
+class LinkQueueService:
+    """Lease-based work queue over the `links:pending` set
+
+    claim() atomically moves link IDs from `links:pending` into the
+    `links:leased` sorted set, scored by lease expiry, and records the owner.
+    Workers renew leases while they work and release them when done. reap()
+    puts expired leases back in `links:pending`, so a crashed worker's links
+    are picked up by another.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        lease_seconds: float = settings.LINK_LEASE_SECONDS,
+        owner: Optional[str] = None
+    ):
+        self.redis = aioredis.from_url(redis_url)
+        self.lease_ms = int(float(lease_seconds) * 1000)
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._claim = self.redis.register_script(CLAIM_SCRIPT)
+        self._claim_ids = self.redis.register_script(CLAIM_IDS_SCRIPT)
+        self._renew = self.redis.register_script(RENEW_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+        self._reap = self.redis.register_script(REAP_SCRIPT)
+
+    @property
+    def lease_seconds(self) -> float:
+        return self.lease_ms / 1000
+
+    async def claim(self, count: int) -> List[str]:
+        """Lease up to `count` pending link IDs"""
+        ids = await self._claim(keys=[PENDING_KEY, LEASED_KEY, OWNERS_KEY], args=[count, self.lease_ms, self.owner], client=self.redis)
+        return [link_id.decode() for link_id in ids]
+
+    async def claim_ids(self, link_ids: List[str]) -> List[str]:
+        """Lease specific link IDs, skipping any that are no longer pending"""
+        if not link_ids:
+            return []
+        ids = await self._claim_ids(
+            keys=[PENDING_KEY, LEASED_KEY, OWNERS_KEY],
+            args=[self.lease_ms, self.owner, *link_ids],
+            client=self.redis
+        )
+        return [link_id.decode() for link_id in ids]
+
+    async def renew(self, link_ids: List[str]) -> List[str]:
+        """Extend the leases this worker still holds, returning the renewed IDs"""
+        if not link_ids:
+            return []
+        ids = await self._renew(keys=[LEASED_KEY, OWNERS_KEY], args=[self.lease_ms, self.owner, *link_ids], client=self.redis)
+        return [link_id.decode() for link_id in ids]
+
+    async def complete(self, link_ids: List[str]) -> int:
+        """Release finished links, returning how many leases were still held"""
+        return await self._release_ids(link_ids, requeue=False)
+
+    async def requeue(self, link_ids: List[str]) -> int:
+        """Give links back to the pending set without processing them"""
+        return await self._release_ids(link_ids, requeue=True)
+
+    async def reap(self, limit: int = 1000) -> List[str]:
+        """Move expired leases back to the pending set"""
+        ids = await self._reap(keys=[PENDING_KEY, LEASED_KEY, OWNERS_KEY], args=[limit], client=self.redis)
+        if ids:
+            logger.warning(f"Reaped {len(ids)} expired link leases")
+        return [link_id.decode() for link_id in ids]
+
+    async def _release_ids(self, link_ids: List[str], requeue: bool) -> int:
+        if not link_ids:
+            return 0
+        return await self._release(
+            keys=[PENDING_KEY, LEASED_KEY, OWNERS_KEY],
+            args=[self.owner, "1" if requeue else "0", *link_ids],
+            client=self.redis
+        )
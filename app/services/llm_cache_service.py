@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+from redis import asyncio as aioredis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Uncached:
+    """A computed value to hand back without caching it, such as one from another model than the key's"""
+    value: Any
+
+    @staticmethod
+    def unwrap(value: Any) -> Any:
+        return value.value if isinstance(value, Uncached) else value
+
+class LLMCacheService:
+    """Content-addressed cache for LLM results
+
+    Lookups go through a small in-process LRU, then Redis. Concurrent
+    lookups for the same key share a single upstream call. Values are kept
+    as they were computed and only serialized to JSON for Redis, so callers
+    sharing a cached value must not mutate it. A computation returning
+    Uncached is passed to the waiting callers but not stored.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        ttl: int = settings.LLM_CACHE_TTL,
+        max_entries: int = settings.LLM_CACHE_MAX_ENTRIES,
+        prefix: str = "llm_cache"
+    ):
+        self.redis = aioredis.from_url(redis_url)
+        self.ttl = int(ttl)
+        self.max_entries = int(max_entries)
+        self.prefix = prefix
+        self._local: OrderedDict[str, Any] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+
+    @staticmethod
+    def normalize_message(message: str) -> str:
+        """Normalize unicode and whitespace so trivially different copies match"""
+        message = unicodedata.normalize("NFC", message)
+        return re.sub(r"\s+", " ", message).strip()
+
+    def make_key(self, prompt_name: str, prompt_version: str, model: str, message: str) -> str:
+        """Build the cache key for a prompt, prompt version, model and message"""
+        payload = json.dumps(
+            [prompt_name, prompt_version, model, self.normalize_message(message)],
+            ensure_ascii=False
+        )
+        return f"{self.prefix}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for a key, computing and storing it on a miss"""
+
+        # Check the in-process LRU first
+        if key in self._local:
+            self._local.move_to_end(key)
+            self.stats["hits"] += 1
+            self.stats["local_hits"] += 1
+            return self._local[key]
+
+        # Join an identical request that is already in flight
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._redis_get(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                self.stats["redis_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                value = await compute()
+                if isinstance(value, Uncached):
+                    future.set_result(value.value)
+                    return value.value
+                await self._redis_set(key, value)
+
+            self._remember(key, value)
+            future.set_result(value)
+            return value
+
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+
+        finally:
+            del self._inflight[key]
+
+    def _remember(self, key: str, value: Any):
+        """Store a value in the in-process LRU, evicting the oldest entries"""
+        self._local[key] = value
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def _redis_get(self, key: str) -> Optional[Any]:
+        try:
+            value = await self.redis.get(key)
+            if value is None:
+                return None
+            try:
+                return json.loads(value)
+            except json.JSONDecodeError:
+                # Plain text stored before values were serialized
+                return value.decode("utf-8")
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"LLM cache read failed for {key}: {str(e)}")
+            return None
+
+    async def _redis_set(self, key: str, value: Any):
+        try:
+            await self.redis.set(key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"LLM cache write failed for {key}: {str(e)}")
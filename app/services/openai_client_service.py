@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import random
+import re
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import openai
+from openai import AsyncOpenAI
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Errors worth sending the request again for
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds in a rate limit header such as "6m0s", "20ms" or a bare "2" """
+    if not value:
+        return None
+    parts = DURATION_PART.findall(value)
+    if parts:
+        return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def estimate_tokens(messages: List[Dict[str, Any]], functions: Optional[List[Dict[str, Any]]], completion_tokens: int) -> int:
+    """Rough token cost of a request, at about four characters per token"""
+    chars = sum(len(message.get("content") or "") for message in messages)
+    if functions:
+        chars += len(json.dumps(functions))
+    return chars // 4 + completion_tokens
+
+@dataclass
+class ModelBudget:
+    """Request and token buckets for one model, refilled per minute
+
+    `waiting` and `waiting_tokens` count the requests queued on the buckets
+    and their estimated tokens, so that delay() reflects the whole backlog.
+    """
+    requests: TokenBucket
+    tokens: TokenBucket
+    waiting: int = 0
+    waiting_tokens: int = 0
+
+    def delay(self, tokens: float) -> float:
+        """Seconds a new request would wait behind the ones already queued"""
+        return max(
+            self.requests.backlog_delay(self.waiting + 1),
+            self.tokens.backlog_delay(self.waiting_tokens + tokens)
+        )
+
+class OpenAIClientService:
+    """Chat completions scheduled against the account's rate limits
+
+    Each request's token cost is estimated before it is sent, and it waits
+    for room in per-model requests-per-minute and tokens-per-minute
+    buckets. Reported usage corrects the estimate afterwards, and the
+    x-ratelimit-* response headers keep the buckets in line with the
+    server's own counters. Rate limit, connection and server errors are
+    retried with full-jitter exponential backoff, honouring Retry-After.
+    When the primary model would make a request wait longer than
+    `fallback_after` seconds, it goes to the fallback model instead.
+    """
+
+    def __init__(
+        self,
+        model: str = settings.OPENAI_MODEL,
+        fallback_model: str = settings.OPENAI_FALLBACK_MODEL,
+        tpm_limit: int = settings.OPENAI_TPM_LIMIT,
+        rpm_limit: int = settings.OPENAI_RPM_LIMIT,
+        completion_tokens: int = settings.OPENAI_COMPLETION_TOKENS,
+        max_retries: int = settings.OPENAI_MAX_RETRIES,
+        retry_max_delay: float = settings.OPENAI_RETRY_MAX_DELAY,
+        fallback_after: float = settings.OPENAI_FALLBACK_AFTER
+    ):
+        # Retries are handled here, with the rate limit buckets in view
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_TOKEN, max_retries=0)
+        self.model = model
+        self.fallback_model = fallback_model or None
+        self.tpm_limit = int(tpm_limit)
+        self.rpm_limit = int(rpm_limit)
+        self.completion_tokens = int(completion_tokens)
+        self.max_retries = int(max_retries)
+        self.retry_max_delay = float(retry_max_delay)
+        self.fallback_after = float(fallback_after)
+        self._budgets: Dict[str, ModelBudget] = {}
+        self.stats: Dict[str, int] = {"requests": 0, "retries": 0, "rate_limited": 0, "fallbacks": 0, "errors": 0}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "budgets": {
+                model: {
+                    "requests": round(budget.requests.tokens, 1),
+                    "tokens": round(budget.tokens.tokens),
+                    "waiting": budget.waiting,
+                }
+                for model, budget in self._budgets.items()
+            },
+        }
+
+    async def warm(self):
+        """Open a pooled connection to the API and check the credentials, before the first message"""
+        try:
+            await self.client.models.retrieve(self.model)
+        except Exception as e:
+            logger.warning(f"Could not warm up the OpenAI connection: {str(e)}")
+
+    def _budget(self, model: str) -> ModelBudget:
+        if model not in self._budgets:
+            self._budgets[model] = ModelBudget(
+                requests=TokenBucket(self.rpm_limit / 60, capacity=self.rpm_limit),
+                tokens=TokenBucket(self.tpm_limit / 60, capacity=self.tpm_limit)
+            )
+        return self._budgets[model]
+
+    def _choose_model(self, estimate: int) -> str:
+        """The primary model, unless its budget would hold the request back too long"""
+        if self.fallback_model is None:
+            return self.model
+        wait = self._budget(self.model).delay(estimate)
+        if wait > self.fallback_after and self._budget(self.fallback_model).delay(estimate) < wait:
+            self.stats["fallbacks"] += 1
+            logger.info(f"OpenAI budget for {self.model} is {wait:.1f}s out, using {self.fallback_model}")
+            return self.fallback_model
+        return self.model
+
+    async def create(self, messages: List[Dict[str, Any]], stream: bool = False, **kwargs) -> Tuple[Any, str]:
+        """Create a chat completion, returning it (or its stream) and the model that served it"""
+        estimate = estimate_tokens(messages, kwargs.get("functions"), self.completion_tokens)
+        for attempt in range(self.max_retries + 1):
+            model = self._choose_model(estimate)
+            budget = self._budget(model)
+            budget.waiting += 1
+            budget.waiting_tokens += estimate
+            try:
+                await budget.requests.acquire()
+                await budget.tokens.acquire(estimate)
+            finally:
+                budget.waiting -= 1
+                budget.waiting_tokens -= estimate
+            self.stats["requests"] += 1
+            try:
+                raw = await self.client.chat.completions.with_raw_response.create(
+                    messages=messages,
+                    model=model,
+                    stream=stream,
+                    **kwargs
+                )
+            except RETRYABLE_ERRORS as e:
+                # A rejected request does not count against the token budget
+                budget.tokens.adjust(-estimate)
+                if attempt == self.max_retries:
+                    self.stats["errors"] += 1
+                    raise
+                delay = self._backoff(budget, e, attempt)
+                self.stats["retries"] += 1
+                logger.warning(f"OpenAI request to {model} failed, retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+
+            self._sync(budget, raw.headers)
+            response = raw.parse()
+            if stream:
+                return self._settling(response, budget, estimate), model
+            self._settle(budget, estimate, getattr(response, "usage", None))
+            return response, model
+
+    def _backoff(self, budget: ModelBudget, error: Exception, attempt: int) -> float:
+        """Seconds to wait before retrying, pausing the budget when the server asked for it"""
+        delay = random.uniform(0, min(self.retry_max_delay, 2 ** attempt))
+        response = getattr(error, "response", None)
+        if isinstance(error, openai.RateLimitError):
+            self.stats["rate_limited"] += 1
+            if response is not None:
+                self._sync(budget, response.headers)
+                retry_after = (
+                    parse_duration(response.headers.get("retry-after"))
+                    or parse_duration(response.headers.get("x-ratelimit-reset-tokens"))
+                )
+                if retry_after:
+                    delay = min(self.retry_max_delay, retry_after) + random.uniform(0, 1)
+            budget.requests.pause(delay)
+        return delay
+
+    @staticmethod
+    def _sync(budget: ModelBudget, headers: Any):
+        """Align the buckets with the x-ratelimit-* headers of a response"""
+        for bucket, kind in ((budget.requests, "requests"), (budget.tokens, "tokens")):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                bucket.sync(float(remaining), float(limit) if limit else None)
+            except ValueError:
+                continue
+            if float(remaining) < 1:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    bucket.pause(reset)
+
+    @staticmethod
+    def _settle(budget: ModelBudget, estimate: int, usage: Any):
+        """Correct the token budget with the usage a response reported"""
+        if usage is not None:
+            budget.tokens.adjust((usage.prompt_tokens or 0) + (usage.completion_tokens or 0) - estimate)
+
+    async def _settling(self, stream: Any, budget: ModelBudget, estimate: int) -> AsyncIterator[Any]:
+        """Pass a stream's chunks through, settling the token budget when usage arrives"""
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                self._settle(budget, estimate, usage)
+            yield chunk
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from string import Formatter
+from typing import Any, Dict, List, Optional, Tuple
+from jsonschema.validators import validator_for
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'prompts')
+
+class PromptValidationError(ValueError):
+    """Model output that does not match the function's JSON schema"""
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """A prompt and its function, parsed and prepared once per version"""
+    name: str
+    version: str
+    system: str
+    user_parts: Tuple[Tuple[str, bool], ...]
+    functions: List[Dict[str, Any]]
+    batch_functions: List[Dict[str, Any]]
+    validator: Any
+    item_validator: Any
+
+    def render_user(self, message: str) -> str:
+        """Fill the user template with a message"""
+        return "".join(message if is_field else text for text, is_field in self.user_parts)
+
+    def validate(self, data: Any):
+        """Raise PromptValidationError unless `data` matches the function's parameters"""
+        self._validate(self.validator, data)
+
+    def validate_item(self, data: Any):
+        """Validate one element of a batch extraction, which also carries its index"""
+        self._validate(self.item_validator, data)
+
+    def _validate(self, validator: Any, data: Any):
+        error = next(validator.iter_errors(data), None)
+        if error is not None:
+            path = "/".join(str(part) for part in error.absolute_path) or "<root>"
+            raise PromptValidationError(f"{self.name} output invalid at {path}: {error.message}")
+
+def compile_template(template: str) -> Tuple[Tuple[str, bool], ...]:
+    """Split a `{message}` template into literal text and the message slot"""
+    parts: List[Tuple[str, bool]] = []
+    for text, field, format_spec, conversion in Formatter().parse(template):
+        if text:
+            parts.append((text, False))
+        if field is None:
+            continue
+        if field != "message" or format_spec or conversion:
+            raise ValueError(f"Unsupported template field: {{{field}}}")
+        parts.append(("", True))
+    return tuple(parts)
+
+def make_batch_function(function: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap a function schema so one call returns an extraction per message"""
+    parameters = function["parameters"]
+    return {
+        "name": f"{function['name']}_batch",
+        "description": f"Applies {function['name']} to each message separately. {function['description']}",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "extractions": {
+                    "type": "array",
+                    "description": "One extraction per message, in message order",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "index": {
+                                "type": "integer",
+                                "description": "Index of the message this extraction belongs to"
+                            },
+                            **parameters.get("properties", {})
+                        },
+                        "required": ["index", *parameters.get("required", [])]
+                    }
+                }
+            },
+            "required": ["extractions"]
+        }
+    }
+
+def compile_validator(schema: Dict[str, Any]) -> Any:
+    """Check a JSON schema and build a reusable validator for it"""
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+def compile_prompt(name: str, prompt_bytes: bytes, function_bytes: bytes) -> CompiledPrompt:
+    """Parse and prepare a prompt directory's files"""
+    prompt_config = json.loads(prompt_bytes)
+    function_data = json.loads(function_bytes)
+
+    # Use first function if it's an array
+    function = function_data[0] if isinstance(function_data, list) else function_data
+    function = {
+        "name": function["name"],
+        "description": function["description"],
+        "parameters": function["parameters"]
+    }
+    batch_function = make_batch_function(function)
+
+    return CompiledPrompt(
+        name=name,
+        version=hashlib.sha256(prompt_bytes + b"\0" + function_bytes).hexdigest()[:16],
+        system=prompt_config["system"],
+        user_parts=compile_template(prompt_config["user"]),
+        functions=[function],
+        batch_functions=[batch_function],
+        validator=compile_validator(function["parameters"]),
+        item_validator=compile_validator(batch_function["parameters"]["properties"]["extractions"]["items"])
+    )
+
+class PromptRegistryService:
+    """Compiled prompts from `app/prompts/`, reloaded when their files change
+
+    Each prompt directory holds a prompt.json and a function.json. They are
+    compiled once per content version: templates are split around the
+    message slot, function payloads are built, and JSON schema validators
+    are prepared. watch() polls file modification times and recompiles in
+    a thread, then swaps the whole mapping at once, so a request always
+    sees one consistent version. A prompt that fails to compile keeps its
+    previous version.
+    """
+
+    def __init__(
+        self,
+        prompts_dir: str = PROMPTS_DIR,
+        poll_interval: float = settings.PROMPT_RELOAD_INTERVAL
+    ):
+        self.prompts_dir = prompts_dir
+        self.poll_interval = float(poll_interval)
+        self._prompts: Dict[str, CompiledPrompt] = {}
+        self._fingerprint: Optional[Tuple] = None
+        self.reload()
+
+    def get(self, name: str) -> CompiledPrompt:
+        prompt = self._prompts.get(name)
+        if prompt is None:
+            raise ValueError(f"Prompt not found: {name}")
+        return prompt
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._prompts
+
+    @property
+    def versions(self) -> Dict[str, str]:
+        return {name: prompt.version for name, prompt in self._prompts.items()}
+
+    def _prompt_dirs(self) -> List[os.DirEntry]:
+        return [
+            entry for entry in os.scandir(self.prompts_dir)
+            if entry.is_dir() and not entry.name.startswith(("_", "."))
+        ]
+
+    def _scan(self) -> Tuple:
+        """Modification times and sizes of every prompt file"""
+        entries = []
+        for entry in sorted(self._prompt_dirs(), key=lambda entry: entry.name):
+            for filename in ("prompt.json", "function.json"):
+                try:
+                    stat = os.stat(os.path.join(entry.path, filename))
+                    entries.append((entry.name, filename, stat.st_mtime_ns, stat.st_size))
+                except FileNotFoundError:
+                    entries.append((entry.name, filename, None, None))
+        return tuple(entries)
+
+    def reload(self) -> bool:
+        """Recompile changed prompts and swap them in, returning whether anything changed"""
+        fingerprint = self._scan()
+        if fingerprint == self._fingerprint:
+            return False
+
+        prompts = dict(self._prompts)
+        found = set()
+        for entry in self._prompt_dirs():
+            found.add(entry.name)
+            try:
+                with open(os.path.join(entry.path, 'prompt.json'), 'rb') as f:
+                    prompt_bytes = f.read()
+                with open(os.path.join(entry.path, 'function.json'), 'rb') as f:
+                    function_bytes = f.read()
+                prompt = compile_prompt(entry.name, prompt_bytes, function_bytes)
+            except Exception as e:
+                logger.error(f"Error loading prompt {entry.name}: {str(e)}")
+                continue
+
+            previous = prompts.get(entry.name)
+            if previous is None or previous.version != prompt.version:
+                prompts[entry.name] = prompt
+                logger.info(f"Loaded prompt and function for: {entry.name} (version {prompt.version})")
+
+        for name in set(prompts) - found:
+            logger.info(f"Removed prompt: {name}")
+            del prompts[name]
+
+        self._prompts = prompts
+        self._fingerprint = fingerprint
+        return True
+
+    async def watch(self):
+        """Reload prompts whenever their files change, until cancelled"""
+        if self.poll_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                logger.error(f"Error reloading prompts: {str(e)}")
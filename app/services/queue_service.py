@@ -0,0 +1,196 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import socket
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+from redis import asyncio as aioredis
+from redis.exceptions import ResponseError
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class RedisStreamQueue:
+    """Durable job queue on a Redis Stream with a consumer group
+
+    Exposes the subset of the asyncio.Queue interface the services use
+    (put, get, task_done, qsize), so it can be swapped in for the in-memory
+    queues. get() reads through the consumer group and task_done() acks the
+    entry. The entry being processed is kept in a context variable, so a task
+    spawned after get() acks its own entry even when several run at once.
+    Entries left pending by a crashed consumer are reclaimed once they have
+    been idle for `claim_idle_ms`.
+
+    The depth comes from the consumer group's lag, so it counts entries
+    added and delivered by every process, and is cached for `size_ttl`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        name: str,
+        group: str = settings.QUEUE_GROUP,
+        consumer: Optional[str] = None,
+        maxlen: int = settings.QUEUE_MAXLEN,
+        claim_idle_ms: int = settings.QUEUE_CLAIM_IDLE_MS,
+        block_ms: int = 5000,
+        size_ttl: float = 1.0
+    ):
+        self.redis = aioredis.from_url(redis_url)
+        self.name = name
+        self.stream = f"queue:{name}"
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.maxlen = int(maxlen)
+        self.claim_idle_ms = int(claim_idle_ms)
+        self.block_ms = block_ms
+        self.size_ttl = float(size_ttl)
+        self._group_ready = False
+        self._size = 0
+        self._size_at = 0.0
+        self._size_refresh: Optional[asyncio.Task] = None
+        self._last_claim = 0.0
+        self._claimed: Deque[Tuple[bytes, Dict[bytes, bytes]]] = deque()
+        self._unacked: Dict[bytes, None] = {}
+        self._acks: Set[asyncio.Task] = set()
+        self._current = contextvars.ContextVar(f"{self.stream}:entry", default=None)
+
+    async def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.info(f"Created consumer group {self.group} on {self.stream}")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def put(self, item: Any):
+        """Append an item to the stream, trimming it to roughly `maxlen` entries"""
+        await self.redis.xadd(
+            self.stream,
+            {"data": json.dumps(item, ensure_ascii=False)},
+            maxlen=self.maxlen,
+            approximate=True
+        )
+        self._size += 1
+
+    async def get(self) -> Any:
+        """Wait for the next entry, preferring stale entries reclaimed from other consumers"""
+        await self._ensure_group()
+        while True:
+            if not self._claimed and time.monotonic() - self._last_claim > self.claim_idle_ms / 1000:
+                await self._reclaim()
+
+            if self._claimed:
+                entry_id, fields = self._claimed.popleft()
+            else:
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"}, count=1, block=self.block_ms
+                )
+                if not response or not response[0][1]:
+                    continue
+                entry_id, fields = response[0][1][0]
+
+            # Entries trimmed from the stream while pending come back empty
+            if not fields or b"data" not in fields:
+                await self.redis.xack(self.stream, self.group, entry_id)
+                continue
+
+            self._size = max(0, self._size - 1)
+            self._unacked[entry_id] = None
+            self._current.set(entry_id)
+            item = json.loads(fields[b"data"])
+            return tuple(item) if isinstance(item, list) else item
+
+    def task_done(self):
+        """Acknowledge the entry returned by the last get() in this context"""
+        entry_id = self._current.get()
+        if entry_id is None or entry_id not in self._unacked:
+            # Acking some other entry would drop it while it may still be processing
+            raise ValueError("task_done() called without an unacknowledged get() in this context")
+        del self._unacked[entry_id]
+        self._current.set(None)
+
+        task = asyncio.create_task(self._ack(entry_id))
+        self._acks.add(task)
+        task.add_done_callback(self._acks.discard)
+
+    def qsize(self) -> int:
+        """Approximate number of entries not yet delivered to any consumer
+
+        Returns the cached depth, refreshing it in the background once it is
+        older than `size_ttl`. Use depth() where a stale value matters.
+        """
+        if time.monotonic() - self._size_at > self.size_ttl:
+            try:
+                self._refresh_size()
+            except RuntimeError:
+                pass  # No running event loop
+        return self._size
+
+    async def depth(self) -> int:
+        """Number of entries not yet delivered to any consumer, at most `size_ttl` seconds old"""
+        if time.monotonic() - self._size_at > self.size_ttl:
+            await asyncio.shield(self._refresh_size())
+        return self._size
+
+    def _refresh_size(self) -> asyncio.Task:
+        """Start reading the group's lag, sharing a refresh already in flight"""
+        if self._size_refresh is None or self._size_refresh.done():
+            self._size_refresh = asyncio.get_running_loop().create_task(self._read_size())
+        return self._size_refresh
+
+    async def _read_size(self):
+        try:
+            await self._ensure_group()
+            for group in await self.redis.xinfo_groups(self.stream):
+                if group["name"].decode() != self.group:
+                    continue
+                lag = group.get("lag")
+                if lag is None:
+                    # Redis < 7, or a lag Redis cannot tell after deletions: count the entries past the group
+                    lag = len(await self.redis.xrange(
+                        self.stream, min=b"(" + group["last-delivered-id"], count=self.maxlen
+                    ))
+                self._size = lag
+            self._size_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error reading the depth of {self.stream}: {str(e)}")
+
+    async def _ack(self, entry_id: bytes):
+        try:
+            await self.redis.xack(self.stream, self.group, entry_id)
+        except Exception as e:
+            logger.error(f"Failed to ack {entry_id!r} on {self.stream}: {str(e)}")
+
+    async def _reclaim(self):
+        """Take over entries idle in other consumers' pending lists"""
+        self._last_claim = time.monotonic()
+        try:
+            # Redis 7 adds a list of deleted IDs as a third element
+            entries = (await self.redis.xautoclaim(
+                self.stream, self.group, self.consumer, self.claim_idle_ms, start_id="0-0", count=10
+            ))[1]
+            if entries:
+                logger.warning(f"Reclaimed {len(entries)} stale entries on {self.stream}")
+            self._claimed.extend(entries)
+        except Exception as e:
+            logger.error(f"Error reclaiming entries on {self.stream}: {str(e)}")
+
+
+def create_queue(name: str, maxsize: int = 0):
+    """Create a job queue on the configured backend
+
+    `maxsize` bounds the in-memory queue. Redis Streams are bounded by
+    QUEUE_MAXLEN instead, and admission control keeps both below their limit.
+    """
+    if settings.QUEUE_BACKEND == "redis":
+        logger.info(f"Using Redis Streams backend for {name} queue")
+        return RedisStreamQueue(settings.REDIS_URL, name)
+    return asyncio.Queue(maxsize=maxsize)
@@ -1,9 +1,11 @@
 import asyncio
 import logging
-import json
-from typing import Optional
+import time
+from typing import Any, Dict, List, Optional, Union
 from app.services.data_store_service import DataStoreService
 from app.core.config import settings
+from app.core.metrics import STAGE_ERRORS, STAGE_SECONDS, trace_id_var
+from app.tasks.enrichment_tasks import enrich_company
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +15,7 @@ class ResponseHandlerService:
         self.telegram_service = telegram_service
         self.data_store = DataStoreService(settings.REDIS_URL)
         self.task: Optional[asyncio.Task] = None
+        self.busy = False
 
     async def start(self):
         """Start the response handler service"""
@@ -35,14 +38,20 @@ class ResponseHandlerService:
         logger.info("Starting to process responses")
         while True:
             try:
-                logger.debug(f"Waiting for response in queue (size: {self.response_queue.qsize()})...")
-                chat_id, response = await self.response_queue.get()
-                
+                logger.debug("Waiting for response in queue (size: %s)...", self.response_queue.qsize())
+                chat_id, response, trace_id = await self.response_queue.get()
+                trace_id_var.set(trace_id)
+
+                final = True
+                self.busy = True
                 try:
-                    await self._handle_response(chat_id, response)
+                    final = await self._handle_response(chat_id, response)
                 except Exception as e:
-                    logger.error(f"Error handling response for chat {chat_id}: {str(e)}", exc_info=True)
+                    logger.error("Error handling response for chat %s: %s", chat_id, e, exc_info=True)
                 finally:
+                    self.busy = False
+                    if final:
+                        await self.telegram_service.admission.completed(chat_id)
                     self.response_queue.task_done()
                     
             except asyncio.CancelledError:
@@ -51,35 +60,56 @@ class ResponseHandlerService:
             except Exception as e:
                 logger.error(f"Error in response processing loop: {str(e)}", exc_info=True)
 
-    async def _handle_response(self, chat_id: int, response: str):
-        """Handle a single response"""
-        logger.info(f"Handling response for chat {chat_id}")
+    async def _handle_response(self, chat_id: int, response: Union[Dict[str, Any], str]) -> bool:
+        """Handle a single response, returning False for a partial one streamed ahead of the rest
+
+        Structured responses arrive parsed and may be shared with the LLM
+        cache, so they are copied rather than modified.
+        """
+        logger.info("Handling response for chat %s", chat_id)
+        final = True
 
         try:
-            # Parse response if it's JSON
-            if response.startswith('{'):
-                response_data = json.loads(response)
+            if isinstance(response, dict):
+                final = not response.get("partial", False)
+                streamed = response.get("streamed", 0)
+                response = {key: value for key, value in response.items() if key not in ("partial", "streamed")}
+                if streamed and response == {"companies": []}:
+                    logger.info("All companies for chat %s were already sent as partial responses", chat_id)
+                    return final
+
                 # Store in Redis and get company IDs
+                started = time.perf_counter()
                 company_ids = await self.data_store.store_company_data(
                     str(chat_id),
-                    response_data
+                    response
                 )
-                logger.info(f"Stored {len(company_ids)} companies for chat {chat_id}")
+                STAGE_SECONDS.labels("redis_store").observe(time.perf_counter() - started)
+                logger.info("Stored %s companies for chat %s", len(company_ids), chat_id)
+
+                # Hand the slow enrichment stages off to Celery workers
+                if settings.ENRICHMENT_ENABLED and company_ids:
+                    await asyncio.to_thread(self._enqueue_enrichment, company_ids)
 
                 # Add company IDs to response for user reference
-                response_data['company_ids'] = company_ids
-                response = json.dumps(response_data, indent=2)
+                response['company_ids'] = company_ids
 
             # Send response to user
             await self.telegram_service.send_response(chat_id, response)
-            logger.info(f"Response sent to chat {chat_id}")
+            logger.info("Response sent to chat %s", chat_id)
 
-        except json.JSONDecodeError:
-            logger.warning(f"Response was not valid JSON: {response[:100]}...")
-            await self.telegram_service.send_response(chat_id, response)
         except Exception as e:
-            logger.error(f"Error handling response: {str(e)}")
+            STAGE_ERRORS.labels("response").inc()
+            logger.error("Error handling response: %s", e)
             await self.telegram_service.send_response(
                 chat_id,
                 "Sorry, there was an error processing your request."
             )
+
+        return final
+
+    def _enqueue_enrichment(self, company_ids: List[str]):
+        """Queue the Celery enrichment pipeline for each stored company"""
+        for company_id in company_ids:
+            enrich_company.delay(company_id)
+        logger.info(f"Queued enrichment for {len(company_ids)} companies")
@@ -0,0 +1,338 @@
+import asyncio
+import ipaddress
+import logging
+import re
+import socket
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+from urllib.parse import urlsplit
+import httpcore
+import httpx
+from parsel import Selector
+from app.core.config import settings
+from app.services.data_store_service import DataStoreService, ProcessingStatus
+from app.services.link_queue_service import LinkQueueService
+
+logger = logging.getLogger(__name__)
+
+TEXT_CONTENT_TYPES = ("text/", "application/json", "application/xml", "application/xhtml+xml")
+
+# Text nodes that are not rendered as page content
+VISIBLE_TEXT_XPATH = "//body//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::noscript)]"
+
+ALLOWED_SCHEMES = ("http", "https")
+
+class BlockedURLError(ValueError):
+    """A URL the scraper refuses to fetch, such as one pointing into the private network"""
+
+def is_public_address(address: str) -> bool:
+    """Whether an IP address is reachable on the public internet"""
+    ip = ipaddress.ip_address(address)
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+async def public_addresses(host: str, port: int) -> List[str]:
+    """Addresses a host resolves to, refusing hosts with any non-public address
+
+    Raises socket.gaierror when the host cannot be resolved.
+    """
+    try:
+        addresses = [str(ipaddress.ip_address(host))]
+    except ValueError:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    blocked = [address for address in addresses if not is_public_address(address)]
+    if blocked:
+        raise BlockedURLError(f"{host} resolves to a non-public address ({blocked[0]})")
+    return addresses
+
+class PublicAddressBackend(httpcore.AsyncNetworkBackend):
+    """Network backend that connects only to vetted public addresses
+
+    The host is resolved when the connection is opened and the socket goes
+    to the address that was checked, so a DNS answer changing after an
+    earlier check (DNS rebinding) cannot reach the private network. TLS
+    still uses the hostname for SNI and certificate checks, and requests
+    keep their Host header.
+    """
+
+    def __init__(self, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self._backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable[Any]] = None
+    ) -> httpcore.AsyncNetworkStream:
+        try:
+            addresses = await public_addresses(host, port)
+        except socket.gaierror as e:
+            raise httpcore.ConnectError(f"Could not resolve {host}: {str(e)}") from e
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options: Optional[Iterable[Any]] = None):
+        raise BlockedURLError("Unix sockets are not allowed")
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+class PublicAddressTransport(httpx.AsyncHTTPTransport):
+    """HTTP transport whose connections go through PublicAddressBackend"""
+
+    def __init__(self, backend: Optional[httpcore.AsyncNetworkBackend] = None, **kwargs):
+        super().__init__(**kwargs)
+        # httpx takes no network backend, so wrap the one of the pool it built
+        self._pool._network_backend = PublicAddressBackend(backend or self._pool._network_backend)
+
+class ScraperService:
+    """Fetch pending links with a pooled HTTP client
+
+    Links are leased from `links:pending` in batches and the leases are
+    renewed while the batch is in progress. Requests to the same host are
+    limited to `per_host` at a time and spaced by `host_delay` seconds.
+    Bodies are read up to `max_bytes` and stored as `page:{link_id}`.
+
+    The URLs come from chat messages, so only http and https are fetched,
+    and hosts resolving to private, loopback, link-local or reserved
+    addresses are refused. Redirects are followed by hand, up to
+    `max_redirects`, and each hop is checked the same way. The default
+    client connects through PublicAddressTransport, which checks the
+    address again at connect time and pins the connection to it.
+    """
+
+    def __init__(
+        self,
+        data_store: DataStoreService,
+        link_queue: LinkQueueService,
+        client: Optional[httpx.AsyncClient] = None,
+        concurrency: int = settings.SCRAPER_CONCURRENCY,
+        per_host: int = settings.SCRAPER_PER_HOST,
+        host_delay: float = settings.SCRAPER_HOST_DELAY,
+        timeout: float = settings.SCRAPER_TIMEOUT,
+        max_bytes: int = settings.SCRAPER_MAX_BYTES,
+        batch_size: int = settings.SCRAPER_BATCH_SIZE,
+        max_redirects: int = settings.SCRAPER_MAX_REDIRECTS,
+        allow_private: bool = settings.SCRAPER_ALLOW_PRIVATE
+    ):
+        self.data_store = data_store
+        self.link_queue = link_queue
+        self.concurrency = int(concurrency)
+        self.per_host = int(per_host)
+        self.host_delay = float(host_delay)
+        self.max_bytes = int(max_bytes)
+        self.batch_size = int(batch_size)
+        self.max_redirects = int(max_redirects)
+        self.allow_private = bool(allow_private)
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency
+        )
+        self.client = client or httpx.AsyncClient(
+            timeout=httpx.Timeout(float(timeout)),
+            transport=httpx.AsyncHTTPTransport(limits=limits) if self.allow_private else PublicAddressTransport(limits=limits),
+            headers={"User-Agent": f"{settings.PROJECT_NAME}-scraper"}
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_next: Dict[str, float] = {}
+        self._busy_time = 0.0
+        self.stats: Dict[str, int] = {"fetched": 0, "failed": 0, "bytes": 0}
+
+    @property
+    def pages_per_second(self) -> float:
+        """Pages fetched per second of time spent processing batches"""
+        return self.stats["fetched"] / self._busy_time if self._busy_time else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "pages_per_second": round(self.pages_per_second, 2)}
+
+    async def run(self, poll_interval: float = 5.0):
+        """Claim and fetch pending links until cancelled"""
+        logger.info("Starting ScraperService")
+        while True:
+            try:
+                await self.link_queue.reap()
+                link_ids = await self.link_queue.claim(self.batch_size)
+                if not link_ids:
+                    await asyncio.sleep(poll_interval)
+                    continue
+                await self.process_batch(link_ids)
+                logger.info(f"Scraper: {self.get_stats()}")
+
+            except asyncio.CancelledError:
+                logger.info("ScraperService stopped")
+                raise
+
+            except Exception as e:
+                logger.error(f"Scraper: Error processing batch: {str(e)}", exc_info=True)
+                await asyncio.sleep(poll_interval)
+
+    async def process_batch(self, link_ids: List[str]) -> List[bool]:
+        """Fetch a batch of leased links concurrently, renewing the leases meanwhile"""
+        started = time.monotonic()
+        leased = set(link_ids)
+        heartbeat = asyncio.create_task(self._renew_leases(leased))
+        try:
+            # One failure must not stop the heartbeat while the other fetches still hold leases
+            results = await asyncio.gather(
+                *(self._fetch_leased(link_id, leased) for link_id in link_ids),
+                return_exceptions=True
+            )
+        finally:
+            heartbeat.cancel()
+            self._busy_time += time.monotonic() - started
+        for link_id, result in zip(link_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Scraper: Failed to release link {link_id}: {str(result)}")
+        return [result is True for result in results]
+
+    async def _fetch_leased(self, link_id: str, leased: Set[str]) -> bool:
+        """Fetch a leased link, completing it once the outcome is recorded and requeueing it otherwise"""
+        try:
+            result = await self.fetch_link(link_id)
+        except Exception as e:
+            leased.discard(link_id)
+            logger.error(f"Scraper: Error processing link {link_id}, requeueing it: {str(e)}")
+            await self.link_queue.requeue([link_id])
+            return False
+        leased.discard(link_id)
+        await self.link_queue.complete([link_id])
+        return result
+
+    async def _renew_leases(self, leased: Set[str]):
+        """Renew the leases on links still being fetched every third of the lease"""
+        while True:
+            await asyncio.sleep(self.link_queue.lease_seconds / 3)
+            link_ids = list(leased)
+            if not link_ids:
+                continue
+            try:
+                renewed = await self.link_queue.renew(link_ids)
+            except Exception as e:
+                logger.error(f"Scraper: Failed to renew {len(link_ids)} leases: {str(e)}")
+                continue
+            # Links completed while the renewal was in flight were not lost
+            lost = leased.intersection(link_ids) - set(renewed)
+            if lost:
+                logger.warning(f"Scraper: Lost leases on {len(lost)} links: {sorted(lost)}")
+
+    async def fetch_link(self, link_id: str) -> bool:
+        """Fetch a link and record the result, returning whether it succeeded"""
+        link = await self.data_store.get_link(link_id)
+        if link is None:
+            logger.debug(f"Scraper: Link {link_id} expired before it was fetched")
+            return False
+
+        await self.data_store.set_link_status(link_id, ProcessingStatus.IN_PROGRESS)
+        try:
+            page = await self.fetch(link["url"])
+            await self.data_store.store_page(link_id, page)
+            self.stats["fetched"] += 1
+            self.stats["bytes"] += page["size"]
+            return True
+
+        except Exception as e:
+            logger.warning(f"Scraper: Failed to fetch link {link_id} ({link['url']}): {str(e)}")
+            await self.data_store.set_link_status(link_id, ProcessingStatus.FAILED, error=str(e)[:500])
+            self.stats["failed"] += 1
+            return False
+
+    async def fetch(self, url: str) -> Dict[str, Any]:
+        """Fetch a URL politely, reading at most `max_bytes` of the body"""
+        if "://" not in url:
+            url = f"https://{url}"
+        host = urlsplit(url).hostname or ""
+
+        host_semaphore = self._host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with host_semaphore:
+            await self._wait_for_host(host)
+            async with self._semaphore:
+                response = await self._send(url)
+                try:
+                    response.raise_for_status()
+                    body = bytearray()
+                    truncated = False
+                    async for chunk in response.aiter_bytes():
+                        body.extend(chunk)
+                        if len(body) > self.max_bytes:
+                            del body[self.max_bytes:]
+                            truncated = True
+                            break
+                finally:
+                    await response.aclose()
+
+        content_type = response.headers.get("content-type", "")
+        is_text = content_type.startswith(TEXT_CONTENT_TYPES)
+        return {
+            "url": str(response.url),
+            "status_code": response.status_code,
+            "content_type": content_type,
+            "size": len(body),
+            "truncated": int(truncated),
+            "body": body.decode(response.encoding or "utf-8", errors="replace") if is_text else "",
+        }
+
+    async def _send(self, url: str) -> httpx.Response:
+        """GET a URL as a streamed response, following redirects only to allowed URLs"""
+        request = self.client.build_request("GET", url)
+        for _ in range(self.max_redirects + 1):
+            await self._check_url(request.url)
+            response = await self.client.send(request, stream=True, follow_redirects=False)
+            if response.next_request is None:
+                return response
+            await response.aclose()
+            request = response.next_request
+        raise httpx.TooManyRedirects(f"Exceeded {self.max_redirects} redirects", request=request)
+
+    async def _check_url(self, url: httpx.URL):
+        """Refuse URLs with another scheme or whose host resolves to a non-public address"""
+        if url.scheme not in ALLOWED_SCHEMES:
+            raise BlockedURLError(f"Scheme {url.scheme!r} is not allowed")
+        if self.allow_private:
+            return
+        try:
+            await public_addresses(url.host, url.port or (443 if url.scheme == "https" else 80))
+        except socket.gaierror as e:
+            raise httpx.ConnectError(f"Could not resolve {url.host}: {str(e)}") from e
+
+    async def _wait_for_host(self, host: str):
+        """Space out requests to the same host by `host_delay` seconds"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start_at = max(now, self._host_next.get(host, 0.0))
+        self._host_next[host] = start_at + self.host_delay
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def extract_page_content(body: str, content_type: str = "", max_chars: int = settings.EXTRACT_MAX_CHARS) -> Dict[str, str]:
+    """Extract the title, meta description and visible text of a fetched page"""
+    if "html" not in content_type and not body.lstrip().startswith("<"):
+        return {"title": "", "description": "", "text": re.sub(r"\s+", " ", body).strip()[:max_chars]}
+
+    selector = Selector(text=body)
+    title = selector.css("title::text").get(default="")
+    description = selector.xpath(
+        "//meta[@name='description' or @property='og:description']/@content"
+    ).get(default="")
+    text = " ".join(selector.xpath(VISIBLE_TEXT_XPATH).getall())
+    return {
+        "title": title.strip(),
+        "description": description.strip(),
+        "text": re.sub(r"\s+", " ", text).strip()[:max_chars],
+    }
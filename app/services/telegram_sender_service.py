@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import httpx
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = MessageLimit.MAX_TEXT_LENGTH
+
+# Timeouts raised before the request reached Telegram, so a retry cannot duplicate the message
+UNSENT_TIMEOUTS = (httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class TelegramSenderService:
+    """Outbound message scheduler respecting Telegram flood limits
+
+    Each chat gets its own worker and token bucket, and all chats share a
+    global bucket. Messages queued for a chat while it is rate limited are
+    merged into as few sends as possible. Flood control (RetryAfter) applies
+    to the whole bot, so it pauses the global bucket too.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int, str], Awaitable[Any]],
+        global_rate: float = settings.TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = settings.TELEGRAM_CHAT_RATE,
+        max_retries: int = settings.TELEGRAM_SEND_RETRIES
+    ):
+        self._send = send
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = float(chat_rate)
+        self.max_retries = int(max_retries)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._pending: Dict[int, List[str]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.stats: Dict[str, int] = {
+            "queued": 0,
+            "sent": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failed": 0,
+            "uncertain": 0,
+        }
+
+    def enqueue(self, chat_id: int, text: str):
+        """Queue a message for a chat and make sure its worker is running"""
+        self._pending.setdefault(chat_id, []).append(text)
+        self.stats["queued"] += 1
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain_chat(chat_id))
+
+    @property
+    def pending(self) -> int:
+        """Number of messages waiting to be sent"""
+        return sum(len(texts) for texts in self._pending.values())
+
+    def take_pending(self) -> List[Tuple[int, str]]:
+        """Remove and return the messages still waiting to be sent"""
+        pending = [(chat_id, text) for chat_id, texts in self._pending.items() for text in texts]
+        self._pending.clear()
+        return pending
+
+    async def flush(self):
+        """Wait until every queued message has been sent or given up on"""
+        while self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+    async def stop(self):
+        """Cancel all chat workers, leaving unsent messages for take_pending()"""
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+    async def _drain_chat(self, chat_id: int):
+        """Send everything queued for a chat, merging messages that piled up"""
+        try:
+            while self._pending.get(chat_id):
+                texts = self._pending.pop(chat_id)
+                chunks = self._coalesce(texts)
+                self.stats["coalesced"] += max(0, len(texts) - len(chunks))
+                for i, chunk in enumerate(chunks):
+                    try:
+                        await self._send_with_retry(chat_id, chunk)
+                    except asyncio.CancelledError:
+                        # Put back the chunks not confirmed as sent. One cancelled mid-request may go out twice
+                        self._pending[chat_id] = chunks[i:] + self._pending.get(chat_id, [])
+                        raise
+        finally:
+            self._workers.pop(chat_id, None)
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is not None and bucket.idle:
+                del self._chat_buckets[chat_id]
+
+    async def _send_with_retry(self, chat_id: int, text: str):
+        """Send one message, waiting for rate limit tokens and retrying on flood control"""
+        bucket = self._chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, capacity=1))
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self._send(chat_id, text)
+                self.stats["sent"] += 1
+                return
+
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                logger.warning(f"Flood limit hit for chat {chat_id}, pausing all sends for {delay}s")
+                bucket.pause(delay)
+                self.global_bucket.pause(delay)
+                self.stats["retries"] += 1
+
+            except TimedOut as e:
+                if not isinstance(e.__cause__, UNSENT_TIMEOUTS):
+                    # The request may have reached Telegram, and a retry could send the message twice
+                    logger.error(f"Timed out sending to chat {chat_id}, the message may not have been delivered")
+                    self.stats["uncertain"] += 1
+                    return
+                delay = min(2 ** attempt, 30)
+                logger.warning(f"Timed out before sending to chat {chat_id}, retrying in {delay}s: {str(e)}")
+                bucket.pause(delay)
+                self.stats["retries"] += 1
+
+            except (BadRequest, Forbidden) as e:
+                logger.error(f"Failed to send message to chat {chat_id}: {str(e)}")
+                self.stats["failed"] += 1
+                return
+
+            except NetworkError as e:
+                delay = min(2 ** attempt, 30)
+                logger.warning(f"Network error sending to chat {chat_id}, retrying in {delay}s: {str(e)}")
+                bucket.pause(delay)
+                self.stats["retries"] += 1
+
+        logger.error(f"Giving up sending message to chat {chat_id} after {self.max_retries} retries")
+        self.stats["failed"] += 1
+
+    @staticmethod
+    def _coalesce(texts: List[str], limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+        """Merge queued texts into as few messages as fit the length limit"""
+        chunks: List[str] = []
+        for text in texts:
+            for part in split_message(text, limit):
+                if chunks and len(chunks[-1]) + 2 + len(part) <= limit:
+                    chunks[-1] = f"{chunks[-1]}\n\n{part}"
+                else:
+                    chunks.append(part)
+        return chunks
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split a message into parts under the length limit, preferring line breaks"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        parts.append(text)
+    return parts
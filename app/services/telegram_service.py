@@ -1,44 +1,178 @@
 import logging
 import re
 import asyncio
+import hmac
 import json
+import time
+from typing import Any, Awaitable, Dict, List, Union
 from telegram import Update
-from telegram.ext import Application, ContextTypes, MessageHandler, filters
+from telegram.ext import Application, BaseUpdateProcessor, ContextTypes, MessageHandler, filters
+from app.core.admission import Admission, AdmissionController, Decision
+from app.core.config import settings
+from app.core.metrics import ADMISSIONS, MESSAGES_RECEIVED, STAGE_ERRORS, STAGE_SECONDS, new_trace_id, trace_id_var
+from app.services.telegram_sender_service import TelegramSenderService
 
 logger = logging.getLogger(__name__)
 
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently across chats but one at a time within a chat
+
+    Messages from the same chat must reach the input queue in the order they
+    were sent. Each chat's updates therefore wait on a per-chat lock, which
+    asyncio grants in FIFO order, before taking one of the
+    `max_concurrent_updates` slots. A busy chat only holds one slot.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_waiting: Dict[int, int] = {}
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lock = self._chat_locks.setdefault(chat.id, asyncio.Lock())
+        self._chat_waiting[chat.id] = self._chat_waiting.get(chat.id, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._chat_waiting[chat.id] -= 1
+            if not self._chat_waiting[chat.id]:
+                del self._chat_waiting[chat.id]
+                del self._chat_locks[chat.id]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
 class TelegramService:
     def __init__(self, token: str, input_queue: asyncio.Queue, response_queue: asyncio.Queue):
         self.token = token
         self.application = None
         self.input_queue = input_queue
         self.response_queue = response_queue
+        self.sender = TelegramSenderService(self._send_message)
+        self.admission = AdmissionController(input_queue)
+        self.accepting = True
+
+    @property
+    def webhook_mode(self) -> bool:
+        return settings.TELEGRAM_MODE == "webhook"
 
     async def setup_bot(self):
-        logger.info('Starting Telegram Service')
+        logger.info(f'Starting Telegram Service in {settings.TELEGRAM_MODE} mode')
         try:
-            self.application = Application.builder().token(self.token).build()
+            builder = Application.builder().token(self.token).concurrent_updates(
+                ChatOrderedUpdateProcessor(int(settings.TELEGRAM_CONCURRENT_UPDATES))
+            )
+            # Webhook updates are fed to the update queue by the API route instead
+            if self.webhook_mode:
+                builder = builder.updater(None)
+            self.application = builder.build()
             self._setup_handlers()
             await self.application.initialize()
             await self.application.start()
-            await self.application.updater.start_polling()
+            if self.webhook_mode:
+                await self._set_webhook()
+            else:
+                await self.application.updater.start_polling()
             logger.info('Telegram bot setup completed successfully')
         except Exception as e:
             logger.error(f'Error setting up Telegram bot: {str(e)}')
             raise
 
-    async def send_response(self, chat_id: int, response: str):
+    @property
+    def ready(self) -> bool:
+        return self.accepting and self.application is not None and self.application.running
+
+    async def stop_intake(self):
+        """Stop receiving updates, letting the handlers already running finish"""
+        self.accepting = False
+        if self.application is None:
+            return
+        if self.application.updater is not None and self.application.updater.running:
+            await self.application.updater.stop()
+        if self.application.running:
+            await self.application.stop()
+
+    async def shutdown(self):
+        """Release the bot's resources once nothing is left to send"""
+        if self.application is not None:
+            await self.application.shutdown()
+
+    async def _set_webhook(self):
+        """Register the webhook URL with Telegram, so updates are pushed to every replica behind it"""
+        if not settings.TELEGRAM_WEBHOOK_URL or not settings.TELEGRAM_WEBHOOK_SECRET:
+            raise ValueError("TELEGRAM_WEBHOOK_URL and TELEGRAM_WEBHOOK_SECRET are required in webhook mode")
+        await self.application.bot.set_webhook(
+            url=settings.TELEGRAM_WEBHOOK_URL,
+            secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=[Update.MESSAGE],
+            max_connections=int(settings.TELEGRAM_WEBHOOK_MAX_CONNECTIONS)
+        )
+        logger.info(f'Webhook set to {settings.TELEGRAM_WEBHOOK_URL}')
+
+    def verify_webhook_secret(self, secret: str) -> bool:
+        """Check the X-Telegram-Bot-Api-Secret-Token header of a webhook request"""
+        expected = settings.TELEGRAM_WEBHOOK_SECRET
+        return bool(expected) and hmac.compare_digest(secret.encode(), expected.encode())
+
+    async def process_webhook(self, payload: Union[Dict[str, Any], List[Dict[str, Any]]]) -> int:
+        """Queue one update, or a batch of them, for the application's handlers"""
+        updates = payload if isinstance(payload, list) else [payload]
+        for data in updates:
+            update = Update.de_json(data, self.application.bot)
+            if update is not None:
+                await self.application.update_queue.put(update)
+        return len(updates)
+
+    async def send_response(self, chat_id: int, response: Union[Dict[str, Any], str]):
+        """Format a response for Telegram, once, and queue it for sending"""
         try:
-            logger.info(f"Attempting to send response to chat {chat_id}")
-            # Handle JSON responses differently if needed
-            if response.startswith('{'):
-                # Maybe format JSON responses in a more readable way
-                formatted_response = json.loads(response)
-                response = json.dumps(formatted_response, indent=2, ensure_ascii=False)
-            await self.application.bot.send_message(chat_id=chat_id, text=response)
-            logger.info(f"Response sent successfully to chat {chat_id}")
+            logger.info(f"Queueing response for chat {chat_id}")
+            if not isinstance(response, str):
+                response = json.dumps(response, indent=2, ensure_ascii=False)
+            self.sender.enqueue(chat_id, response)
         except Exception as e:
-            logger.error(f"Failed to send message to chat {chat_id}: {str(e)}")
+            logger.error(f"Failed to queue message for chat {chat_id}: {str(e)}")
+
+    async def _send_message(self, chat_id: int, text: str):
+        started = time.perf_counter()
+        try:
+            await self.application.bot.send_message(chat_id=chat_id, text=text)
+        except Exception:
+            STAGE_ERRORS.labels("telegram_send").inc()
+            raise
+        finally:
+            STAGE_SECONDS.labels("telegram_send").observe(time.perf_counter() - started)
+        logger.info("Response sent successfully to chat %s", chat_id)
+
+    @staticmethod
+    def _admission_text(admission: Admission) -> str:
+        """Reply telling the user where their message stands"""
+        if admission.decision is Decision.REJECT:
+            if admission.reason == "chat_quota":
+                return (f"You already have {admission.position} messages waiting. "
+                        "Please wait for them to be answered before sending more.")
+            return "The bot is overloaded right now. Please send your message again in a few minutes."
+
+        wait = ""
+        if admission.eta is not None:
+            wait = f", about {max(1, round(admission.eta))}s" if admission.eta < 90 else f", about {round(admission.eta / 60)} min"
+        if admission.decision is Decision.DEFER:
+            return f"The bot is busy. Your message is queued at position {admission.position}{wait} and will be processed as the load drops."
+        if admission.position <= 1:
+            return "Message received, processing..."
+        return f"Message received, position {admission.position} in the queue{wait}."
 
     def _setup_handlers(self):
         logger.info('Setting up handlers for Telegram Service')
@@ -46,15 +180,41 @@ class TelegramService:
         logger.info('Handlers setup completed')
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        started = time.perf_counter()
         chat_id = update.effective_chat.id
-        user_message = update.message.text
-        logger.info(f'User message received from chat {chat_id}: {user_message}')
+        trace_id = new_trace_id()
+        trace_id_var.set(trace_id)
+        logger.info('User message received from chat %s: %s', chat_id, update.message.text)
+
+        # Forwards arrive in bursts and are the first to wait when the queue is saturated
+        admission = await self.admission.admit(chat_id, low_priority=update.message.forward_origin is not None)
+        ADMISSIONS.labels(admission.decision.value).inc()
+        if admission.decision is Decision.REJECT:
+            logger.warning('Rejected message from chat %s (%s)', chat_id, admission.reason)
+            self.sender.enqueue(chat_id, self._admission_text(admission))
+            STAGE_SECONDS.labels("telegram_ingest").observe(time.perf_counter() - started)
+            return
+
         try:
-            await update.message.reply_text("Message received, processing...")
             cleaned_message = re.sub(r'\\', '', update.message.text_markdown_v2)
-            logger.info(f'Putting message from chat {chat_id} into input queue')
-            await self.input_queue.put((chat_id, cleaned_message))
-            logger.info(f'Message from chat {chat_id} added to input queue successfully')
+            item = (chat_id, cleaned_message, trace_id)
+            if admission.decision is Decision.DEFER:
+                self.admission.defer(chat_id, item)
+                logger.info('Deferred message from chat %s until the queue drains', chat_id)
+            else:
+                logger.debug('Putting message from chat %s into input queue', chat_id)
+                await self.input_queue.put(item)
+                logger.info('Message from chat %s added to input queue successfully', chat_id)
+            MESSAGES_RECEIVED.inc()
         except Exception as e:
-            logger.error(f'Error handling message from chat {chat_id}: {str(e)}')
-            await update.message.reply_text("Sorry, an error occurred while processing your message.")
+            STAGE_ERRORS.labels("telegram_ingest").inc()
+            await self.admission.release(chat_id)
+            logger.error('Error handling message from chat %s: %s', chat_id, e)
+            self.sender.enqueue(chat_id, "Sorry, an error occurred while processing your message.")
+            return
+        finally:
+            STAGE_SECONDS.labels("telegram_ingest").observe(time.perf_counter() - started)
+
+        # Replies share the flood limits with responses, so they go through the sender too.
+        # The message is queued already, so a failed acknowledgement is only logged by the sender
+        self.sender.enqueue(chat_id, self._admission_text(admission))
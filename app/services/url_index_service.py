@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import time
+from typing import Dict, Iterable, List
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class UrlIndexService:
+    """Redis index from normalized URLs to the link records already stored for them
+
+    Each URL maps to its link ID under `url_index:{sha1}`, with the same TTL
+    as the link so both expire together.
+
+    The optional Bloom filter saves a round-trip, not memory: lookups check
+    Redis bitmaps first and only read index keys for URLs that may have been
+    seen, so a batch of new URLs costs one pipeline instead of two. Each
+    bitmap takes `bloom_bits / 8` bytes on top of the index. Bits cannot be
+    cleared when an index entry expires, so the filter rotates instead.
+    URLs are added to the bitmap of the current `key_ttl`-long generation.
+    Lookups check the current and previous generations, which cover every
+    live index entry. Each bitmap expires two generations after it starts.
+    """
+
+    def __init__(
+        self,
+        redis,
+        key_ttl: int,
+        bloom_enabled: bool = settings.URL_BLOOM_ENABLED,
+        bloom_bits: int = settings.URL_BLOOM_BITS,
+        bloom_hashes: int = settings.URL_BLOOM_HASHES
+    ):
+        self.redis = redis
+        self.key_ttl = key_ttl
+        self.bloom_enabled = bloom_enabled
+        self.bloom_bits = int(bloom_bits)
+        self.bloom_hashes = min(int(bloom_hashes), 8)
+        self.bloom_key = "urls:bloom"
+
+    def _generation(self) -> int:
+        return int(time.time()) // int(self.key_ttl)
+
+    def _bloom_keys(self) -> List[str]:
+        """Bitmaps covering live index entries, current generation first"""
+        generation = self._generation()
+        return [f"{self.bloom_key}:{generation}", f"{self.bloom_key}:{generation - 1}"]
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return f"url_index:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+    def _bloom_offsets(self, url: str) -> List[int]:
+        digest = hashlib.sha256(url.encode("utf-8")).digest()
+        return [
+            int.from_bytes(digest[i * 4:(i + 1) * 4], "big") % self.bloom_bits
+            for i in range(self.bloom_hashes)
+        ]
+
+    async def lookup(self, urls: Iterable[str]) -> Dict[str, str]:
+        """Map each already-seen normalized URL to its link ID"""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+
+        if self.bloom_enabled:
+            keys = self._bloom_keys()
+            pipe = self.redis.pipeline(transaction=False)
+            for url in urls:
+                offsets = self._bloom_offsets(url)
+                for key in keys:
+                    for offset in offsets:
+                        pipe.getbit(key, offset)
+            bits = await pipe.execute()
+            width = self.bloom_hashes
+            urls = [
+                url for i, url in enumerate(urls)
+                if any(
+                    all(bits[(i * len(keys) + k) * width:(i * len(keys) + k + 1) * width])
+                    for k in range(len(keys))
+                )
+            ]
+            if not urls:
+                return {}
+
+        link_ids = await self.redis.mget([self._key(url) for url in urls])
+        return {url: link_id.decode() for url, link_id in zip(urls, link_ids) if link_id is not None}
+
+    def queue_add(self, pipe, url: str, link_id: str):
+        """Queue indexing a normalized URL under a new link ID"""
+        pipe.set(self._key(url), link_id, ex=self.key_ttl)
+        self._queue_bloom_add(pipe, url)
+
+    def queue_touch(self, pipe, url: str):
+        """Queue extending the index entry of a reused URL"""
+        pipe.expire(self._key(url), self.key_ttl)
+        self._queue_bloom_add(pipe, url)
+
+    def _queue_bloom_add(self, pipe, url: str):
+        """Queue setting a URL's bits in the current generation, which must outlive its index entry"""
+        if not self.bloom_enabled:
+            return
+        generation = self._generation()
+        key = f"{self.bloom_key}:{generation}"
+        for offset in self._bloom_offsets(url):
+            pipe.setbit(key, offset, 1)
+        pipe.expireat(key, (generation + 2) * int(self.key_ttl))
@@ -0,0 +1,52 @@
+import json
+import logging
+from typing import Any, Dict
+from app.celery import celery_app
+from app.core.config import settings
+from app.services.data_store_service import ProcessingStatus
+from app.tasks.runner import get_ai_service, get_data_store, run_async
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task(bind=True, max_retries=3, default_retry_delay=30)
+def analyze_company(self, company_id: str):
+    """Run the second-pass GPT analysis of a company over its fetched pages"""
+    data_store = get_data_store()
+    company = run_async(data_store.get_company(company_id))
+    if company is None:
+        logger.warning(f"Company {company_id} expired before analysis")
+        return
+
+    message = run_async(_build_analysis_input(company))
+    try:
+        analysis = run_async(get_ai_service().process_gpt("company_analysis", message))
+    except Exception as e:
+        if self.request.retries >= self.max_retries:
+            run_async(data_store.set_company_status(company_id, ProcessingStatus.FAILED, error=str(e)[:500]))
+        raise self.retry(exc=e) from e
+
+    if not isinstance(analysis, str):
+        analysis = json.dumps(analysis, ensure_ascii=False)
+    run_async(data_store.set_company_status(company_id, ProcessingStatus.COMPLETED, analysis=analysis))
+    logger.info(f"Stored analysis for company {company_id}")
+
+async def _build_analysis_input(company: Dict[str, Any]) -> str:
+    """Combine the company details and its extracted page contents into one message"""
+    data_store = get_data_store()
+    sections = [
+        f"Company: {company['name']}",
+        f"Summary: {company['summary']}",
+        f"Funding: {json.dumps(company['funding'], ensure_ascii=False)}",
+    ]
+    for link_id in company["link_ids"]:
+        link = await data_store.get_link(link_id)
+        page = await data_store.get_page(link_id)
+        if not link or not page or not page.get("text"):
+            continue
+        sections.append(
+            f"## {link['type']} ({link['url']})\n"
+            f"{page.get('title', '')}\n"
+            f"{page.get('description', '')}\n"
+            f"{page['text'][:settings.ANALYSIS_PAGE_CHARS]}"
+        )
+    return "\n\n".join(sections)
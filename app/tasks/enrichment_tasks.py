@@ -0,0 +1,66 @@
+import logging
+from typing import List
+from celery import chain, chord
+from app.celery import celery_app
+from app.core.config import settings
+from app.services.data_store_service import ProcessingStatus
+from app.services.scraper_service import extract_page_content
+from app.tasks.ai_tasks import analyze_company
+from app.tasks.runner import get_data_store, get_link_queue, get_scraper, run_async
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task
+def enrich_company(company_id: str):
+    """Fan out link fetching and extraction for a company in chunks, then analyze it"""
+    data_store = get_data_store()
+    company = run_async(data_store.get_company(company_id))
+    if company is None:
+        logger.warning(f"Company {company_id} expired before enrichment")
+        return
+
+    # Links shared with earlier mentions are already fetched or leased
+    link_ids = run_async(data_store.get_pending_link_ids(company["link_ids"]))
+    if not link_ids and company["processing_status"] == ProcessingStatus.COMPLETED.value:
+        logger.info(f"Company {company_id} is already enriched, skipping")
+        return
+
+    run_async(data_store.set_company_status(company_id, ProcessingStatus.IN_PROGRESS))
+
+    size = settings.ENRICHMENT_CHUNK_SIZE
+    header = [
+        chain(fetch_links.si(link_ids[i:i + size]), extract_pages.s())
+        for i in range(0, len(link_ids), size)
+    ]
+    logger.info(f"Enriching company {company_id}: {len(link_ids)} links in {len(header)} chunks")
+
+    if header:
+        chord(header)(analyze_company.si(company_id))
+    else:
+        analyze_company.delay(company_id)
+
+@celery_app.task
+def fetch_links(link_ids: List[str]) -> List[str]:
+    """Lease and fetch a chunk of links, returning the IDs fetched successfully"""
+    claimed = run_async(get_link_queue().claim_ids(link_ids))
+    if len(claimed) < len(link_ids):
+        logger.info(f"Skipping {len(link_ids) - len(claimed)} links already claimed elsewhere")
+    results = run_async(get_scraper().process_batch(claimed))
+    return [link_id for link_id, fetched in zip(claimed, results) if fetched]
+
+@celery_app.task
+def extract_pages(link_ids: List[str]) -> List[str]:
+    """Extract the title, description and text of fetched pages"""
+    data_store = get_data_store()
+    extracted = []
+    for link_id in link_ids:
+        try:
+            page = run_async(data_store.get_page(link_id))
+            if not page or not page.get("body"):
+                continue
+            content = extract_page_content(page["body"], page.get("content_type", ""))
+            run_async(data_store.update_page(link_id, content))
+            extracted.append(link_id)
+        except Exception as e:
+            logger.error(f"Error extracting page for link {link_id}: {str(e)}", exc_info=True)
+    return extracted
@@ -0,0 +1,39 @@
+import asyncio
+from functools import lru_cache
+from typing import Any, Coroutine, Optional
+from app.core.config import settings
+from app.services.ai_service import AIService
+from app.services.data_store_service import DataStoreService
+from app.services.link_queue_service import LinkQueueService
+from app.services.scraper_service import ScraperService
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def run_async(coro: Coroutine) -> Any:
+    """Run a coroutine on this worker process's event loop
+
+    The services keep Redis and HTTP connection pools bound to the loop they
+    were first used on, so each worker process reuses one loop for its lifetime.
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coro)
+
+@lru_cache
+def get_data_store() -> DataStoreService:
+    return DataStoreService(settings.REDIS_URL)
+
+@lru_cache
+def get_link_queue() -> LinkQueueService:
+    return LinkQueueService(settings.REDIS_URL)
+
+@lru_cache
+def get_scraper() -> ScraperService:
+    return ScraperService(get_data_store(), get_link_queue())
+
+@lru_cache
+def get_ai_service() -> AIService:
+    # Analysis tasks run one at a time, so waiting to batch them would only add latency
+    return AIService(None, None, batch_size=1)
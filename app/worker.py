@@ -0,0 +1,41 @@
+import asyncio
+import logging
+import signal
+from app.core.config import settings
+from app.core.metrics import configure_logging
+from app.services.ai_service import AIService
+from app.services.queue_service import create_queue
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+async def main():
+    """Run a standalone AI worker against the shared Redis Streams queues"""
+    if settings.QUEUE_BACKEND != "redis":
+        raise SystemExit("Standalone AI workers require QUEUE_BACKEND=redis")
+
+    input_queue = create_queue("input")
+    response_queue = create_queue("response")
+    ai_service = AIService(input_queue, response_queue)
+
+    # Stop taking messages on SIGTERM and finish the ones in progress
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, ai_service.stop_intake)
+
+    logger.info("Starting standalone AI worker")
+    await ai_service.process_messages("company_data")
+
+    deadline = loop.time() + float(settings.SHUTDOWN_DRAIN_SECONDS)
+    while not ai_service.idle and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+
+    # Hand what is still unfinished back to the queue for another worker
+    unfinished = ai_service.unfinished()
+    for item in unfinished:
+        await input_queue.put(item)
+    await ai_service.cancel_in_flight()
+    logger.info(f"AI worker stopped, requeued {len(unfinished)} unfinished messages")
+
+if __name__ == "__main__":
+    asyncio.run(main())
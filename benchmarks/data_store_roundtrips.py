@@ -0,0 +1,113 @@
+"""Compare Redis round-trips for sequential vs pipelined company data writes
+
+Runs DataStoreService against fakeredis (or a real Redis with --redis-url)
+and counts the packets sent to the server. The sequential mode replays the
+commands queued by the pipeline one round-trip each, the way
+store_company_data wrote before it was pipelined. The old code also sent
+two SADDs per link, so the sequential figure is a lower bound.
+
+    python -m benchmarks.data_store_roundtrips --companies 5 --links 8
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict
+
+from app.services.data_store_service import DataStoreService
+from app.services.company_index_service import CompanyIndexService
+from app.services.url_index_service import UrlIndexService
+
+LINK_TYPES = ["website", "deck", "whitepaper", "blog", "demo", "documentation", "data_room", "roadmap"]
+SOCIAL_TYPES = ["x", "linkedin", "discord", "telegram", "github", "youtube"]
+
+
+def make_extraction(companies: int, links: int, seed: str = "") -> Dict[str, Any]:
+    """Build a synthetic extraction with the given number of companies and links each"""
+    link_types = LINK_TYPES[:links]
+    social_types = SOCIAL_TYPES[:max(0, links - len(link_types))]
+    return {
+        "companies": [
+            {
+                "name": f"Company {i}",
+                "summary": f"Company {i} builds things.",
+                "funding": {"stage": "Seed", "amount": "$1.5m"},
+                "links": {t: {"link": f"https://example{seed}-{i}.com/{t}"} for t in link_types},
+                "socials": {t: f"https://{t}.com/company{seed}-{i}" for t in social_types},
+            }
+            for i in range(companies)
+        ],
+        "message": f"{companies} companies found",
+    }
+
+
+class RoundTripCounter:
+    """Count packets sent on every connection of a client, adding optional latency"""
+
+    def __init__(self, client, latency: float):
+        self.count = 0
+        connection_class = client.connection_pool.connection_class
+        counter = self
+
+        class CountingConnection(connection_class):
+            async def send_packed_command(self, *args, **kwargs):
+                counter.count += 1
+                if latency:
+                    await asyncio.sleep(latency)
+                return await super().send_packed_command(*args, **kwargs)
+
+        client.connection_pool.connection_class = CountingConnection
+
+
+async def run(mode: str, redis_url: str, companies: int, links: int, iterations: int, latency: float) -> Dict[str, Any]:
+    store = DataStoreService(redis_url or "redis://localhost:6379/0")
+    store.key_ttl = 3600
+    if not redis_url:
+        # fakeredis is a dev dependency, only needed without a real Redis
+        import fakeredis
+        store.redis = fakeredis.aioredis.FakeRedis()
+    store.url_index = UrlIndexService(store.redis, store.key_ttl)
+    store.company_index = CompanyIndexService(store.redis, store.key_ttl)
+    counter = RoundTripCounter(store.redis, latency)
+
+    # Fresh URLs per iteration, so no link is deduplicated against an earlier one
+    extractions = [make_extraction(companies, links, seed=f"{mode}{i}") for i in range(iterations)]
+    started = time.perf_counter()
+    for extraction in extractions:
+        if mode == "pipelined":
+            await store.store_company_data("bench", extraction)
+        else:
+            context = await store._resolve([extraction])
+            pipe = store.redis.pipeline(transaction=True)
+            store._queue_company_data(pipe, "bench", extraction, context)
+            for args, options in pipe.command_stack:
+                await store.redis.execute_command(*args, **options)
+    elapsed = time.perf_counter() - started
+    round_trips = counter.count
+
+    await store.redis.aclose()
+    return {
+        "mode": mode,
+        "round_trips_per_extraction": round_trips / iterations,
+        "ms_per_extraction": elapsed * 1000 / iterations,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", default="", help="Real Redis to use instead of fakeredis")
+    parser.add_argument("--companies", type=int, default=5)
+    parser.add_argument("--links", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="Simulated network latency per round-trip")
+    args = parser.parse_args()
+
+    results = [
+        await run(mode, args.redis_url, args.companies, args.links, args.iterations, args.latency_ms / 1000)
+        for mode in ("sequential", "pipelined")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
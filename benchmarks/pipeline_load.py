@@ -0,0 +1,363 @@
+"""Replay blurbs through the full message pipeline and report reply latency
+
+Wires the real TelegramService, AIService and ResponseHandlerService
+together with a fake OpenAI client, a fake Telegram bot and fakeredis
+(or a real Redis with --redis-url). Blurbs are fed to handle_message at a
+target rate, spread over a number of chats, and each one is tagged with a
+token that the fake OpenAI client copies into its function-call payload,
+so every reply can be matched to the message it answers.
+
+The fake client can also enforce an account rate limit (--account-tpm,
+--account-rpm), answering with 429s and x-ratelimit-* headers the way the
+API does, to check that requests are scheduled within the budget.
+
+    python -m benchmarks.pipeline_load --messages 500 --rate 50 --llm-latency-ms 800
+    python -m benchmarks.pipeline_load --account-tpm 60000 --tpm-limit 60000
+    python -m benchmarks.pipeline_load --corpus blurbs.txt --output results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import httpx
+import openai as openai_errors
+from redis import asyncio as aioredis
+
+from app.services.ai_service import AIService
+from app.services.company_index_service import CompanyIndexService
+from app.services.openai_client_service import OpenAIClientService
+from app.services.response_handler_service import ResponseHandlerService
+from app.services.telegram_sender_service import TelegramSenderService
+from app.services.telegram_service import TelegramService
+from app.services.url_index_service import UrlIndexService
+
+TOKEN_PATTERN = re.compile(r"BENCH(\d{6})")
+
+LINK_TYPES = ["website", "deck", "whitepaper", "blog", "demo", "documentation", "data_room", "roadmap"]
+
+DEFAULT_CORPUS = [
+    "Acme Labs is raising a $2m seed round on a SAFE at a $20m cap. Website: acme.xyz, deck attached.",
+    "Northwind is a restaking protocol raising $5m at a $60m FDV, 12 month cliff and 24 month vesting. "
+    "Backed by Paradigm. x.com/northwind",
+    "Two deals this week: Helio (payments for DAOs, pre-seed, $750k) and Quanta (ZK coprocessor, Series A, $12m).",
+    "Lumen builds on-chain credit scoring. $3m strategic round, token ratio 1:1, $1m committed so far. lumen.finance",
+]
+
+
+class FakeOpenAI:
+    """Stand-in for AsyncOpenAI returning canned function calls after a delay
+
+    With `tpm` or `rpm` set, requests over a model's limit within a
+    rolling minute are rejected with a 429, like the real API.
+    """
+
+    def __init__(self, latency: float, jitter: float, companies: int, links: int, tpm: int = 0, rpm: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.companies = companies
+        self.links = links
+        self.tpm = tpm
+        self.rpm = rpm
+        self.requests = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.models: Dict[str, int] = {}
+        self._windows: Dict[str, List[tuple]] = {}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self.create,
+            with_raw_response=SimpleNamespace(create=self.create_raw)
+        ))
+
+    def rate_limit_headers(self, model: str) -> Dict[str, str]:
+        """x-ratelimit-* headers for a model's rolling minute, raising a 429 when it is exhausted"""
+        now = time.monotonic()
+        window = self._windows[model] = [(at, tokens) for at, tokens in self._windows.get(model, []) if now - at < 60]
+        used_tokens = sum(tokens for _, tokens in window)
+        headers = {}
+        if self.tpm:
+            headers.update({
+                "x-ratelimit-limit-tokens": str(self.tpm),
+                "x-ratelimit-remaining-tokens": str(max(0, self.tpm - used_tokens)),
+                "x-ratelimit-reset-tokens": f"{60 - (now - window[0][0]) if window else 0:.3f}s",
+            })
+        if self.rpm:
+            headers.update({
+                "x-ratelimit-limit-requests": str(self.rpm),
+                "x-ratelimit-remaining-requests": str(max(0, self.rpm - len(window))),
+            })
+        if (self.tpm and used_tokens >= self.tpm) or (self.rpm and len(window) >= self.rpm):
+            self.rate_limited += 1
+            request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+            response = httpx.Response(429, request=request, headers=headers)
+            raise openai_errors.RateLimitError("Rate limit reached", response=response, body=None)
+        return headers
+
+    async def create_raw(self, **kwargs) -> Any:
+        headers = self.rate_limit_headers(kwargs.get("model", ""))
+        result = await self.create(**kwargs)
+        return SimpleNamespace(headers=headers, parse=lambda: result)
+
+    async def create(
+        self,
+        messages: List[Dict[str, str]],
+        functions: List[Dict[str, Any]],
+        stream: bool = False,
+        model: str = "",
+        **kwargs
+    ) -> Any:
+        self.requests += 1
+        self.models[model] = self.models.get(model, 0) + 1
+        latency = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if not stream:
+            await asyncio.sleep(latency)
+        tokens = [match.group(0) for match in TOKEN_PATTERN.finditer(messages[-1]["content"])] or ["BENCH------"]
+        if functions[0]["name"].endswith("_batch"):
+            arguments = {"extractions": [{"index": i, **self.payload(token)} for i, token in enumerate(tokens)]}
+        else:
+            arguments = self.payload(tokens[0])
+        arguments = json.dumps(arguments)
+
+        # Roughly four characters per token
+        usage = SimpleNamespace(
+            prompt_tokens=sum(len(message["content"]) for message in messages) // 4,
+            completion_tokens=len(arguments) // 4
+        )
+        self.prompt_tokens += usage.prompt_tokens
+        self._windows.setdefault(model, []).append((time.monotonic(), usage.prompt_tokens + usage.completion_tokens))
+        if stream:
+            return self.stream(arguments, usage, latency)
+        message = SimpleNamespace(function_call=SimpleNamespace(arguments=arguments), content=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    async def stream(self, arguments: str, usage: Any, latency: float, chunk_size: int = 16):
+        """Yield the arguments in chunks spread evenly over the request latency"""
+        chunks = [arguments[i:i + chunk_size] for i in range(0, len(arguments), chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            delta = SimpleNamespace(function_call=SimpleNamespace(arguments=chunk), content=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    def payload(self, token: str) -> Dict[str, Any]:
+        """Function-call arguments shaped like the company_data schema"""
+        return {
+            "companies": [
+                {
+                    "name": f"Company {token} {i}",
+                    "summary": "Builds infrastructure for on-chain payments.",
+                    "funding": {"stage": "Seed", "amount": "$2m", "investors": "Paradigm"},
+                    "links": {
+                        link_type: {"link": f"https://{token.lower()}-{i}.example.com/{link_type}"}
+                        for link_type in LINK_TYPES[:self.links]
+                    },
+                    "socials": {},
+                }
+                for i in range(self.companies)
+            ],
+            "message": f"Found {self.companies} companies ({token})",
+        }
+
+
+class FakeBot:
+    """Stand-in for the Telegram bot recording when each tagged reply arrives"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.replied_at: Dict[int, float] = {}
+        self.sends = 0
+
+    async def send_message(self, chat_id: int, text: str):
+        self.sends += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        now = time.perf_counter()
+        for match in TOKEN_PATTERN.finditer(text):
+            self.replied_at.setdefault(int(match.group(1)), now)
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.text_markdown_v2 = text
+        self.forward_origin = None
+
+    async def reply_text(self, text: str):
+        pass
+
+
+def load_corpus(path: Optional[str]) -> List[str]:
+    """Blurbs from a text file separated by blank lines, or the built-in corpus"""
+    if not path:
+        return DEFAULT_CORPUS
+    with open(path, encoding="utf-8") as f:
+        blurbs = [blurb.strip() for blurb in f.read().split("\n\n")]
+    return [blurb for blurb in blurbs if blurb]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def use_redis(data_store, client):
+    """Point a DataStoreService and its indexes at another Redis client"""
+    data_store.redis = client
+    data_store.url_index = UrlIndexService(client, data_store.key_ttl)
+    data_store.company_index = CompanyIndexService(client, data_store.key_ttl)
+
+
+async def run(args) -> Dict[str, Any]:
+    random.seed(args.seed)
+    if args.redis_url:
+        redis = aioredis.from_url(args.redis_url)
+    else:
+        # fakeredis is a dev dependency, only needed without a real Redis
+        import fakeredis
+        redis = fakeredis.aioredis.FakeRedis()
+    input_queue: asyncio.Queue = asyncio.Queue()
+    response_queue: asyncio.Queue = asyncio.Queue()
+
+    # Real services, with only the network clients replaced
+    bot = FakeBot(args.telegram_latency_ms / 1000)
+    telegram_service = TelegramService("bench", input_queue, response_queue)
+    telegram_service.application = SimpleNamespace(bot=bot)
+    telegram_service.sender = TelegramSenderService(
+        telegram_service._send_message,
+        global_rate=args.global_rate,
+        chat_rate=args.chat_rate
+    )
+
+    openai = FakeOpenAI(
+        args.llm_latency_ms / 1000, args.llm_jitter_ms / 1000, args.companies, args.links,
+        tpm=args.account_tpm, rpm=args.account_rpm
+    )
+    ai_service = AIService(
+        input_queue,
+        response_queue,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        batch_window_ms=args.batch_window_ms,
+        streaming=args.stream
+    )
+    ai_service.openai = OpenAIClientService(
+        model="bench-model",
+        fallback_model=args.fallback_model,
+        tpm_limit=args.tpm_limit,
+        rpm_limit=args.rpm_limit
+    )
+    ai_service.model = ai_service.openai.model
+    ai_service.openai.client = openai
+    if ai_service.cache is not None:
+        ai_service.cache.redis = redis
+
+    response_handler = ResponseHandlerService(response_queue, telegram_service)
+    use_redis(response_handler.data_store, redis)
+
+    ai_task = asyncio.create_task(ai_service.process_messages("company_data"))
+    await response_handler.start()
+
+    # Replay the corpus at the target rate
+    corpus = load_corpus(args.corpus)
+    received_at: Dict[int, float] = {}
+    handlers = []
+    started = time.perf_counter()
+    for n in range(args.messages):
+        delay = started + n / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        chat_id = 1000 + n % args.chats
+        update = SimpleNamespace(
+            effective_chat=SimpleNamespace(id=chat_id),
+            message=FakeMessage(f"{corpus[n % len(corpus)]} BENCH{n:06d}")
+        )
+        received_at[n] = time.perf_counter()
+        handlers.append(asyncio.create_task(telegram_service.handle_message(update, None)))
+    sent_in = time.perf_counter() - started
+
+    # Wait for every reply, or give up after the timeout
+    deadline = time.perf_counter() + args.timeout
+    while len(bot.replied_at) < args.messages and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    finished = max(bot.replied_at.values(), default=time.perf_counter())
+
+    ai_task.cancel()
+    await asyncio.gather(ai_task, *handlers, return_exceptions=True)
+    await response_handler.stop()
+    await telegram_service.sender.stop()
+    ai_stats = ai_service.get_stats()
+    await redis.aclose()
+
+    latencies = [
+        (bot.replied_at[n] - received_at[n]) * 1000
+        for n in received_at if n in bot.replied_at
+    ]
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "messages": args.messages,
+        "replied": len(latencies),
+        "dropped": args.messages - len(latencies),
+        "offered_rate": round(args.messages / sent_in, 2) if sent_in else None,
+        "throughput": round(len(latencies) / (finished - started), 2) if latencies else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(max(latencies, default=0.0), 1),
+        },
+        "openai_requests": openai.requests,
+        "openai_prompt_tokens": openai.prompt_tokens,
+        "openai_429s": openai.rate_limited,
+        "openai_models": openai.models,
+        "telegram_sends": bot.sends,
+        "ai": ai_stats,
+        "sender": dict(telegram_service.sender.stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", default="", help="Real Redis to use instead of fakeredis")
+    parser.add_argument("--corpus", default="", help="Text file of blurbs separated by blank lines")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20, help="Messages per second to offer")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="AIService worker pool size")
+    parser.add_argument("--batch-size", type=int, default=1, help="Messages per OpenAI request")
+    parser.add_argument("--batch-window-ms", type=float, default=150)
+    parser.add_argument("--stream", action="store_true", help="Stream completions and reply per company")
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--account-tpm", type=int, default=0, help="Tokens per minute the fake API allows (0: no limit)")
+    parser.add_argument("--account-rpm", type=int, default=0, help="Requests per minute the fake API allows (0: no limit)")
+    parser.add_argument("--tpm-limit", type=int, default=10000000, help="Tokens per minute budget of the client")
+    parser.add_argument("--rpm-limit", type=int, default=100000, help="Requests per minute budget of the client")
+    parser.add_argument("--fallback-model", default="", help="Model to use when the budget is exhausted")
+    parser.add_argument("--telegram-latency-ms", type=float, default=30)
+    parser.add_argument("--companies", type=int, default=2, help="Companies per canned reply")
+    parser.add_argument("--links", type=int, default=3, help="Links per canned company")
+    parser.add_argument("--global-rate", type=float, default=30, help="Telegram sends per second overall")
+    parser.add_argument("--chat-rate", type=float, default=1, help="Telegram sends per second per chat")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for outstanding replies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Compare record codecs and the single-parse response path
+
+Stores the same synthetic extractions with each RECORD_CODEC, then
+reports the CPU time to write and read them back through
+DataStoreService and the Redis memory taken by the company and link
+records. Memory comes from MEMORY USAGE with a real Redis (--redis-url);
+fakeredis does not implement it, so the raw field and value sizes are
+reported instead. Codecs whose package is not installed are skipped.
+
+It also times formatting a reply the old way, with the response
+serialized and parsed at each hop, against parsing it once and
+formatting it at the edge.
+
+    python -m benchmarks.record_codec --companies 2000
+    python -m benchmarks.record_codec --redis-url redis://localhost:6379/15
+
+The database given with --redis-url is flushed before each codec.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from redis import asyncio as aioredis
+
+from app.core.codec import CODECS, RecordCodec
+from app.services.data_store_service import DataStoreService
+from benchmarks.pipeline_load import FakeOpenAI, use_redis
+
+
+def make_extractions(count: int, per_message: int, links: int) -> List[Dict[str, Any]]:
+    """Function-call payloads shaped like the company_data schema"""
+    fake = FakeOpenAI(0, 0, per_message, links)
+    extractions = []
+    for n in range(0, count, per_message):
+        payload = fake.payload(f"BENCH{n:06d}")
+        for company in payload["companies"]:
+            company["funding"]["valuation"] = f"${random.randint(5, 200)}m"
+        extractions.append(payload)
+    return extractions
+
+
+async def key_sizes(redis, pattern: str, real: bool) -> int:
+    """Bytes used by the hashes matching a pattern"""
+    total = 0
+    async for key in redis.scan_iter(match=pattern, count=1000):
+        if b":" in key[len(pattern) - 1:]:
+            continue  # company:{id}:link_ids and similar sets
+        if real:
+            total += await redis.memory_usage(key) or 0
+        else:
+            total += sum(len(field) + len(value) for field, value in (await redis.hgetall(key)).items())
+    return total
+
+
+async def run_codec(name: str, redis, extractions: List[Dict[str, Any]], real: bool) -> Dict[str, Any]:
+    await redis.flushdb()
+    store = DataStoreService("redis://localhost")
+    use_redis(store, redis)
+    store.codec = RecordCodec(name)
+
+    started = time.process_time()
+    company_ids = [company_id for ids in await store.store_many(
+        [("1000", extraction) for extraction in extractions]
+    ) for company_id in ids]
+    stored = time.process_time() - started
+
+    started = time.process_time()
+    companies = await asyncio.gather(*(store.get_company(company_id) for company_id in company_ids))
+    link_ids = [link_id for company in companies for link_id in company["link_ids"]]
+    await asyncio.gather(*(store.get_link(link_id) for link_id in link_ids))
+    read = time.process_time() - started
+
+    company_bytes = await key_sizes(redis, "company:*", real)
+    link_bytes = await key_sizes(redis, "link:*", real)
+    return {
+        "companies": len(company_ids),
+        "links": len(link_ids),
+        "store_cpu_s": round(stored, 3),
+        "read_cpu_s": round(read, 3),
+        "company_bytes": round(company_bytes / len(company_ids), 1),
+        "link_bytes": round(link_bytes / len(link_ids), 1) if link_ids else 0.0,
+    }
+
+
+def response_path(extractions: List[Dict[str, Any]], repeat: int) -> Dict[str, float]:
+    """CPU seconds to turn function arguments into a Telegram reply, before and after"""
+    arguments = [json.dumps(extraction) for extraction in extractions]
+
+    started = time.process_time()
+    for _ in range(repeat):
+        for text in arguments:
+            response = json.dumps(json.loads(text))                   # AIService._validated
+            data = json.loads(response)                               # ResponseHandlerService
+            data["company_ids"] = []
+            response = json.dumps(data, indent=2)
+            json.dumps(json.loads(response), indent=2, ensure_ascii=False)  # TelegramService
+    reparsed = time.process_time() - started
+
+    started = time.process_time()
+    for _ in range(repeat):
+        for text in arguments:
+            data = json.loads(text)
+            json.dumps({**data, "company_ids": []}, indent=2, ensure_ascii=False)
+    single = time.process_time() - started
+
+    count = len(arguments) * repeat
+    return {
+        "reparsed_us": round(reparsed / count * 1e6, 1),
+        "single_parse_us": round(single / count * 1e6, 1),
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    random.seed(args.seed)
+    extractions = make_extractions(args.companies, args.per_message, args.links)
+    if args.redis_url:
+        redis = aioredis.from_url(args.redis_url)
+    else:
+        # fakeredis is a dev dependency, only needed without a real Redis
+        import fakeredis
+        redis = fakeredis.aioredis.FakeRedis()
+
+    codecs: Dict[str, Any] = {}
+    for name in args.codecs or CODECS:
+        try:
+            RecordCodec(name)
+        except RuntimeError as e:
+            codecs[name] = {"skipped": str(e)}
+            continue
+        codecs[name] = await run_codec(name, redis, extractions, bool(args.redis_url))
+    await redis.aclose()
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "memory": "MEMORY USAGE" if args.redis_url else "field and value bytes",
+        "codecs": codecs,
+        "response_path": response_path(extractions, args.repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", default="", help="Real Redis database to use instead of fakeredis")
+    parser.add_argument("--codecs", nargs="*", choices=CODECS, help="Codecs to compare (default: all)")
+    parser.add_argument("--companies", type=int, default=1000)
+    parser.add_argument("--per-message", type=int, default=2, help="Companies per extraction")
+    parser.add_argument("--links", type=int, default=3, help="Links per company")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the extractions for the response path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measure ScraperService throughput against a local HTTP stand-in server
+
+Starts a threaded HTTP server on localhost that serves pages with a
+configurable latency and size. It seeds pending links across a few
+hostnames that all resolve to that server, then claims and fetches them
+in batches. Redis is fakeredis unless --redis-url is given.
+
+    python -m benchmarks.scraper_throughput --links 500 --latency-ms 50
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+from app.services.data_store_service import DataStoreService
+from app.services.link_queue_service import LinkQueueService
+from app.services.company_index_service import CompanyIndexService
+from app.services.url_index_service import UrlIndexService
+from app.services.scraper_service import ScraperService
+
+# Distinct hostnames for the same loopback server, to exercise per-host limits
+HOSTS = ["127.0.0.1", "localhost", "127.0.0.2", "127.0.0.3"]
+
+
+def start_server(latency: float, page_bytes: int) -> ThreadingHTTPServer:
+    """Serve HTML pages of `page_bytes` after `latency` seconds, and 404 under /missing"""
+    body = (b"<html><body>" + b"x" * page_bytes + b"</body></html>")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path.startswith("/missing"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(args) -> Dict[str, Any]:
+    server = start_server(args.latency_ms / 1000, args.page_bytes)
+    port = server.server_address[1]
+
+    data_store = DataStoreService(args.redis_url or "redis://localhost:6379/0")
+    data_store.key_ttl = 3600
+    if not args.redis_url:
+        # fakeredis is a dev dependency, only needed without a real Redis
+        import fakeredis
+        data_store.redis = fakeredis.aioredis.FakeRedis()
+    data_store.url_index = UrlIndexService(data_store.redis, data_store.key_ttl)
+    data_store.company_index = CompanyIndexService(data_store.redis, data_store.key_ttl)
+
+    # Seed pending links, with a share of them failing
+    extraction = {"companies": [{
+        "name": f"Company {i}",
+        "summary": "",
+        "links": {"website": {"link": (
+            f"http://{HOSTS[i % len(HOSTS)]}:{port}/{'missing' if i % 10 == 9 else 'page'}/{i}"
+        )}},
+    } for i in range(args.links)]}
+    await data_store.store_company_data("bench", extraction)
+
+    link_queue = LinkQueueService(args.redis_url or "redis://localhost:6379/0")
+    if not args.redis_url:
+        link_queue.redis = data_store.redis
+    scraper = ScraperService(
+        data_store,
+        link_queue,
+        concurrency=args.concurrency,
+        per_host=args.per_host,
+        host_delay=args.host_delay_ms / 1000,
+        batch_size=args.batch_size,
+        allow_private=True
+    )
+    started = time.perf_counter()
+    while link_ids := await link_queue.claim(scraper.batch_size):
+        await scraper.process_batch(link_ids)
+    elapsed = time.perf_counter() - started
+
+    await scraper.close()
+    server.shutdown()
+    return {
+        **scraper.get_stats(),
+        "links": args.links,
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", default="", help="Real Redis to use instead of fakeredis")
+    parser.add_argument("--links", type=int, default=400)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--page-bytes", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--host-delay-ms", type=float, default=0)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+
+# Settings reads these at import time and has no defaults for them
+for name, value in {
+    "PROJECT_NAME": "alphaminer",
+    "DEBUG": "False",
+    "REDIS_URL": "redis://localhost:6379/0",
+    "REDIS_MAX_MEMORY": "256mb",
+    "REDIS_MAX_MEMORY_POLICY": "allkeys-lru",
+    "REDIS_KEY_TTL": "86400",
+    "TELEGRAM_TOKEN": "",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,81 @@
+import asyncio
+
+import fakeredis
+
+from app.core.admission import AdmissionController, Decision
+from app.services.queue_service import RedisStreamQueue
+
+
+def make_queue(server: fakeredis.FakeServer, consumer: str) -> RedisStreamQueue:
+    queue = RedisStreamQueue("redis://localhost", "input", consumer=consumer, block_ms=10, size_ttl=0)
+    queue.redis = fakeredis.aioredis.FakeRedis(server=server)
+    return queue
+
+
+def test_admission_sees_messages_drained_by_a_separate_worker():
+    async def run():
+        server = fakeredis.FakeServer()
+        web = make_queue(server, "web")
+        worker = make_queue(server, "worker")
+        admission = AdmissionController(web, max_size=10, soft_limit=5, chat_quota=100, defer_size=10)
+
+        for n in range(10):
+            assert (await admission.admit(1)).decision is Decision.ACCEPT
+            await web.put((1, f"message {n}", "trace"))
+        assert (await admission.admit(1)).decision is Decision.REJECT
+
+        for _ in range(10):
+            await worker.get()
+            worker.task_done()
+        assert (await admission.admit(1)).decision is Decision.ACCEPT
+
+    asyncio.run(run())
+
+
+def test_deferred_items_are_released_once_a_separate_worker_drains_the_queue():
+    async def run():
+        server = fakeredis.FakeServer()
+        web = make_queue(server, "web")
+        worker = make_queue(server, "worker")
+        admission = AdmissionController(web, max_size=10, soft_limit=5, chat_quota=100, defer_size=10)
+
+        for n in range(5):
+            await web.put((1, f"message {n}", "trace"))
+        decision = await admission.admit(2, low_priority=True)
+        assert decision.decision is Decision.DEFER
+        admission.defer(2, (2, "forwarded", "trace"))
+
+        releaser = asyncio.create_task(admission.release_deferred(poll_interval=0.01))
+        for _ in range(5):
+            await worker.get()
+            worker.task_done()
+        await asyncio.sleep(0.05)
+        releaser.cancel()
+
+        assert admission.deferred == 0
+        assert await worker.get() == (2, "forwarded", "trace")
+
+    asyncio.run(run())
+
+
+def test_chat_quota_is_shared_by_processes_admitting_to_the_same_stream():
+    async def run():
+        server = fakeredis.FakeServer()
+        web = make_queue(server, "web")
+        other = make_queue(server, "other-web")
+        first = AdmissionController(web, max_size=100, soft_limit=50, chat_quota=3, defer_size=10)
+        second = AdmissionController(other, max_size=100, soft_limit=50, chat_quota=3, defer_size=10)
+
+        assert (await first.admit(1)).decision is Decision.ACCEPT
+        assert (await second.admit(1)).decision is Decision.ACCEPT
+        assert (await first.admit(1)).decision is Decision.ACCEPT
+        rejected = await second.admit(1)
+        assert rejected.decision is Decision.REJECT and rejected.reason == "chat_quota"
+        assert rejected.position == 3
+        assert (await second.admit(2)).decision is Decision.ACCEPT
+
+        # A reply completed by one process frees the slot for the other
+        await first.completed(1)
+        assert (await second.admit(1)).decision is Decision.ACCEPT
+
+    asyncio.run(run())
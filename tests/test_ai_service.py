@@ -0,0 +1,131 @@
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import fakeredis
+
+from app.services.ai_service import AIService
+from app.services.llm_cache_service import LLMCacheService
+
+
+def extraction(name: str) -> dict:
+    return {
+        "companies": [{
+            "name": name,
+            "summary": "Builds infrastructure for on-chain payments.",
+            "funding": {"stage": "Seed", "amount": "$2m", "investors": "Paradigm"},
+            "links": {"website": {"link": f"https://{name.lower()}.example.com"}},
+            "socials": {},
+        }],
+        "message": f"Found {name}",
+    }
+
+
+class FakeOpenAI:
+    """Stand-in for OpenAIClientService, answering with `answer(messages)` from `served_by`"""
+
+    def __init__(self, answer, model: str = "primary"):
+        self.model = model
+        self.served_by = model
+        self.answer = answer
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def create(self, messages, stream=False, **kwargs):
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            arguments = json.dumps(self.answer(messages[-1]["content"]))
+        finally:
+            self.active -= 1
+        message = SimpleNamespace(function_call=SimpleNamespace(arguments=arguments), content=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None), self.served_by
+
+    def get_stats(self):
+        return {}
+
+
+def make_service(answer, cache: bool = False, **kwargs) -> AIService:
+    service = AIService(None, None, **kwargs)
+    service.openai = FakeOpenAI(answer)
+    service.model = service.openai.model
+    service.cache = None
+    if cache:
+        service.cache = LLMCacheService("redis://localhost")
+        service.cache.redis = fakeredis.aioredis.FakeRedis()
+    return service
+
+
+def test_results_from_the_fallback_model_are_not_cached():
+    async def run():
+        service = make_service(lambda content: extraction("Acme"), cache=True)
+
+        service.openai.served_by = "fallback"
+        assert (await service.process_gpt("company_data", "Acme raised $2m"))["message"] == "Found Acme"
+        assert await service.cache.redis.keys("llm_cache:*") == []
+
+        service.openai.served_by = "primary"
+        await service.process_gpt("company_data", "Acme raised $2m")
+        await service.process_gpt("company_data", "Acme raised $2m")
+        assert service.openai.requests == 2
+        assert len(await service.cache.redis.keys("llm_cache:*")) == 1
+
+    asyncio.run(run())
+
+
+def batch_messages(content: str) -> list:
+    """The messages of a batched request, by index"""
+    return re.findall(r'<message index="\d+">\n(.*?)\n</message>', content, re.S)
+
+
+def test_single_fallbacks_after_a_failed_batch_respect_the_concurrency():
+    async def run():
+        def answer(content):
+            if batch_messages(content):
+                raise ValueError("Batch rejected")
+            return extraction(re.search(r"Company\d+", content).group(0))
+
+        service = make_service(answer, concurrency=1, batch_size=4, batch_window_ms=50)
+        results = await asyncio.gather(*(
+            service.process_gpt("company_data", f"Message about Company{n}") for n in range(4)
+        ))
+
+        assert [result["message"] for result in results] == [f"Found Company{n}" for n in range(4)]
+        assert service.openai.requests == 5
+        assert service.openai.max_active == 1
+        assert service.batch_stats["fallbacks"] == 4
+
+    asyncio.run(run())
+
+
+def test_batch_answers_with_missing_or_duplicate_indexes_fall_back_per_message():
+    async def run():
+        def answer(content):
+            if not batch_messages(content):
+                return extraction("Single " + re.search(r"Company\d+", content).group(0))
+            return {"extractions": [
+                {"index": 0, **extraction("Company0")},
+                {"index": 0, **extraction("Duplicate")},  # A second answer for message 0
+                {"index": 1, **extraction("Company1")},
+                {"index": 7, **extraction("Nowhere")},  # No such message
+                {**extraction("Company2")},  # Missing its index
+            ]}
+
+        service = make_service(answer, batch_size=4, batch_window_ms=50)
+        results = await asyncio.gather(*(
+            service.process_gpt("company_data", f"Message about Company{n}") for n in range(4)
+        ))
+
+        assert [result["message"] for result in results] == [
+            "Found Company0", "Found Company1", "Found Single Company2", "Found Single Company3",
+        ]
+        assert all("index" not in result for result in results)
+        assert service.openai.requests == 3
+        assert service.batch_stats["batches"] == 1
+        assert service.batch_stats["fallbacks"] == 2
+
+    asyncio.run(run())
@@ -0,0 +1,45 @@
+from app.services.company_index_service import CompanyIndexService, merge_funding, normalize_company_name
+
+
+def test_company_keys_normalize_names_and_skip_shared_domains():
+    assert CompanyIndexService.company_keys({
+        "name": "Acmé Labs, Inc.",
+        "links": {"website": {"link": "https://www.acme.io/about"}},
+    }) == ("acme labs", "acme.io")
+    assert CompanyIndexService.company_keys({
+        "name": "Acme",
+        "links": {"website": {"link": "https://linktr.ee/acme"}},
+    }) == ("acme", "")
+    # A legal suffix alone is the name
+    assert normalize_company_name("Company") == "company"
+
+
+def test_resolve_prefers_the_domain_then_a_compatible_name():
+    by_domain = {"acme.io": "by-domain"}
+    by_name = {"acme": ("by-name", "acme.com"), "nodomain": ("no-domain", "")}
+    resolve = CompanyIndexService.resolve
+
+    # The domain wins over a name pointing elsewhere
+    assert resolve(by_domain, by_name, "acme", "acme.io") == "by-domain"
+    assert resolve(by_domain, by_name, "renamed", "acme.io") == "by-domain"
+    # A name matches when the domains agree or either side has none
+    assert resolve(by_domain, by_name, "acme", "acme.com") == "by-name"
+    assert resolve(by_domain, by_name, "acme", "") == "by-name"
+    assert resolve(by_domain, by_name, "nodomain", "nodomain.xyz") == "no-domain"
+    # The same name on another domain is another company
+    assert resolve(by_domain, by_name, "acme", "acme.org") is None
+    assert resolve(by_domain, by_name, "unknown", "") is None
+
+
+def test_merge_funding_fills_gaps_and_combines_investors():
+    existing = {"amount": "$5m", "round": "", "investors": "Alpha Ventures, beta capital"}
+    new = {"amount": "$7m", "round": "Seed", "valuation": "", "investors": "Beta Capital, Gamma"}
+
+    assert merge_funding(existing, new) == {
+        "amount": "$5m",
+        "round": "Seed",
+        "investors": "Alpha Ventures, beta capital, Gamma",
+    }
+    assert existing["round"] == ""
+    assert merge_funding(None, {"amount": "$1m"}) == {"amount": "$1m"}
+    assert merge_funding({"amount": "$1m"}, None) == {"amount": "$1m"}
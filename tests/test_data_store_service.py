@@ -0,0 +1,124 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from app.core.codec import RecordCodec
+from app.services.company_index_service import CompanyIndexService
+from app.services.data_store_service import DataStoreService
+from app.services.url_index_service import UrlIndexService
+
+
+def make_store() -> DataStoreService:
+    store = DataStoreService("redis://localhost")
+    store.redis = fakeredis.aioredis.FakeRedis()
+    store.key_ttl = 3600
+    store.url_index = UrlIndexService(store.redis, store.key_ttl)
+    store.company_index = CompanyIndexService(store.redis, store.key_ttl)
+    return store
+
+
+def company(name: str, **links) -> dict:
+    return {
+        "name": name,
+        "summary": f"{name} summary",
+        "links": {link_type: {"link": url} for link_type, url in links.items()},
+    }
+
+
+def test_malformed_urls_do_not_abort_the_extraction():
+    async def run():
+        store = make_store()
+        ids = await store.store_company_data("1", {"companies": [
+            company("Acme", website="https://bad.com:abc", deck="http://[abc/", blog="https://acme.io/blog"),
+        ]})
+        assert len(ids) == 1
+        record = await store.get_company(ids[0])
+        links = [await store.get_link(link_id) for link_id in record["link_ids"]]
+        assert sorted(link["url"] for link in links) == ["http://[abc/", "https://acme.io/blog", "https://bad.com:abc"]
+
+        # Stored again, the same malformed URLs reuse their links
+        again = await store.store_company_data("1", {"companies": [company("Acme", website="https://bad.com:abc")]})
+        assert again == ids
+
+    asyncio.run(run())
+
+
+def test_packed_codecs_keep_links_on_the_hash_layout():
+    async def run():
+        store = make_store()
+        store.codec = RecordCodec("orjson")
+        ids = await store.store_company_data("1", {"companies": [company("Acme", website="https://acme.io")]})
+
+        company_hash = await store.redis.hgetall(f"company:{ids[0]}")
+        assert b"_oj" in company_hash and b"name" not in company_hash
+
+        record = await store.get_company(ids[0])
+        link_id = record["link_ids"][0]
+        link_hash = await store.redis.hgetall(f"link:{link_id}")
+        assert b"_oj" not in link_hash
+        assert link_hash[b"url"] == b"https://acme.io"
+        assert (await store.get_link(link_id))["company_id"] == ids[0]
+
+    asyncio.run(run())
+
+
+def test_page_index_pages_through_tied_scores_without_gaps_or_repeats():
+    async def run():
+        store = make_store()
+        # Seven members share a score, spanning several pages of three
+        await store.redis.zadd("index:test", {**{f"tied-{n}": 100 for n in range(7)}, "newer": 200, "older": 50})
+        expected = [member.decode() for member in await store.redis.zrevrange("index:test", 0, -1)]
+
+        pages, cursor = [], None
+        while True:
+            members, cursor = await store.page_index("index:test", cursor, limit=3)
+            pages.append(members)
+            if cursor is None:
+                break
+            # Entries added at the top do not shift the following pages
+            await store.redis.zadd("index:test", {f"added-{len(pages)}": 300})
+
+        assert [len(page) for page in pages] == [3, 3, 3]
+        assert [member for page in pages for member in page] == expected
+
+    asyncio.run(run())
+
+
+def test_page_index_rejects_malformed_cursors():
+    async def run():
+        store = make_store()
+        for cursor in ("100", "abc:member", "100:"):
+            with pytest.raises(ValueError):
+                await store.page_index("index:test", cursor)
+
+    asyncio.run(run())
+
+
+def test_companies_resolve_by_domain_before_name():
+    async def run():
+        store = make_store()
+        first = await store.store_company_data("1", {"companies": [
+            {**company("Acme", website="https://acme.io"), "funding": {"amount": "$5m", "investors": "Alpha"}},
+            company("Globex", website="https://globex.com"),
+        ]})
+        second = await store.store_company_data("2", {"companies": [
+            # Renamed, on the same domain
+            {**company("Acme Labs Inc", website="https://www.acme.io/"), "funding": {"round": "Seed", "investors": "Beta, alpha"}},
+            # Same name, no domain of its own
+            company("Globex", blog="https://medium.com/globex"),
+            # Same name on another domain
+            company("Globex", website="https://globex.org"),
+        ]})
+
+        assert second[:2] == first
+        assert second[2] not in first
+
+        acme = await store.get_company(first[0])
+        assert acme["name"] == "Acme"
+        assert acme["mentions"] == "2"
+        assert acme["funding"] == {"amount": "$5m", "investors": "Alpha, Beta", "round": "Seed"}
+        assert (await store.get_company(first[1]))["mentions"] == "2"
+        assert (await store.get_company(second[2]))["domain"] == "globex.org"
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+import json
+
+from app.core.json_stream import JsonArrayStream
+
+DOCUMENT = {
+    "summary": "Quotes \" and braces { [ in a string",
+    "companies": [
+        {"name": "Acme \"Labs\"", "summary": "Builds {widgets} and [gadgets]", "links": {"website": {"link": "https://acme.io"}}},
+        {"name": "Back\\slash", "summary": "Ends with a backslash \\", "funding": {"amount": "$5m"}},
+        {"name": "Ünïcode", "summary": "Escaped é and \n newlines"},
+    ],
+    "notes": [{"name": "Not a company"}],
+}
+
+
+def stream_items(chunks):
+    stream = JsonArrayStream("companies")
+    items = [item for chunk in chunks for item in stream.feed(chunk)]
+    return stream, items
+
+
+def test_items_are_returned_whatever_the_chunk_boundaries():
+    text = json.dumps(DOCUMENT)
+    for size in (1, 2, 3, 7, 64, len(text)):
+        stream, items = stream_items([text[i:i + size] for i in range(0, len(text), size)])
+        assert items == DOCUMENT["companies"], size
+        assert stream.count == 3
+        assert stream.text == text
+
+
+def test_chunks_split_inside_escape_sequences():
+    text = json.dumps(DOCUMENT, ensure_ascii=True)
+    # Split right after each backslash, so escapes straddle two chunks
+    chunks, start = [], 0
+    for i, char in enumerate(text):
+        if char == "\\":
+            chunks.append(text[start:i + 1])
+            start = i + 1
+    chunks.append(text[start:])
+
+    _, items = stream_items(chunks)
+    assert items == DOCUMENT["companies"]
+
+
+def test_each_item_is_returned_once_its_closing_brace_arrives():
+    stream = JsonArrayStream("companies")
+    assert stream.feed('{"companies": [{"name": "A"}, {"name": ') == [{"name": "A"}]
+    assert stream.feed('"B"') == []
+    assert stream.feed('}') == [{"name": "B"}]
+    assert stream.feed(']}') == []
+
+
+def test_arrays_under_other_keys_and_nested_arrays_are_ignored():
+    stream = JsonArrayStream("companies")
+    items = stream.feed(json.dumps({
+        "other": [{"name": "Skip"}],
+        "companies": [{"name": "Keep", "tags": [{"name": "nested"}]}],
+    }))
+    assert items == [{"name": "Keep", "tags": [{"name": "nested"}]}]
@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.openai_client_service import OpenAIClientService
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.models = []
+        self.with_raw_response = self
+
+    async def create(self, model, **kwargs):
+        self.models.append(model)
+        response = SimpleNamespace(usage=None)
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+
+def test_falls_back_once_the_queued_backlog_exceeds_the_threshold():
+    async def run():
+        service = OpenAIClientService(
+            model="primary",
+            fallback_model="fallback",
+            tpm_limit=30000,
+            rpm_limit=10000,
+            completion_tokens=1000,
+            fallback_after=2.0
+        )
+        completions = FakeCompletions()
+        service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        # 500 tokens per second, so any single request waits at most about 2s
+        tasks = [
+            asyncio.create_task(service.create([{"role": "user", "content": f"message {n}"}]))
+            for n in range(100)
+        ]
+        await asyncio.sleep(0.2)
+        stats = service.get_stats()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert stats["fallbacks"] > 0
+        assert "fallback" in completions.models
+        assert stats["budgets"]["primary"]["waiting"] > 0
+        assert service._budget("primary").waiting == 0
+
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from app.services.queue_service import RedisStreamQueue
+
+
+def make_queue(server: fakeredis.FakeServer, consumer: str) -> RedisStreamQueue:
+    queue = RedisStreamQueue("redis://localhost", "input", consumer=consumer, block_ms=10, size_ttl=0)
+    queue.redis = fakeredis.aioredis.FakeRedis(server=server)
+    return queue
+
+
+def test_depth_counts_entries_consumed_by_another_process():
+    async def run():
+        server = fakeredis.FakeServer()
+        producer = make_queue(server, "web")
+        consumer = make_queue(server, "worker")
+
+        for n in range(20):
+            await producer.put((1, f"message {n}", "trace"))
+        assert await producer.depth() == 20
+
+        for _ in range(15):
+            await consumer.get()
+            consumer.task_done()
+        assert await producer.depth() == 5
+        assert await consumer.depth() == 5
+
+    asyncio.run(run())
+
+
+def test_qsize_refreshes_in_the_background():
+    async def run():
+        server = fakeredis.FakeServer()
+        producer = make_queue(server, "web")
+        consumer = make_queue(server, "worker")
+
+        for n in range(3):
+            await producer.put((1, f"message {n}", "trace"))
+        for _ in range(3):
+            await consumer.get()
+            consumer.task_done()
+
+        assert producer.qsize() == 3
+        await asyncio.sleep(0.05)
+        assert producer.qsize() == 0
+
+    asyncio.run(run())
+
+
+def test_task_done_without_an_entry_in_this_context_raises():
+    async def run():
+        server = fakeredis.FakeServer()
+        queue = make_queue(server, "worker")
+        await queue.put((1, "message", "trace"))
+        await queue.get()
+
+        async def other_task():
+            queue._current.set(None)
+            queue.task_done()
+
+        with pytest.raises(ValueError):
+            await asyncio.create_task(other_task())
+        queue.task_done()
+
+    asyncio.run(run())
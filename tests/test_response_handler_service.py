@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.ai_service import AIService
+from app.services.response_handler_service import ResponseHandlerService
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.sent = []
+        self.completed = []
+
+        async def completed(chat_id):
+            self.completed.append(chat_id)
+
+        self.admission = SimpleNamespace(completed=completed)
+
+    async def send_response(self, chat_id, response):
+        self.sent.append((chat_id, response))
+
+
+def test_empty_remainder_after_streaming_is_not_sent():
+    async def run():
+        telegram = FakeTelegram()
+        queue = asyncio.Queue()
+        handler = ResponseHandlerService(queue, telegram)
+        stored = []
+
+        async def store_company_data(chat_id, data):
+            stored.append(dict(data))
+            return ["company-1"]
+
+        handler.data_store = SimpleNamespace(store_company_data=store_company_data)
+        remainder = AIService._without_streamed({"companies": [{"name": "Acme"}]}, 1)
+        await queue.put((1, {"companies": [{"name": "Acme"}], "partial": True}, "trace"))
+        await queue.put((1, remainder, "trace"))
+
+        await handler.start()
+        await queue.join()
+        await handler.stop()
+
+        assert telegram.sent == [(1, {"companies": [{"name": "Acme"}], "company_ids": ["company-1"]})]
+        assert stored == [{"companies": [{"name": "Acme"}]}]
+        assert telegram.completed == [1]
+
+    asyncio.run(run())
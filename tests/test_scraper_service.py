@@ -0,0 +1,173 @@
+import asyncio
+import socket
+
+import httpcore
+import httpx
+import pytest
+
+from app.services.scraper_service import BlockedURLError, PublicAddressTransport, ScraperService, is_public_address
+
+
+def make_scraper(handler) -> ScraperService:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return ScraperService(None, None, client=client, host_delay=0)
+
+
+def test_is_public_address():
+    assert is_public_address("93.184.216.34")
+    for address in ("127.0.0.1", "10.0.0.5", "172.18.0.2", "192.168.1.1", "169.254.169.254",
+                    "100.64.0.1", "0.0.0.0", "224.0.0.1", "::1", "fe80::1", "fd00::1", "::ffff:127.0.0.1"):
+        assert not is_public_address(address), address
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:6379/",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://localhost:8000/metrics",
+    "http://[::1]/",
+    "ftp://93.184.216.34/file",
+])
+def test_fetch_refuses_non_public_urls(url):
+    requested = []
+    scraper = make_scraper(lambda request: requested.append(request) or httpx.Response(200))
+    with pytest.raises(BlockedURLError):
+        asyncio.run(scraper.fetch(url))
+    assert not requested
+
+
+def test_fetch_checks_every_redirect_hop():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/start":
+            return httpx.Response(302, headers={"location": "http://93.184.216.34/next"})
+        if request.url.path == "/next":
+            return httpx.Response(301, headers={"location": "http://127.0.0.1:6379/"})
+        raise AssertionError(f"Fetched {request.url}")
+
+    scraper = make_scraper(handler)
+    with pytest.raises(BlockedURLError):
+        asyncio.run(scraper.fetch("http://93.184.216.34/start"))
+
+
+def test_fetch_follows_redirects_to_public_hosts():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/start":
+            return httpx.Response(302, headers={"location": "/page"})
+        return httpx.Response(200, text="<html><title>Page</title></html>", headers={"content-type": "text/html"})
+
+    page = asyncio.run(make_scraper(handler).fetch("http://93.184.216.34/start"))
+    assert page["url"] == "http://93.184.216.34/page"
+    assert page["status_code"] == 200
+    assert "Page" in page["body"]
+
+
+def test_fetch_stops_after_max_redirects():
+    scraper = make_scraper(lambda request: httpx.Response(302, headers={"location": "/again"}))
+    scraper.max_redirects = 3
+    with pytest.raises(httpx.TooManyRedirects):
+        asyncio.run(scraper.fetch("http://93.184.216.34/start"))
+
+
+
+class RecordingBackend(httpcore.AsyncMockBackend):
+    """Mock network that answers 200 and records the hosts connected to"""
+
+    def __init__(self):
+        super().__init__([b"HTTP/1.1 200 OK\r\n", b"Content-Type: text/plain\r\n", b"Content-Length: 2\r\n\r\n", b"ok"])
+        self.connected = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.connected.append(host)
+        return await super().connect_tcp(host, port, timeout, local_address, socket_options)
+
+
+def resolving(monkeypatch, *answers):
+    """Make getaddrinfo return each answer in turn, the last one from then on"""
+    answers = list(answers)
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        address = answers.pop(0) if len(answers) > 1 else answers[0]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+
+
+def test_connections_are_pinned_to_the_vetted_address(monkeypatch):
+    resolving(monkeypatch, "93.184.216.34")
+    backend = RecordingBackend()
+    client = httpx.AsyncClient(transport=PublicAddressTransport(backend=backend))
+    scraper = ScraperService(None, None, client=client, host_delay=0)
+
+    page = asyncio.run(scraper.fetch("http://example.test/page"))
+    assert page["body"] == "ok"
+    assert page["url"] == "http://example.test/page"
+    assert backend.connected == ["93.184.216.34"]
+
+
+def test_rebinding_after_the_check_is_refused_at_connect(monkeypatch):
+    # Public when the URL is checked, loopback by the time the connection opens
+    resolving(monkeypatch, "93.184.216.34", "127.0.0.1")
+    backend = RecordingBackend()
+    client = httpx.AsyncClient(transport=PublicAddressTransport(backend=backend))
+    scraper = ScraperService(None, None, client=client, host_delay=0)
+
+    with pytest.raises(BlockedURLError):
+        asyncio.run(scraper.fetch("http://rebind.test/"))
+    assert backend.connected == []
+
+class FakeLinkQueue:
+    lease_seconds = 0.03
+
+    def __init__(self, fail_first: bool = False):
+        self.renewed = []
+        self.completed = []
+        self.requeued = []
+        self.fail_first = fail_first
+
+    async def renew(self, link_ids):
+        if self.fail_first:
+            self.fail_first = False
+            raise ConnectionError("Redis is down")
+        self.renewed.append(sorted(link_ids))
+        return list(link_ids)
+
+    async def complete(self, link_ids):
+        self.completed.extend(link_ids)
+
+    async def requeue(self, link_ids):
+        self.requeued.extend(link_ids)
+
+
+def run_batch(link_queue: FakeLinkQueue, delays):
+    scraper = ScraperService(None, link_queue, client=httpx.AsyncClient())
+
+    async def fetch_link(link_id):
+        delay = delays[link_id]
+        if isinstance(delay, Exception):
+            raise delay
+        await asyncio.sleep(delay)
+        return True
+
+    scraper.fetch_link = fetch_link
+    return asyncio.run(scraper.process_batch(list(delays)))
+
+
+def test_heartbeat_stops_renewing_completed_links(caplog):
+    link_queue = FakeLinkQueue()
+    assert run_batch(link_queue, {"fast": 0.0, "slow": 0.1}) == [True, True]
+    assert link_queue.renewed and all(ids == ["slow"] for ids in link_queue.renewed)
+    assert "Lost leases" not in caplog.text
+
+
+def test_heartbeat_survives_a_failed_renewal():
+    link_queue = FakeLinkQueue(fail_first=True)
+    run_batch(link_queue, {"slow": 0.1})
+    assert link_queue.renewed
+
+
+def test_links_that_fail_unexpectedly_are_requeued_while_the_rest_keep_their_leases():
+    link_queue = FakeLinkQueue()
+    results = run_batch(link_queue, {"broken": ConnectionError("Redis is down"), "slow": 0.1})
+    assert results == [False, True]
+    assert link_queue.requeued == ["broken"]
+    assert link_queue.completed == ["slow"]
+    assert link_queue.renewed and all(ids == ["slow"] for ids in link_queue.renewed)
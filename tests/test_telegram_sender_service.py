@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+from telegram.error import RetryAfter, TimedOut
+
+from app.services.telegram_sender_service import TelegramSenderService
+
+
+def timed_out(cause: Exception) -> TimedOut:
+    try:
+        raise TimedOut from cause
+    except TimedOut as e:
+        return e
+
+
+def make_sender(errors):
+    sent = []
+
+    async def send(chat_id: int, text: str):
+        if errors:
+            raise errors.pop(0)
+        sent.append((chat_id, text))
+
+    sender = TelegramSenderService(send, global_rate=100, chat_rate=100, max_retries=3)
+    return sender, sent
+
+
+def test_flood_control_pauses_every_chat():
+    async def run():
+        sender, sent = make_sender([RetryAfter(1)])
+        sender.enqueue(1, "hello")
+        await asyncio.sleep(0.05)
+        assert sender.global_bucket.delay() > 0.5
+        sender.global_bucket.paused_until = 0
+        for bucket in sender._chat_buckets.values():
+            bucket.paused_until = 0
+        await sender.flush()
+        assert sent == [(1, "hello")]
+
+    asyncio.run(run())
+
+
+def test_read_timeout_is_not_retried():
+    async def run():
+        sender, sent = make_sender([timed_out(httpx.ReadTimeout("read"))])
+        sender.enqueue(1, "hello")
+        await sender.flush()
+        assert sent == []
+        assert sender.stats["uncertain"] == 1
+        assert sender.stats["retries"] == 0
+
+    asyncio.run(run())
+
+
+def test_timeout_before_sending_is_retried():
+    async def run():
+        sender, sent = make_sender([timed_out(httpx.PoolTimeout("pool"))])
+        sender.enqueue(1, "hello")
+        await sender.flush()
+        assert sent == [(1, "hello")]
+        assert sender.stats["retries"] == 1
+
+    asyncio.run(run())
+
+
+def test_stopping_keeps_chunks_that_were_not_sent():
+    async def run():
+        sender, sent = make_sender([RetryAfter(30)])
+        sender.enqueue(1, "first")
+        await asyncio.sleep(0.05)
+        sender.enqueue(2, "second")
+        await asyncio.sleep(0.05)
+        await sender.stop()
+        assert sent == []
+        assert sorted(sender.take_pending()) == [(1, "first"), (2, "second")]
+
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from telegram.error import BadRequest
+
+from app.services.telegram_sender_service import TelegramSenderService
+from app.services.telegram_service import ChatOrderedUpdateProcessor, TelegramService
+
+
+def test_updates_from_one_chat_are_processed_in_order():
+    async def run():
+        processor = ChatOrderedUpdateProcessor(8)
+        received = []
+        active = set()
+        overlap = []
+
+        async def handle(chat_id: int, n: int):
+            overlap.append(len(active))
+            active.add(chat_id)
+            await asyncio.sleep(random.uniform(0, 0.01))
+            received.append((chat_id, n))
+            active.discard(chat_id)
+
+        updates = [(chat_id, n) for n in range(10) for chat_id in (1, 2, 3)]
+        await asyncio.gather(*(
+            processor.process_update(SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id)), handle(chat_id, n))
+            for chat_id, n in updates
+        ))
+
+        for chat_id in (1, 2, 3):
+            assert [n for chat, n in received if chat == chat_id] == list(range(10))
+        assert max(overlap) > 0  # Different chats still run concurrently
+        assert not processor._chat_locks
+
+    asyncio.run(run())
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.text_markdown_v2 = text
+        self.forward_origin = None
+        self.replies = []
+
+    async def reply_text(self, text: str):
+        self.replies.append(text)
+
+
+def test_failed_acknowledgement_keeps_the_queued_message():
+    async def run():
+        queue = asyncio.Queue()
+        service = TelegramService("token", queue, asyncio.Queue())
+        attempts = []
+
+        async def send(chat_id: int, text: str):
+            attempts.append(text)
+            raise BadRequest("Chat not found")
+
+        service.sender = TelegramSenderService(send)
+        message = FakeMessage("hello")
+        update = SimpleNamespace(effective_chat=SimpleNamespace(id=1), message=message)
+
+        await service.handle_message(update, None)
+        await service.sender.flush()
+
+        assert queue.qsize() == 1
+        assert service.admission.outstanding == 1
+        assert message.replies == []
+        assert len(attempts) == 1 and "error" not in attempts[0]
+
+    asyncio.run(run())
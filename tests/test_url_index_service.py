@@ -0,0 +1,43 @@
+import asyncio
+
+import fakeredis
+
+from app.services import url_index_service
+from app.services.url_index_service import UrlIndexService
+
+TTL = 100
+
+
+def make_index(redis) -> UrlIndexService:
+    return UrlIndexService(redis, TTL, bloom_enabled=True, bloom_bits=1 << 16, bloom_hashes=4)
+
+
+def test_bloom_generations_cover_live_entries_and_expire(monkeypatch):
+    async def run():
+        redis = fakeredis.aioredis.FakeRedis()
+        index = make_index(redis)
+        clock = [1000.0]
+        monkeypatch.setattr(url_index_service.time, "time", lambda: clock[0])
+
+        pipe = redis.pipeline()
+        index.queue_add(pipe, "https://example.com/a", "link-1")
+        await pipe.execute()
+        assert await index.lookup(["https://example.com/a", "https://example.com/b"]) == {"https://example.com/a": "link-1"}
+
+        # Still found from the previous generation while the index entry lives
+        clock[0] = 1099.0
+        assert await index.lookup(["https://example.com/a"]) == {"https://example.com/a": "link-1"}
+
+        # A touch extends the entry and copies its bits into the current generation
+        pipe = redis.pipeline()
+        index.queue_touch(pipe, "https://example.com/a")
+        await pipe.execute()
+        clock[0] = 1150.0
+        assert await index.lookup(["https://example.com/a"]) == {"https://example.com/a": "link-1"}
+
+        # Bitmaps expire two generations after they start
+        ttl = await redis.ttl("urls:bloom:10")
+        assert 0 < ttl <= 2 * TTL
+        assert await redis.exists("urls:bloom") == 0
+
+    asyncio.run(run())
@@ -0,0 +1,18 @@
+from app.core.urls import normalize_url, url_domain
+
+
+def test_tracking_params_are_dropped():
+    assert normalize_url("https://www.example.com/page/?utm_source=x&fbclid=1&id=3") == "https://example.com/page?id=3"
+
+
+def test_ref_and_si_are_only_dropped_where_they_track():
+    assert normalize_url("https://github.com/org/repo/tree?ref=v1.2") == "https://github.com/org/repo/tree?ref=v1.2"
+    assert normalize_url("https://example.com/?si=2") == "https://example.com?si=2"
+    assert normalize_url("https://youtu.be/abc?si=XYZ") == "https://youtube.com/watch?v=abc"
+    assert normalize_url("https://www.producthunt.com/posts/foo?ref=header_nav") == "https://producthunt.com/posts/foo"
+
+
+def test_unparseable_urls_are_kept_as_written():
+    assert normalize_url(" https://bad.com:abc/page ") == "https://bad.com:abc/page"
+    assert normalize_url("http://[abc/") == "http://[abc/"
+    assert url_domain("http://[abc/") == ""